@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Multi-threaded benchmark of Endpoint.get(), compares the lock based backend selection
+used before the copy-on-write snapshots with the current Endpoint, and reports the
+total number of get() calls per second for each thread count.
+
+    python benchmarks/bench_endpoint.py [--backends 20] [--seconds 1] [--threads 1,2,4,8,16]
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from eas_prediction.endpoint import Endpoint  # noqa: E402
+from eas_prediction.weighted_round_robin import WRRScheduler  # noqa: E402
+
+
+class LockedEndpoint(object):
+    """
+    The previous implementation, every get() takes a lock shared by all the endpoints
+    """
+    w_lock = threading.Lock()
+
+    def __init__(self, endpoints):
+        self.scheduler = WRRScheduler(endpoints)
+
+    def get(self):
+        self.w_lock.acquire()
+        try:
+            ep = self.scheduler.get_next()[0]
+        finally:
+            self.w_lock.release()
+        return ep['ip'] + ':' + str(ep['port'])
+
+
+def measure(endpoint, thread_count, seconds):
+    counts = [0] * thread_count
+    start_event = threading.Event()
+    deadline = [0.0]
+
+    def run(idx):
+        get = endpoint.get
+        start_event.wait()
+        count = 0
+        while time.perf_counter() < deadline[0]:
+            for _ in range(500):
+                get()
+            count += 500
+        counts[idx] = count
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(thread_count)]
+    for t in threads:
+        t.start()
+    start = time.perf_counter()
+    deadline[0] = start + seconds
+    start_event.set()
+    for t in threads:
+        t.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backends', type=int, default=20)
+    parser.add_argument('--seconds', type=float, default=1.0)
+    parser.add_argument('--threads', default='1,2,4,8,16')
+    args = parser.parse_args()
+
+    rnd = random.Random(0)
+    endpoints = [({'ip': '10.0.0.%d' % i, 'port': 8080}, rnd.choice([100, 100, 50, 10]))
+                 for i in range(args.backends)]
+    snapshot_endpoint = Endpoint(logging.getLogger(__name__))
+    snapshot_endpoint.set_endpoints(endpoints)
+    locked_endpoint = LockedEndpoint(endpoints)
+
+    print('%8s %16s %16s' % ('threads', 'locked get/s', 'snapshot get/s'))
+    for thread_count in [int(x) for x in args.threads.split(',')]:
+        before = measure(locked_endpoint, thread_count, args.seconds)
+        after = measure(snapshot_endpoint, thread_count, args.seconds)
+        print('%8d %16.0f %16.0f' % (thread_count, before, after))
+
+
+if __name__ == '__main__':
+    main()
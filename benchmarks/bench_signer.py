@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark of the request signing, compares the per-request signing used before
+RequestSigner was introduced with RequestSigner, and reports requests per second on
+one core for each of them.
+
+    python benchmarks/bench_signer.py [--body-size 1024] [--seconds 2]
+"""
+
+import argparse
+import base64
+import datetime
+import hashlib
+import hmac
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from eas_prediction.signer import RequestSigner  # noqa: E402
+
+TOKEN = 'YWFlMDYyZDNmNTc3M2I3MzMwYmY0MmYwM2Y2MTYxMTY4NzBkNzdjOQ=='
+SERVICE_NAME = 'scorecard_pmml_example'
+CONTENT_TYPE = 'application/octet-stream'
+
+
+def legacy_sign(request_data):
+    utcnow = datetime.datetime.now()
+    current_time = utcnow.strftime('%a, %d %b %Y %H:%M:%S GMT')
+    canonicalized_resource = '/api/predict/%s' % SERVICE_NAME
+    content_md5 = hashlib.md5(request_data).hexdigest()
+    auth = '%s\n%s\n%s\n%s\n%s' % ('POST', content_md5, CONTENT_TYPE, current_time, canonicalized_resource)
+    hmac1 = hmac.new(bytearray(TOKEN, 'utf-8'), bytearray(auth.strip(), 'utf-8'), hashlib.sha1)
+    signature = base64.b64encode(hmac1.digest()).decode()
+    return {
+        'Content-MD5': content_md5,
+        'Date': current_time,
+        'Content-Type': CONTENT_TYPE,
+        'Content-Length': '%d' % len(request_data),
+        'Authorization': 'EAS %s' % signature.strip()
+    }
+
+
+def measure(func, body, seconds):
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while True:
+        for _ in range(1000):
+            func(body)
+        count += 1000
+        now = time.perf_counter()
+        if now >= deadline:
+            return count / (now - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--body-size', type=int, default=1024)
+    parser.add_argument('--seconds', type=float, default=2.0)
+    args = parser.parse_args()
+
+    body = os.urandom(args.body_size)
+    signer = RequestSigner(TOKEN, SERVICE_NAME, CONTENT_TYPE)
+
+    before = measure(legacy_sign, body, args.seconds)
+    after = measure(signer.sign, body, args.seconds)
+    print('body size: %d bytes' % args.body_size)
+    print('legacy generate_singaure: %12.0f req/s/core' % before)
+    print('RequestSigner.sign:       %12.0f req/s/core' % after)
+    print('speedup:                  %12.2fx' % (after / before))
+
+
+if __name__ == '__main__':
+    main()
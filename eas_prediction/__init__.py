@@ -3,17 +3,34 @@
 
 from .exception import PredictException
 from .predict_client import PredictClient
+from .async_client import AsyncPredictClient
 from .tf_request import TFRequest
 from .tf_request import TFResponse
+from .tf_request_batcher import TFRequestBatcher
 from .torch_request import TorchRequest
 from .torch_request import TorchResponse
 from .blade_request import BladeRequest
 from .blade_request import BladeResponse 
 from .string_request import StringRequest
 from .string_request import StringResponse
+from .raw_request import RawBytesRequest
+from .raw_request import RawBytesResponse
 from .predict_client import ENDPOINT_TYPE_DIRECT
 from .predict_client import ENDPOINT_TYPE_VIPSERVER
 from .predict_client import ENDPOINT_TYPE_DEFAULT
+from .balancer import Balancer
+from .balancer import RoundRobinBalancer
+from .balancer import P2CBalancer
+from .balancer import PeakEWMABalancer
+from .outlier_detection import OutlierDetector
+from .hash_ring import ConsistentHashRing
+from .health_check import HealthChecker
+from .connection_pool import ManagedPoolManager
+from .slow_start import SlowStart
+from .slow_start import SLOW_START_LINEAR
+from .slow_start import SLOW_START_EXPONENTIAL
+from .discovery import DiscoveryRegistry
+from .endpoint_cache import EndpointCache
 from .onnx_request import OnnxData
 from .onnx_request import OnnxRequest
 from .onnx_request import OnnxResponse
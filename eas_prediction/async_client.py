@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import collections
+import ssl
+import time
+from urllib.parse import urlsplit
+
+from .exception import PredictException
+from .base_client import BaseClient
+from .gateway_endpoint import GatewayEndpoint
+
+
+class AsyncHTTPError(Exception):
+    """
+    Raised when the server response can not be read as a valid http/1.1 response
+    """
+    pass
+
+
+class AsyncResponse(object):
+    """
+    Http response returned by AsyncConnectionPool, mirrors the fields of the
+    urllib3 response used by the client
+    """
+    def __init__(self, status, headers, data):
+        self.status = status
+        self.headers = headers
+        self.data = data
+
+
+class AsyncConnectionPool(object):
+    """
+    Keep-alive connection pool built on asyncio streams, connections are kept per
+    (scheme, host, port) and at most 'maxsize' requests are in flight for each host,
+    requests beyond the limit wait for a connection to be released.
+    """
+
+    def __init__(self, maxsize=100):
+        self.maxsize = maxsize
+        self.idle = collections.defaultdict(collections.deque)
+        self.semaphores = {}
+        self.ssl_context = None
+
+    def _semaphore(self, key):
+        semaphore = self.semaphores.get(key)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.maxsize)
+            self.semaphores[key] = semaphore
+        return semaphore
+
+    async def _connect(self, scheme, host, port):
+        context = None
+        if scheme == 'https':
+            if self.ssl_context is None:
+                self.ssl_context = ssl.create_default_context()
+            context = self.ssl_context
+        return await asyncio.open_connection(host, port, ssl=context)
+
+    def _pop_idle(self, key):
+        connections = self.idle[key]
+        while connections:
+            reader, writer = connections.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        return None
+
+    @staticmethod
+    async def _read_body(reader, headers):
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size_line = await reader.readline()
+                try:
+                    size = int(size_line.split(b';')[0].strip(), 16)
+                except ValueError:
+                    raise AsyncHTTPError('Bad chunk size: %r' % size_line)
+                if size == 0:
+                    # skip the trailers until the final empty line
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    return b''.join(chunks), True
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+        if 'content-length' in headers:
+            length = headers['content-length']
+            if not length.isdigit():
+                raise AsyncHTTPError('Bad content length: %r' % length)
+            return await reader.readexactly(int(length)), True
+        return await reader.read(), False
+
+    async def _exchange(self, reader, writer, head, body):
+        writer.write(head)
+        if body:
+            writer.write(body)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise asyncio.IncompleteReadError(b'', None)
+        parts = status_line.decode('latin-1').split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/') or not parts[1].isdigit():
+            raise AsyncHTTPError('Bad status line: %r' % status_line)
+        status = int(parts[1])
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        data, reusable = await self._read_body(reader, headers)
+        if parts[0] == 'HTTP/1.0' or headers.get('connection', '').lower() == 'close':
+            reusable = False
+        return AsyncResponse(status, headers, data), reusable
+
+    @staticmethod
+    def _parse_url(url):
+        if '://' not in url:
+            url = 'http://' + url
+        parsed = urlsplit(url)
+        scheme = parsed.scheme
+        port = parsed.port or (443 if scheme == 'https' else 80)
+        return (scheme, parsed.hostname, port), parsed
+
+    async def open(self, url, count):
+        """
+        Open the keep-alive connections to the host of the url in advance
+        :param url: url of the host
+        :param count: count of the connections, limited by 'maxsize'
+        """
+        key, parsed = self._parse_url(url)
+        count = min(count, self.maxsize) - len(self.idle[key])
+        if count <= 0:
+            return
+        connections = await asyncio.gather(*[self._connect(*key) for i in range(count)])
+        self.idle[key].extend(connections)
+
+    async def request(self, method, url, headers=None, body=None, timeout=None):
+        """
+        Perform a single http request through a pooled keep-alive connection
+        :param method: http method
+        :param url: request url, 'http://' is assumed when the scheme is missing
+        :param headers: request headers
+        :param body: request body in bytes like format
+        :param timeout: timeout in seconds of the whole request
+        :return: AsyncResponse object
+        """
+        key, parsed = self._parse_url(url)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+
+        lines = ['%s %s HTTP/1.1' % (method, path), 'Host: %s' % parsed.netloc]
+        has_length = False
+        for name, value in (headers or {}).items():
+            if name.lower() == 'content-length':
+                has_length = True
+            lines.append('%s: %s' % (name, value))
+        if not has_length:
+            lines.append('Content-Length: %d' % (len(body) if body else 0))
+        head = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+        async with self._semaphore(key):
+            return await asyncio.wait_for(self._request(key, head, body), timeout)
+
+    async def _request(self, key, head, body):
+        connection = self._pop_idle(key)
+        reused = connection is not None
+        if connection is None:
+            connection = await self._connect(*key)
+
+        while True:
+            reader, writer = connection
+            try:
+                resp, reusable = await self._exchange(reader, writer, head, body)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                writer.close()
+                # the server may close an idle keep-alive connection at any time,
+                # retry on a fresh connection once before reporting the error
+                if not reused:
+                    raise
+                reused = False
+                connection = await self._connect(*key)
+                continue
+            except BaseException:
+                writer.close()
+                raise
+
+            if reusable:
+                self.idle[key].append(connection)
+            else:
+                writer.close()
+            return resp
+
+    async def close(self):
+        """
+        Close all the idle connections in the pool
+        """
+        for connections in self.idle.values():
+            while connections:
+                reader, writer = connections.pop()
+                writer.close()
+        self.idle.clear()
+
+
+class AsyncPredictClient(BaseClient):
+    """
+    Asyncio version of PredictClient, the endpoint, authentication and request
+    serialization are shared with PredictClient through BaseClient, but the requests
+    are sent through an asyncio connection pool, so that one event loop is able to keep
+    a large number of predictions in flight without occupying a thread for each of them,
+    use asyncio.gather() to send requests concurrently.
+    """
+
+    def __init__(self, endpoint='', service_name='', custom_url=''):
+        super(AsyncPredictClient, self).__init__(endpoint, service_name, custom_url)
+        self.async_pool = None
+
+    def init(self, wait_ready=False, ready_timeout=5):
+        """
+        Initialize the client after the functions used to set the client properties are called
+        :param wait_ready: block until the first successful sync of the service endpoints
+        :param ready_timeout: max time in seconds to wait for the service endpoints, also used by
+                              the requests waiting for the service endpoints in the event loop
+        """
+        self._init_endpoint(wait_ready, ready_timeout)
+        if self.async_pool is None:
+            self.async_pool = AsyncConnectionPool(maxsize=self.max_connection_count)
+
+    async def _wait_ready(self):
+        # Endpoint.get() blocks until the backends are known, wait for them in
+        # the default executor so that the event loop keeps running meanwhile
+        if self.endpoint.ready.is_set():
+            return
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(None, self.endpoint.wait_ready, self.ready_timeout):
+            raise PredictException(500, 'Get service backend timeout')
+
+    async def warm_up(self, warm_connections, warmup_request=None):
+        """
+        Open the connections to every backend, or to the gateway, in advance, and optionally send
+        the warm-up request through them, the same as the warm-up of PredictClient.init()
+        :param warm_connections: count of the connections opened to every backend
+        :param warmup_request: optional request sent through the warm connections, the responses are ignored
+        """
+        await self._wait_ready()
+        if isinstance(self.endpoint, GatewayEndpoint):
+            addresses = [self.endpoint.get()]
+        else:
+            addresses = [address for address, weight in self.endpoint.snapshot.weights]
+        urls = [self._predict_url(address) for address in addresses]
+        results = await asyncio.gather(*[self.async_pool.open(url, warm_connections) for url in urls],
+                                       return_exceptions=True)
+        for address, result in zip(addresses, results):
+            if isinstance(result, Exception):
+                self.logger.error('Failed to open connection to %s: %s' % (address, str(result)))
+        if warmup_request is None:
+            return
+
+        req_body = self._request_body(warmup_request)
+        headers = self._request_headers(req_body)()
+        count = max(min(warm_connections, self.max_connection_count), 1)
+        requests = [self.async_pool.request('POST', url, headers=headers, body=req_body,
+                                            timeout=self.timeout / 1000.0)
+                    for url in urls for i in range(count)]
+        for result in await asyncio.gather(*requests, return_exceptions=True):
+            if isinstance(result, Exception):
+                self.logger.error('Warm-up request failed: %s' % str(result))
+
+    async def close(self):
+        """
+        Stop the endpoint sync thread and close the pooled connections
+        """
+        self.destroy()
+        if self.async_pool is not None:
+            await self.async_pool.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def predict(self, req, route_key=None):
+        """
+        Perform the prediction request to the server asynchronously, the request is
+        serialized with 'to_string()' and the response is parsed with 'parse_response()'
+        of the given request object, the same as PredictClient.predict()
+        :param req: abstract class of the request
+        :param route_key: optional key routing the requests to the same backend, the same as PredictClient.predict()
+        :return: service response correlated with the input request
+        """
+        req_body = self._request_body(req)
+        request_headers = self._request_headers(req_body)
+        failed = set()
+        await self._wait_ready()
+        for i in range(0, self.retry_count):
+            try:
+                domain = self.endpoint.get(failed, route_key)
+                url = self._predict_url(domain)
+                self.logger.debug('Request to url: %s' % url)
+                self.endpoint.report_start(domain)
+                start = time.time()
+                success = False
+                try:
+                    resp = await self.async_pool.request('POST', url,
+                                                         headers=request_headers(),
+                                                         body=req_body,
+                                                         timeout=self.timeout / 1000.0)
+                    success = resp.status // 100 != 5
+                finally:
+                    self.endpoint.report_finish(domain, time.time() - start, success)
+                if resp.status // 100 == 5:
+                    failed.add(domain)
+                    if i != self.retry_count - 1:
+                        continue
+                    raise PredictException(resp.status, resp.data)
+
+                if resp.status != 200:
+                    raise PredictException(resp.status, resp.data)
+
+                return req.parse_response(resp.data)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, AsyncHTTPError) as e:
+                self.logger.debug('Request failed, err: %s, retrying', str(e))
+                failed.add(domain)
+                if i != self.retry_count - 1:
+                    continue
+                raise PredictException(500, 'url: %s, error: %s' % (url, str(e)))
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import bisect
+import itertools
+import math
+import random
+import time
+from threading import Lock
+
+
+class Balancer(object):
+    """
+    Policy used by Endpoint to select the backend of each request, the balancer receives
+    the immutable EndpointSnapshot whenever the backends change, and is notified when a
+    request to a backend starts and finishes so that it can track the backend load.
+    """
+
+    def __init__(self):
+        self.snapshot = None
+
+    def update(self, snapshot):
+        """
+        Called with the new snapshot whenever the backends of the endpoint change
+        :param snapshot: EndpointSnapshot object
+        """
+        self.snapshot = snapshot
+
+    def pick(self, exclude=None):
+        """
+        Select the backend for a request
+        :param exclude: optional set of backend addresses which should not be selected
+        :return: backend address in format of 'ip:port', or None if no backend is available
+        """
+        raise NotImplementedError('pick() must be defined')
+
+    def on_start(self, address):
+        """
+        Called when a request is sent to the backend
+        :param address: backend address returned by pick()
+        """
+        pass
+
+    def on_finish(self, address, latency, success):
+        """
+        Called when a request to the backend finishes
+        :param address: backend address returned by pick()
+        :param latency: request latency in seconds
+        :param success: False if the request failed with a connection error or a 5xx response
+        """
+        pass
+
+
+class RoundRobinBalancer(Balancer):
+    """
+    Smooth weighted round robin over the precomputed schedule of the snapshot, the default
+    balancer of an Endpoint
+    """
+
+    def __init__(self):
+        super(RoundRobinBalancer, self).__init__()
+        self.counter = itertools.count()
+
+    def pick(self, exclude=None):
+        schedule = self.snapshot.schedule
+        length = len(schedule)
+        if length == 0:
+            return None
+        # next() of itertools.count is atomic, so concurrent callers walk the
+        # schedule in turn without any lock
+        if not exclude:
+            return schedule[next(self.counter) % length]
+        for _ in range(length):
+            address = schedule[next(self.counter) % length]
+            if address not in exclude:
+                return address
+        return None
+
+
+class WeightedRandomBalancer(Balancer):
+    """
+    Base class of the balancers choosing candidates by weighted random sampling
+    """
+
+    def __init__(self):
+        super(WeightedRandomBalancer, self).__init__()
+        self.random = random.Random()
+        # addresses, cumulative weights, total weight and weights by address, swapped as a whole
+        # so that a concurrent pick never sees the parts of different snapshots
+        self.candidates = ((), (), 0, {})
+
+    def update(self, snapshot):
+        addresses = []
+        cumulative = []
+        total = 0
+        for address, weight in snapshot.weights:
+            total += weight
+            addresses.append(address)
+            cumulative.append(total)
+        self.candidates = (tuple(addresses), tuple(cumulative), total, dict(snapshot.weights))
+        super(WeightedRandomBalancer, self).update(snapshot)
+
+    def _choose(self, exclude=None):
+        addresses, cumulative, total, weights = self.candidates
+        if total == 0:
+            return None
+        for _ in range(3):
+            address = addresses[bisect.bisect_right(cumulative, self.random.random() * total)]
+            if not exclude or address not in exclude:
+                return address
+        # most of the backends are excluded, sample among the remaining ones
+        remaining = [address for address in addresses if address not in exclude]
+        if len(remaining) == 0:
+            return None
+        point = self.random.random() * sum(weights[address] for address in remaining)
+        for address in remaining:
+            point -= weights[address]
+            if point < 0:
+                return address
+        return remaining[-1]
+
+    def _choose_two(self, exclude=None):
+        first = self._choose(exclude)
+        if first is None or len(self.candidates[0]) == 1:
+            return first, first
+        second = self._choose(exclude.union([first]) if exclude else (first,))
+        if second is None:
+            return first, first
+        return first, second
+
+
+class P2CBalancer(WeightedRandomBalancer):
+    """
+    Power of two choices balancer, two candidates are sampled by weight and the one
+    with fewer outstanding requests is selected, so that a slow backend accumulating
+    queued requests receives less traffic.
+    """
+
+    def __init__(self):
+        super(P2CBalancer, self).__init__()
+        self.lock = Lock()
+        self.outstanding = {}
+
+    def pick(self, exclude=None):
+        first, second = self._choose_two(exclude)
+        if first == second:
+            return first
+        if self.outstanding.get(second, 0) < self.outstanding.get(first, 0):
+            return second
+        return first
+
+    def on_start(self, address):
+        with self.lock:
+            self.outstanding[address] = self.outstanding.get(address, 0) + 1
+
+    def on_finish(self, address, latency, success):
+        with self.lock:
+            count = self.outstanding.get(address, 0) - 1
+            if count > 0:
+                self.outstanding[address] = count
+            else:
+                self.outstanding.pop(address, None)
+
+
+class PeakEWMABalancer(WeightedRandomBalancer):
+    """
+    Latency aware balancer in the style of the peak EWMA balancer of Finagle, every backend
+    keeps an exponentially weighted moving average of its observed latency, which jumps to
+    any higher latency observed immediately and decays with the 'decay_time', and slowly
+    moves toward the mean latency of all backends while the backend receives no traffic.
+    The cost of a backend is the average latency multiplied by its outstanding requests
+    plus one, and the cheaper one of two weighted random candidates is selected.
+    """
+
+    def __init__(self, decay_time=10.0, failure_penalty=1.0):
+        """
+        :param decay_time: time constant in seconds of the moving average
+        :param failure_penalty: min latency in seconds recorded for a failed request, so that
+                                a backend failing fast does not look like a fast backend
+        """
+        super(PeakEWMABalancer, self).__init__()
+        self.decay_time = decay_time
+        self.failure_penalty = failure_penalty
+        self.lock = Lock()
+        self.stats = {}
+        self.mean = (0.0, 0.0)
+
+    def update(self, snapshot):
+        with self.lock:
+            addresses = set(address for address, weight in snapshot.weights)
+            for address in list(self.stats):
+                if address not in addresses:
+                    del self.stats[address]
+        super(PeakEWMABalancer, self).update(snapshot)
+
+    def _decay(self, elapsed):
+        return math.exp(-max(elapsed, 0.0) / self.decay_time)
+
+    def cost(self, address, now=None):
+        """
+        Get the current cost of a backend
+        :param address: backend address
+        :param now: current time in seconds
+        :return: the estimated latency multiplied by outstanding requests plus one
+        """
+        if now is None:
+            now = time.time()
+        mean = self.mean[0]
+        stat = self.stats.get(address)
+        if stat is None:
+            return mean
+        ewma, stamp, outstanding = stat
+        w = self._decay(now - stamp)
+        return (ewma * w + mean * (1 - w)) * (outstanding + 1)
+
+    def pick(self, exclude=None):
+        first, second = self._choose_two(exclude)
+        if first == second:
+            return first
+        now = time.time()
+        if self.cost(second, now) < self.cost(first, now):
+            return second
+        return first
+
+    def on_start(self, address):
+        with self.lock:
+            stat = self.stats.get(address)
+            if stat is None:
+                self.stats[address] = [self.mean[0], time.time(), 1]
+            else:
+                stat[2] += 1
+
+    def on_finish(self, address, latency, success):
+        if not success:
+            latency = max(latency, self.failure_penalty)
+        now = time.time()
+        with self.lock:
+            mean, mean_stamp = self.mean
+            w = self._decay(now - mean_stamp)
+            self.mean = (mean * w + latency * (1 - w), now)
+
+            stat = self.stats.get(address)
+            if stat is None:
+                return
+            ewma, stamp, outstanding = stat
+            if latency > ewma:
+                ewma = latency
+            else:
+                w = self._decay(now - stamp)
+                ewma = ewma * w + latency * (1 - w)
+            stat[0] = ewma
+            stat[1] = now
+            stat[2] = max(outstanding - 1, 0)
@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import logging
+import hashlib
+from types import MappingProxyType
+from .exception import PredictException
+from .signer import RequestSigner
+from .vipserver_endpoint import VipServerEndpoint
+from .vipserver_endpoint import VIPSERVER_SERVERLIST_URL
+from .cacheserver_endpoint import CacheServerEndpoint
+from .gateway_endpoint import GatewayEndpoint
+from .discovery import DiscoveryRegistry
+from .endpoint_cache import EndpointCache
+
+ENDPOINT_TYPE_DIRECT = 'DIRECT'
+ENDPOINT_TYPE_VIPSERVER = 'VIPSERVER'
+ENDPOINT_TYPE_DEFAULT = 'DEFAULT'
+
+
+class BaseClient(object):
+    """
+    Common part of the prediction clients, it owns the service endpoint and its discovery,
+    the authentication and the serialization of the requests, while the way the requests are
+    sent, through a blocking connection pool or an asyncio one, is left to the subclasses.
+    """
+
+    def __init__(self, endpoint='', service_name='', custom_url=''):
+        self.retry_count = 5
+        self.max_connection_count = 100
+        self.token = ''
+        self.endpoint = None
+        self.timeout = 5000
+        self.ready_timeout = 5
+        self.endpoint_type = ''
+        self.endpoint_name = endpoint
+        self.custom_url = custom_url
+        self.service_name = service_name
+        self.content_type = ''
+        self.headers = {}
+        self.base_headers = MappingProxyType({})
+        self.stop = False
+        self.signer = None
+        self.balancer = None
+        self.outlier_detector = None
+        self.signer_key = None
+        self.discovery_key = None
+        self.endpoint_cache = None
+        self.vipserver_serverlist_url = VIPSERVER_SERVERLIST_URL
+        self.vipserver_serverlist_ttl = 300
+        self.zone = None
+        self.zone_min_healthy_percent = 50
+        self.hash_ring = None
+        self.slow_start = None
+        self.logger = logging.getLogger(endpoint + '/' + service_name)
+        self.logger.addHandler(logging.StreamHandler(stream=sys.stdout))
+        self.logger.setLevel(logging.ERROR)
+
+    def destroy(self):
+        self.stop = True
+        self._unsubscribe()
+        if self.endpoint is not None:
+            self.endpoint.close()
+
+    def _init_endpoint(self, wait_ready=False, ready_timeout=5):
+        """
+        Create the endpoint of the service and subscribe its backends from the service discovery
+        :param wait_ready: block until the first successful sync of the service endpoints
+        :param ready_timeout: max time in seconds to wait for the service endpoints
+        """
+        self.ready_timeout = ready_timeout
+        self._build_base_headers()
+        self._unsubscribe()
+
+        if self.endpoint_type == '' or self.endpoint_type == ENDPOINT_TYPE_DEFAULT:
+            self.endpoint = GatewayEndpoint(self.endpoint_name, self.service_name, self.logger, self.custom_url)
+        elif self.endpoint_type == ENDPOINT_TYPE_VIPSERVER:
+            self.endpoint = VipServerEndpoint(self.endpoint_name, self.logger,
+                                              self.vipserver_serverlist_url, self.vipserver_serverlist_ttl)
+        elif self.endpoint_type == ENDPOINT_TYPE_DIRECT:
+            self.endpoint = CacheServerEndpoint(self.endpoint_name, self.service_name, self.logger)
+        else:
+            raise PredictException(500, 'Unsupported endpoint type: %s' % self.endpoint_type)
+        if self.balancer is not None:
+            self.endpoint.set_balancer(self.balancer)
+        if self.outlier_detector is not None:
+            self.endpoint.set_outlier_detector(self.outlier_detector)
+        if self.hash_ring is not None:
+            self.endpoint.set_hash_ring(self.hash_ring)
+        if self.slow_start is not None:
+            self.endpoint.set_slow_start(self.slow_start)
+        self._setup_endpoint(self.endpoint)
+        zone = self.zone if self.zone is not None else os.getenv('ZONE')
+        if zone is not None and len(zone) > 0:
+            self.endpoint.set_zone(zone, self.zone_min_healthy_percent)
+
+        # the clients of the same service share one discovery refresher of the process,
+        # the gateway endpoint is static and needs no discovery at all
+        if not isinstance(self.endpoint, GatewayEndpoint):
+            self.discovery_key = (self.endpoint_type, self.endpoint_name, self.service_name)
+            if self.endpoint_cache is not None:
+                self.endpoint.set_cache(self.endpoint_cache, self.discovery_key)
+                if self.endpoint.preload():
+                    self.logger.debug('Endpoint preloaded from cache')
+            DiscoveryRegistry.instance().subscribe(self.discovery_key, self.endpoint)
+            self.logger.debug('Endpoint subscribed to service discovery')
+
+        if wait_ready and not self.endpoint.wait_ready(ready_timeout):
+            raise PredictException(500, 'Wait for service endpoints timeout: %s' % self.endpoint_name)
+
+    def _setup_endpoint(self, endpoint):
+        """
+        Called with the new endpoint before it subscribes the service discovery, to attach the parts
+        of the endpoint which depend on how the client sends the requests
+        """
+        pass
+
+    def _unsubscribe(self):
+        if self.discovery_key is not None:
+            DiscoveryRegistry.instance().unsubscribe(self.discovery_key, self.endpoint)
+            self.discovery_key = None
+
+    def set_endpoint(self, endpoint):
+        """
+        Set the endpoint of the service for the client
+        :param endpoint_name: name of the endpoint, such as http://pai-eas-vpc.cn-shanghai.aliyuncs.com
+        """
+        self.endpoint_name = endpoint
+
+    def set_service_name(self, service_name):
+        """
+        Set the service name for the client
+        :param service_name: name of the service to access
+        """
+        self.service_name = service_name
+
+    def set_endpoint_type(self, endpoint_type):
+        """
+        Set the endpoint type, support GATEWAY, DIRECT, VIPSERVER, default is GATEWAY
+        :param endpoint_type: type of the endpoint
+        """
+        self.endpoint_type = endpoint_type
+
+    def set_vipserver_serverlist(self, url, ttl=300):
+        """
+        Set where the VIPSERVER endpoint gets the list of the vipserver servers
+        :param url: url of the server list, whose body contains the server addresses in format of 'ip' or 'ip:port'
+        :param ttl: time in seconds the server list is cached
+        """
+        self.vipserver_serverlist_url = url
+        self.vipserver_serverlist_ttl = ttl
+
+    def set_balancer(self, balancer):
+        """
+        Set the policy used to select the backend of each request for DIRECT and VIPSERVER endpoints,
+        such as P2CBalancer, default is the weighted round robin
+        :param balancer: Balancer object
+        """
+        self.balancer = balancer
+
+    def set_hash_ring(self, hash_ring):
+        """
+        Set the consistent hash ring used by predict() with a route key for DIRECT and VIPSERVER endpoints
+        :param hash_ring: ConsistentHashRing object, default is ConsistentHashRing(vnodes=160, load_factor=1.25)
+        """
+        self.hash_ring = hash_ring
+
+    def set_slow_start(self, slow_start):
+        """
+        Ramp up the weights of the backends added to DIRECT and VIPSERVER endpoints, such as the new pods
+        of a rolling update, so that they are not flooded while warming up
+        :param slow_start: SlowStart object
+        """
+        self.slow_start = slow_start
+
+    def set_zone(self, zone, min_healthy_percent=50):
+        """
+        Prefer the backends in the same zone as the client for DIRECT and VIPSERVER endpoints, the zone is
+        taken from the environment variable 'ZONE' if not set, and the backends without zone are treated as
+        in other zones, a zone with less than its fair share of the healthy weight keeps the requests in
+        proportion to its share, and the rest spill over to the other zones
+        :param zone: zone of the client
+        :param min_healthy_percent: the requests are spread over all the zones when the weight of the healthy
+                                    backends in the zone drops below this percent of all the backends in the zone
+        """
+        self.zone = zone
+        self.zone_min_healthy_percent = min_healthy_percent
+
+    def set_outlier_detector(self, outlier_detector):
+        """
+        Enable the outlier detection for DIRECT and VIPSERVER endpoints, the backends failing
+        consecutively or with a high error rate are ejected temporarily
+        :param outlier_detector: OutlierDetector object
+        """
+        self.outlier_detector = outlier_detector
+
+    def set_endpoint_cache(self, cache_dir, max_age=86400):
+        """
+        Persist the last known backends of DIRECT and VIPSERVER endpoints on disk, so that the client
+        is able to send requests right after init() by the cached backends, until they are replaced by
+        the service discovery
+        :param cache_dir: directory of the cache files
+        :param max_age: max age in seconds of the cached backends which can be used
+        """
+        self.endpoint_cache = EndpointCache(cache_dir, max_age)
+
+    def set_token(self, token):
+        """
+        Set the authentication token of the service for the client
+        :param token: service token, automatically generated when deploying the service
+        """
+        self.token = token
+
+    def set_content_type(self, content_type):
+        """
+        Set the content_type for the client
+        :param content_type: content_type
+        """
+        self.content_type = content_type
+        self._build_base_headers()
+
+    def set_log_level(self, log_level):
+        """
+        Set log level for logging module
+        :param log_level: target log level
+        """
+        self.logger.setLevel(log_level)
+
+    def set_retry_count(self, count):
+        """
+        Set the max count of retrying when an error occurred during a request
+        :param count: max retry count
+        """
+        self.retry_count = count
+
+    def set_max_connection_count(self, count):
+        """
+        Set the max connection count which is the upper limit of connections in the connection pool
+        :param count: max connection count
+        """
+        self.max_connection_count = count
+
+    def set_timeout(self, timeout):
+        """
+        Set the request timeout for the client
+        :param timeout: timeout of a single request
+        :return:
+        """
+        self.timeout = timeout
+
+    def add_extra_headers(self, headers: dict):
+        """
+        Set the request headers for the client
+        :param headers: headers of a single request
+        :return:
+        """
+        if not isinstance(headers, dict):
+            raise TypeError("headers must be a dict")
+
+        self.headers.update(headers)
+        self._build_base_headers()
+
+    def _build_base_headers(self):
+        """
+        Build the read-only headers shared by all the requests, the per-request headers
+        are merged into a copy of them so that the client can be used by many threads
+        """
+        headers = dict(self.headers)
+        if len(self.content_type) > 0:
+            headers['Content-Type'] = self.content_type
+        self.base_headers = MappingProxyType(headers)
+
+    def _get_signer(self):
+        content_type = self.content_type
+        if len(content_type) == 0:
+            content_type = self.headers.get('Content-Type', 'application/octet-stream')
+        signer = self.signer
+        if signer is None or signer.token != self.token or signer.content_type != content_type or \
+                self.signer_key != (self.service_name, self.custom_url):
+            signer = RequestSigner(self.token, self.service_name, content_type, self.custom_url)
+            self.signer_key = (self.service_name, self.custom_url)
+            self.signer = signer
+        return signer
+
+    def generate_singaure(self, request_data, content_md5=None, current_time=None):
+        """
+        Generate the authentication headers of a request
+        :param request_data: the request body
+        :param content_md5: md5 hex digest of the request body, computed from request_data if not given
+        :param current_time: value of the 'Date' header, the current time is used if not given
+        :return: dict of the authentication headers
+        """
+        return self._get_signer().sign(request_data, content_md5, current_time)
+
+    def _request_body(self, req):
+        """
+        Get the request body from 'to_string()' of the request, bytes like objects, memoryviews
+        and any other objects supporting the buffer protocol are used directly without copying
+        """
+        req_str = req.to_string()
+        if sys.version_info[0] == 3 and isinstance(req_str, str):
+            return req_str.encode('utf-8')
+        if isinstance(req_str, (bytes, bytearray)):
+            return req_str
+        body = memoryview(req_str)
+        if not body.c_contiguous:
+            return body.tobytes()
+        if body.format != 'B' or body.ndim != 1:
+            body = body.cast('B')
+        return body
+
+    def _request_headers(self, req_body):
+        """
+        Return a function generating the headers of the given request body for the current second,
+        the body hash is computed only once, and the signature only when the second of the 'Date'
+        header changes between retries
+        """
+        base_headers = self.base_headers
+        if len(self.token) == 0:
+            return lambda: base_headers
+
+        signer = self._get_signer()
+        content_md5 = None
+        if signer.custom_url == '':
+            content_md5 = hashlib.md5(req_body).hexdigest()
+        cache = [None, None]
+
+        def headers():
+            current_time = signer.current_date()
+            if cache[0] != current_time:
+                merged = dict(base_headers)
+                merged.update(signer.sign(req_body, content_md5, current_time))
+                cache[1] = merged
+                cache[0] = current_time
+            return cache[1]
+        return headers
+
+    def _predict_url(self, domain):
+        if self.custom_url != '':
+            return self.custom_url
+        return u'%s/api/predict/%s' % (domain, self.service_name)
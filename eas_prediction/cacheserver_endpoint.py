@@ -2,21 +2,33 @@
 # -*- coding: utf-8 -*-
 
 from .endpoint import Endpoint
+from .endpoint import endpoint_host
 import urllib3
+import hashlib
 import json
 import os
 
 
 class CacheServerEndpoint(Endpoint):
+    """
+    Endpoint discovering the backends from the cache server, the backends are queried by
+    conditional requests with the etag of the last response, and the response whose body
+    has not changed is not parsed again, so that an unchanged service costs little.
+    """
+
     def __init__(self, domain, service_name, logger):
         super(CacheServerEndpoint, self).__init__(logger)
         self.domain = domain
         self.service_name = service_name.split('/')[0]
         self.http = urllib3.PoolManager()
+        self.etag = None
+        self.digest = None
+        # backends of the last successful response, returned again while they are not modified
+        self.last_endpoints = None
         self.logger = logger
         self.logger.info('Service discovery endpoint is: %s' % self.domain)
 
-    def sync(self):
+    def fetch(self):
         self.domain = self.domain.replace('http://', '')
         self.domain = self.domain.replace('https://', '')
         namespace = os.getenv('NAMESPACE')
@@ -27,23 +39,36 @@ class CacheServerEndpoint(Endpoint):
         url = 'http://%s/api/v1/servicediscovery/upstreams/%s%s' % \
               (self.domain, self.service_name, '?internal=true' if internal else '')
         endpoints = []
+        headers = {'If-None-Match': self.etag} if self.etag is not None else None
         try:
-            resp = self.http.request('GET', url)
+            resp = self.http.request('GET', url, headers=headers)
+            if resp.status == 304:
+                self.logger.debug('Service endpoints not modified')
+                return self.last_endpoints
             if resp.status != 200:
                 self.logger.error('sync service endpoints error: %s, %s' % (resp.status, resp.data))
-                return
+                return None
 
+            digest = hashlib.md5(resp.data).digest()
+            etag = resp.headers.get('ETag')
+            if digest == self.digest:
+                self.etag = etag
+                self.logger.debug('Service endpoints not modified')
+                return self.last_endpoints
             resp_data = resp.data.decode('utf-8')
             result = json.loads(resp_data)
             hosts = result['endpoints']['items']
             for host in hosts:
-                endpoints.append(({
-                                      'ip': host['ip'],
-                                      'port': host['port'],
-                                  }, host['weight']))
+                endpoints.append((endpoint_host(host), host['weight']))
             self.logger.debug(endpoints)
-            self.set_endpoints(endpoints)
+            # the etag is only kept along with a response parsed successfully, otherwise the
+            # malformed response would be answered as not modified by the next requests
+            self.etag = etag
+            self.digest = digest
+            self.last_endpoints = endpoints
+            return endpoints
         except urllib3.exceptions.HTTPError as e:
             self.logger.error('sync service endpoints http error, [%s]: %s' % (url, str(e)))
         except Exception as e:
             self.logger.error('sync service endpoints error, [%s]: %s' % (url, str(e)))
+        return None
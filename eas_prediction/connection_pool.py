@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import queue
+import random
+import socket
+import threading
+import time
+from threading import Lock
+from urllib3 import PoolManager
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.connectionpool import HTTPSConnectionPool
+
+
+class PoolStats(object):
+    """
+    Connection statistics of a host, 'created' counts the connections established,
+    'reused' the requests sent on a kept-alive connection, 'evicted' the connections
+    closed for exceeding the max lifetime or the idle timeout, and 'waiting' is the
+    count of the requests currently waiting for a free connection of a blocking pool.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+        self.waiting = 0
+
+    def add(self, name, value=1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'created': self.created,
+                'reused': self.reused,
+                'evicted': self.evicted,
+                'waiting': self.waiting,
+            }
+
+
+# ConnectionTracker of the requests sent by the current thread
+_tracking = threading.local()
+
+
+class ConnectionTracker(object):
+    """
+    Records the connection a managed pool lends to the requests sent in its context on the
+    current thread, so that another thread is able to abort the request in flight, such as
+    the losing request of a hedged pair, by shutting down the socket of the connection.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.conn = None
+        self.aborted = False
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = getattr(_tracking, 'tracker', None)
+        _tracking.tracker = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _tracking.tracker = self.previous
+        with self.lock:
+            self.conn = None
+
+    def attach(self, conn):
+        with self.lock:
+            self.conn = conn
+            if self.aborted:
+                self._shutdown(conn)
+
+    def detach(self, conn):
+        # the connection is returned to the pool, it may serve another request from now on
+        with self.lock:
+            if self.conn is conn:
+                self.conn = None
+
+    def abort(self):
+        """
+        Abort the request in flight, the request fails with a connection error
+        """
+        with self.lock:
+            self.aborted = True
+            if self.conn is not None:
+                self._shutdown(self.conn)
+
+    @staticmethod
+    def _shutdown(conn):
+        sock = getattr(conn, 'sock', None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except (OSError, socket.error):
+                pass
+
+
+class ManagedPoolMixin(object):
+    """
+    Connection pool closing the kept-alive connections which exceed the max lifetime or
+    stay idle longer than the idle timeout when they are taken from the pool, a closed
+    connection is reconnected by the next request, so that the connections to a load
+    balanced host, such as the gateway, are spread again after the host scales out.
+    """
+    max_lifetime = None
+    idle_timeout = None
+    stats = None
+
+    def _get_conn(self, timeout=None):
+        conn = self._take_conn(timeout)
+        tracker = getattr(_tracking, 'tracker', None)
+        if tracker is not None:
+            tracker.attach(conn)
+        return conn
+
+    def _take_conn(self, timeout):
+        waiting = self.block and self.pool is not None and self.pool.empty()
+        if waiting:
+            self.stats.add('waiting')
+        try:
+            conn = super(ManagedPoolMixin, self)._get_conn(timeout)
+        finally:
+            if waiting:
+                self.stats.add('waiting', -1)
+
+        now = time.time()
+        if getattr(conn, 'sock', None) is not None:
+            expire = getattr(conn, 'eas_expire', None)
+            idle_since = getattr(conn, 'eas_idle_since', now)
+            if (expire is not None and now >= expire) or \
+                    (self.idle_timeout is not None and now - idle_since >= self.idle_timeout):
+                conn.close()
+                self.stats.add('evicted')
+            else:
+                self.stats.add('reused')
+                return conn
+        self._on_created(conn, now)
+        return conn
+
+    def _on_created(self, conn, now):
+        self.stats.add('created')
+        # the lifetime is shortened randomly a little, so that the connections
+        # established at the same time are not closed at the same time
+        conn.eas_expire = None if self.max_lifetime is None else \
+            now + self.max_lifetime * random.uniform(0.9, 1.0)
+
+    def _put_conn(self, conn):
+        if conn is not None:
+            conn.eas_idle_since = time.time()
+            tracker = getattr(_tracking, 'tracker', None)
+            if tracker is not None:
+                tracker.detach(conn)
+        super(ManagedPoolMixin, self)._put_conn(conn)
+
+    def prewarm(self, count):
+        """
+        Open the connections to the host in advance and keep them in the pool, the connections
+        already open, both the idle ones and the ones in use by requests, are counted in, so a
+        pool is not warmed up beyond 'count' connections
+        :param count: count of the connections, limited by the max size of the pool
+        :return: count of the connections opened
+        """
+        if self.pool is None:
+            return 0
+        # the free slots are taken from the queue without waiting, since _get_conn() of a
+        # non-blocking pool opens an extra connection instead of failing when it is empty
+        conns = []
+        try:
+            while True:
+                try:
+                    conns.append(self.pool.get(block=False))
+                except queue.Empty:
+                    break
+            in_use = self.pool.maxsize - len(conns)
+            idle = len([conn for conn in conns if getattr(conn, 'sock', None) is not None])
+            needed = min(count, self.pool.maxsize) - in_use - idle
+            opened = 0
+            for i, conn in enumerate(conns):
+                if opened >= needed:
+                    break
+                if getattr(conn, 'sock', None) is not None:
+                    continue
+                if conn is None:
+                    conn = conns[i] = self._new_conn()
+                conn.connect()
+                self._on_created(conn, time.time())
+                opened += 1
+        finally:
+            # the open connections are put back last, so they are taken first from the LIFO queue
+            conns.sort(key=lambda conn: getattr(conn, 'sock', None) is not None)
+            for conn in conns:
+                self._put_conn(conn)
+        return opened
+
+
+class ManagedHTTPConnectionPool(ManagedPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class ManagedHTTPSConnectionPool(ManagedPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class ManagedPoolManager(PoolManager):
+    """
+    PoolManager keeping a managed connection pool of at most 'maxsize' connections per host,
+    whose connections are closed after 'max_lifetime' seconds, or after staying idle for
+    'idle_timeout' seconds, and collecting the connection statistics of every host. The pools
+    are limited to 'max_pools' hosts rather than the 'num_pools' of PoolManager, so a service
+    with many backends keeps the connections to all of them, the pools of the hosts which are
+    gone are closed by retain(), and the least recently used pools beyond the limit are closed.
+    """
+
+    def __init__(self, max_lifetime=None, idle_timeout=None, max_pools=1024, **connection_pool_kw):
+        """
+        :param max_lifetime: max time in seconds a connection is used, no limit if not set
+        :param idle_timeout: max time in seconds a connection stays idle in the pool, no limit if not set
+        :param max_pools: max count of the hosts whose pools are kept
+        :param connection_pool_kw: arguments of urllib3 PoolManager, such as 'maxsize' and 'block'
+        """
+        super(ManagedPoolManager, self).__init__(**connection_pool_kw)
+        self.pool_classes_by_scheme = {
+            'http': ManagedHTTPConnectionPool,
+            'https': ManagedHTTPSConnectionPool,
+        }
+        self.max_lifetime = max_lifetime
+        self.idle_timeout = idle_timeout
+        self.max_pools = max_pools
+        self.managed_pools = collections.OrderedDict()
+        self.managed_pools_lock = Lock()
+        self.stats = {}
+        self.stats_lock = Lock()
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        pool = super(ManagedPoolManager, self)._new_pool(scheme, host, port, request_context)
+        pool.max_lifetime = self.max_lifetime
+        pool.idle_timeout = self.idle_timeout
+        key = '%s:%s' % (host, port)
+        with self.stats_lock:
+            # the stats of a host are kept when its pool is closed by retain() and created again
+            pool.stats = self.stats.setdefault(key, PoolStats())
+        return pool
+
+    def connection_from_pool_key(self, pool_key, request_context=None):
+        # the pools are kept here instead of the LRU container of PoolManager, which closes
+        # the least recently used pool whenever more than 'num_pools' hosts are accessed
+        with self.managed_pools_lock:
+            pool = self.managed_pools.get(pool_key)
+            if pool is not None:
+                self.managed_pools.move_to_end(pool_key)
+                return pool
+            pool = self._new_pool(request_context['scheme'], request_context['host'],
+                                  request_context['port'], request_context=request_context)
+            self.managed_pools[pool_key] = pool
+            evicted = []
+            while len(self.managed_pools) > self.max_pools:
+                evicted.append(self.managed_pools.popitem(last=False)[1])
+        for evicted_pool in evicted:
+            evicted_pool.close()
+        return pool
+
+    def prewarm(self, url, count):
+        """
+        Open the connections to the host of the url in advance, the client only warms up the connections
+        through this method, which relies on the connection queue of the urllib3 pool, since urlopen()
+        cannot open a connection without sending a request
+        :param url: url of the host
+        :param count: count of the connections, limited by 'maxsize'
+        :return: count of the connections opened
+        """
+        return self.connection_from_url(url).prewarm(count)
+
+    def retain(self, hosts):
+        """
+        Close the pools of the hosts which are not in use any more, such as the removed backends
+        :param hosts: set of the 'host:port' to keep the pools of
+        """
+        with self.managed_pools_lock:
+            keys = [key for key in self.managed_pools if '%s:%s' % (key.key_host, key.key_port) not in hosts]
+            pools = [self.managed_pools.pop(key) for key in keys]
+        for pool in pools:
+            pool.close()
+
+    def clear(self):
+        with self.managed_pools_lock:
+            pools = list(self.managed_pools.values())
+            self.managed_pools.clear()
+        for pool in pools:
+            pool.close()
+        super(ManagedPoolManager, self).clear()
+
+    def get_stats(self):
+        """
+        Get the connection statistics
+        :return: dict of 'host:port' to the dict of 'created', 'reused', 'evicted' and 'waiting'
+        """
+        with self.stats_lock:
+            stats = list(self.stats.items())
+        return dict((key, value.to_dict()) for key, value in stats)
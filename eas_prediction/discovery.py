@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import random
+import threading
+
+from .endpoint import endpoint_sort_func
+from .exception import PredictException
+
+
+class DiscoveryEntry(object):
+    """
+    Service discovery state of one (endpoint_type, domain, service_name) key, the backends
+    are fetched by one of the subscribed endpoints and pushed to all of them on change.
+    """
+
+    def __init__(self, key, fetcher, interval, jitter=0.0):
+        self.key = key
+        self.fetcher = fetcher
+        self.interval = interval
+        self.jitter = jitter
+        self.subscribers = []
+        self.endpoints = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='eas-discovery-%s' % '/'.join(self.key))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def refresh(self):
+        fetcher = self.fetcher
+        try:
+            endpoints = fetcher.fetch()
+        except PredictException as e:
+            fetcher.logger.error(str(e))
+            return
+        except Exception as e:
+            # the refresher thread is shared by all the subscribers, it must survive any error
+            fetcher.logger.error('Failed to fetch the endpoints of %s: %s' % ('/'.join(self.key), str(e)))
+            return
+        if endpoints is None:
+            return
+        endpoints = sorted(endpoints, key=endpoint_sort_func)
+        if endpoints == self.endpoints:
+            self.notify(lambda endpoint: endpoint.renew_cache())
+            return
+        self.endpoints = endpoints
+        self.notify(lambda endpoint: endpoint.set_endpoints(endpoints))
+
+    def notify(self, func):
+        # a failing subscriber does not prevent the others from being updated
+        for endpoint in list(self.subscribers):
+            try:
+                func(endpoint)
+            except Exception as e:
+                endpoint.logger.error('Failed to update the endpoints of %s: %s' % ('/'.join(self.key), str(e)))
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.refresh()
+            # the jitter spreads the refreshes of the processes started at the same time
+            self.stopped.wait(self.interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+
+class DiscoveryRegistry(object):
+    """
+    Process wide registry of the service discovery, all the clients accessing the same service
+    through the same endpoint share one refresher thread, instead of syncing separately.
+    """
+    instance_lock = threading.Lock()
+    shared = None
+
+    def __init__(self, interval=3, jitter=0.2):
+        """
+        :param interval: interval in seconds of refreshing the backends of the services
+        :param jitter: the interval is randomized by this ratio up and down
+        """
+        self.interval = interval
+        self.jitter = jitter
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    @classmethod
+    def instance(cls):
+        """
+        Get the registry shared by the process
+        """
+        if cls.shared is None:
+            with cls.instance_lock:
+                if cls.shared is None:
+                    cls.shared = cls()
+        return cls.shared
+
+    def set_interval(self, interval):
+        """
+        Set the interval of refreshing the backends of the services
+        :param interval: interval in seconds
+        """
+        self.interval = interval
+        with self.lock:
+            for entry in self.entries.values():
+                entry.interval = interval
+
+    def subscribe(self, key, endpoint):
+        """
+        Subscribe the backends of a service, the refresher of the key is started by the first subscriber,
+        and the endpoint is updated immediately if the backends are already known
+        :param key: tuple of (endpoint_type, domain, service_name)
+        :param endpoint: Endpoint object implementing fetch() to get the backends
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = DiscoveryEntry(key, endpoint, self.interval, self.jitter)
+                self.entries[key] = entry
+                entry.start()
+            entry.subscribers.append(endpoint)
+            endpoints = entry.endpoints
+        if endpoints is not None:
+            endpoint.set_endpoints(endpoints)
+
+    def unsubscribe(self, key, endpoint):
+        """
+        Unsubscribe the backends of a service, the refresher is stopped when no subscriber is left
+        :param key: tuple of (endpoint_type, domain, service_name)
+        :param endpoint: the subscribed Endpoint object
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or endpoint not in entry.subscribers:
+                return
+            entry.subscribers.remove(endpoint)
+            if len(entry.subscribers) == 0:
+                entry.stopped.set()
+                del self.entries[key]
+            elif entry.fetcher is endpoint:
+                entry.fetcher = entry.subscribers[0]
+
+    def get_subscriber_count(self, key):
+        """
+        Get the count of the endpoints subscribing a service
+        :param key: tuple of (endpoint_type, domain, service_name)
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            return 0 if entry is None else len(entry.subscribers)
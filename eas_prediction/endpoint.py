@@ -2,44 +2,287 @@
 # -*- coding: utf-8 -*-
 
 from .exception import PredictException
-from .weighted_round_robin import WRRScheduler
+from .weighted_round_robin import smooth_wrr_table
+from .balancer import RoundRobinBalancer
+from .hash_ring import ConsistentHashRing
+from threading import Event
 from threading import Lock
-import time
+from threading import Timer
+import random
 import traceback
+import time
+
+# max count of the entries of the weighted round robin schedule of a snapshot, the weights are
+# quantized to fit it, so that a large service is not rebuilt at a cost growing with its weights
+MAX_SCHEDULE_SIZE = 10000
 
 
 def endpoint_sort_func(x):
     return '%s:%s:%s' % (x[0]['ip'], x[0]['port'], x[1])
 
-class Endpoint(object):
-    r_lock = Lock()
-    w_lock = Lock()
-    num_r = 0
 
+def endpoint_address(x):
+    return '%s:%s' % (x[0]['ip'], x[0]['port'])
+
+
+def endpoint_host(host):
+    """
+    Build the backend description from a host returned by the service discovery, the
+    metadata used by the client, such as the zone of the backend, is carried along
+    :param host: dict of the host, with the metadata either at the top level or under 'metadata'
+    :return: dict of 'ip', 'port' and the optional 'zone'
+    """
+    result = {
+        'ip': host['ip'],
+        'port': host['port'],
+    }
+    metadata = host.get('metadata')
+    zone = host.get('zone')
+    if zone is None and isinstance(metadata, dict):
+        zone = metadata.get('zone')
+    if zone is not None:
+        result['zone'] = zone
+    return result
+
+
+class EndpointSnapshot(object):
+    """
+    Immutable view of the backends of an endpoint, including the weighted round robin
+    schedule of one full cycle, it is never modified once created, and replaced as a
+    whole when the backends change, so readers need no lock to use it.
+    """
+
+    def __init__(self, endpoints):
+        self.endpoints = tuple(sorted(endpoints, key=endpoint_sort_func))
+        self.weights = tuple((endpoint_address(ep), ep[1]) for ep in self.endpoints if ep[1] > 0)
+        self.schedule = self._build_schedule(self.endpoints)
+
+    @staticmethod
+    def _build_schedule(endpoints):
+        table = smooth_wrr_table([(endpoint_address(ep), ep[1]) for ep in endpoints], MAX_SCHEDULE_SIZE)
+        return tuple(item[0] for item in table)
+
+
+class ZoneLocality(object):
+    """
+    Immutable split of the backends of a snapshot into the ones in the zone of the client and
+    the ones in the other zones, the requests are kept in the local zone as long as it has at
+    least its fair share of the capacity, that is 1 / zones of the total weight assuming the
+    clients are spread evenly over the zones, and the rest spills over to the other zones in
+    proportion, in the same way as the zone aware routing of Envoy, so a small local zone is
+    not flooded by the clients around it.
+    """
+
+    def __init__(self, local, remote, zones):
+        """
+        :param local: dict of the address to the weight of the backends in the zone of the client
+        :param remote: dict of the address to the weight of the backends in the other zones
+        :param zones: count of the zones of all the backends
+        """
+        self.local = local
+        self.remote = remote
+        self.local_set = frozenset(local)
+        self.remote_set = frozenset(remote)
+        self.local_weight = sum(local.values())
+        self.remote_weight = sum(remote.values())
+        self.zones = zones
+
+
+class Endpoint(object):
     def __init__(self, logger):
-        self.endpoints = dict()
-        self.scheduler = None
+        self.endpoints = []
+        self.snapshot = None
+        self.balancer = RoundRobinBalancer()
+        self.outlier_detector = None
+        self.hash_ring = None
+        self.health_checker = None
+        self.connection_pool = None
+        self.slow_start = None
+        # time when the backends in slow start are added
+        self.added = {}
+        self.ramp_timer = None
+        self.closed = False
+        self.ready = Event()
+        self.lock = Lock()
+        self.cache = None
+        self.cache_key = None
+        self.preloaded = False
+        # time when the backends are saved to the cache the last time
+        self.cache_saved = 0
+        self.zone = None
+        self.zone_min_healthy_percent = 50
+        # ZoneLocality of the current snapshot, None if the zone aware routing does not apply
+        self.locality = None
         self.logger = logger
 
-    def __r_lock_acquire(self):
-        self.r_lock.acquire()
-        self.num_r += 1
-        if self.num_r == 1:
-            self.w_lock.acquire()
-        self.r_lock.release()
+    def set_balancer(self, balancer):
+        """
+        Set the policy used to select the backend of each request
+        :param balancer: Balancer object, default is RoundRobinBalancer
+        """
+        with self.lock:
+            if self.snapshot is not None:
+                balancer.update(self.snapshot)
+            self.balancer = balancer
+
+    def set_outlier_detector(self, outlier_detector):
+        """
+        Set the detector used to eject the failing backends temporarily
+        :param outlier_detector: OutlierDetector object
+        """
+        with self.lock:
+            if self.snapshot is not None:
+                outlier_detector.update(self.snapshot)
+            self.outlier_detector = outlier_detector
+
+    def set_health_checker(self, health_checker):
+        """
+        Set the checker whose unhealthy backends are excluded from the backend selection
+        :param health_checker: HealthChecker object
+        """
+        with self.lock:
+            if self.snapshot is not None:
+                health_checker.update(self.snapshot)
+            self.health_checker = health_checker
+
+    def set_connection_pool(self, connection_pool):
+        """
+        Set the connection pool whose pools of the removed backends are closed when the backends change
+        :param connection_pool: ManagedPoolManager object
+        """
+        self.connection_pool = connection_pool
+
+    def set_hash_ring(self, hash_ring):
+        """
+        Set the consistent hash ring used to route the requests with a route key,
+        a ConsistentHashRing with the default parameters is created on the first use if not set
+        :param hash_ring: ConsistentHashRing object
+        """
+        with self.lock:
+            if self.snapshot is not None:
+                hash_ring.update(self.snapshot)
+            self.hash_ring = hash_ring
+
+    def _get_hash_ring(self):
+        with self.lock:
+            if self.hash_ring is None:
+                hash_ring = ConsistentHashRing()
+                hash_ring.update(self.snapshot)
+                self.hash_ring = hash_ring
+            return self.hash_ring
+
+    def set_slow_start(self, slow_start):
+        """
+        Ramp up the weights of the backends added after the endpoint is initialized
+        :param slow_start: SlowStart object
+        """
+        with self.lock:
+            self.slow_start = slow_start
+
+    def _ramp_endpoints(self, endpoints, now):
+        slow_start = self.slow_start
+        if slow_start is None or len(self.added) == 0:
+            return endpoints, False
+        steps = {}
+        for ep in endpoints:
+            address = endpoint_address(ep)
+            added = self.added.get(address)
+            if added is None:
+                continue
+            step = slow_start.get_step(now - added)
+            if step < slow_start.steps:
+                steps[address] = step
+            else:
+                del self.added[address]
+        if len(steps) == 0:
+            return endpoints, False
+
+        # the weights are only scaled up as far as the ramping backends need to express a step of their
+        # own weight, the schedule built from them is still bounded by MAX_SCHEDULE_SIZE of the snapshot
+        min_weight = min(ep[1] for ep in endpoints if endpoint_address(ep) in steps)
+        scale = min(-(-slow_start.steps // max(min_weight, 1)), slow_start.steps)
+        effective = []
+        for ep in endpoints:
+            weight = ep[1] * scale
+            step = steps.get(endpoint_address(ep))
+            if step is not None and weight > 0:
+                weight = max(int(round(float(weight) * step / slow_start.steps)), 1)
+            effective.append((ep[0], weight))
+        return effective, True
+
+    def _schedule_ramp(self):
+        if self.ramp_timer is None and not self.closed:
+            self.ramp_timer = Timer(self.slow_start.get_step_interval(), self._ramp)
+            self.ramp_timer.daemon = True
+            self.ramp_timer.start()
 
-    def __r_lock_release(self):
-        self.r_lock.acquire()
-        self.num_r -= 1
-        if self.num_r == 0:
-            self.w_lock.release()
-        self.r_lock.release()
+    def _ramp(self):
+        with self.lock:
+            self.ramp_timer = None
+            if self.closed:
+                return
+            endpoints = self.endpoints
+            effective, ramping = self._ramp_endpoints(endpoints, time.time())
+        # the snapshot is built without the lock, so the writers are not blocked meanwhile
+        try:
+            snapshot = EndpointSnapshot(effective)
+        except Exception as e:
+            self.logger.error('Failed to build the snapshot of service endpoints: %s' % str(e))
+            return
+        with self.lock:
+            # the backends changed meanwhile, their snapshot is newer and schedules the ramp by itself
+            if self.endpoints is not endpoints or self.closed:
+                return
+            self._publish(snapshot)
+            if ramping:
+                self._schedule_ramp()
+
+    def close(self):
+        """
+        Stop the background work of the endpoint, such as the ramp of the slow start
+        """
+        with self.lock:
+            self.closed = True
+            if self.ramp_timer is not None:
+                self.ramp_timer.cancel()
+                self.ramp_timer = None
+
+    def _publish(self, snapshot):
+        self.balancer.update(snapshot)
+        if self.outlier_detector is not None:
+            self.outlier_detector.update(snapshot)
+        if self.hash_ring is not None:
+            self.hash_ring.update(snapshot)
+        if self.health_checker is not None:
+            self.health_checker.update(snapshot)
+        if self.connection_pool is not None:
+            self.connection_pool.retain(set(endpoint_address(ep) for ep in snapshot.endpoints))
+        self.locality = self._build_locality(snapshot)
+        self.snapshot = snapshot
 
-    def __w_lock_acquire(self):
-        self.w_lock.acquire()
+    def set_zone(self, zone, min_healthy_percent=50):
+        """
+        Prefer the backends in the same zone as the client, a zone with less than its fair share of the
+        healthy weight keeps the requests in proportion to its share, and the rest spill over to the other zones
+        :param zone: zone of the client, compared with the 'zone' of the backends
+        :param min_healthy_percent: the requests are spread over all the zones when the weight of the healthy
+                                    backends in the zone drops below this percent of all the backends in the zone
+        """
+        with self.lock:
+            self.zone = zone
+            self.zone_min_healthy_percent = min_healthy_percent
+            if self.snapshot is not None:
+                self.locality = self._build_locality(self.snapshot)
 
-    def __w_lock_release(self):
-        self.w_lock.release()
+    def _build_locality(self, snapshot):
+        if self.zone is None:
+            return None
+        zones = dict((endpoint_address(ep), ep[0].get('zone')) for ep in snapshot.endpoints)
+        local = dict((address, weight) for address, weight in snapshot.weights if zones[address] == self.zone)
+        remote = dict((address, weight) for address, weight in snapshot.weights if address not in local)
+        if len(local) == 0 or len(remote) == 0:
+            return None
+        return ZoneLocality(local, remote, len(set(zones[address] for address, weight in snapshot.weights)))
 
     def __changed(self, endpoints):
         if len(self.endpoints) != len(endpoints):
@@ -52,69 +295,197 @@ class Endpoint(object):
             cur_weight = endpoints[idx][1]
             if old_weight != cur_weight:
                 return True
-            if old_endpoint['ip'] != cur_endpoint['ip'] or old_endpoint['port'] != cur_endpoint['port']:
+            if old_endpoint != cur_endpoint:
                 return True
         return False
 
-    def set_endpoints(self, endpoints):
-        if self.scheduler is None:
-            self.__w_lock_acquire()
+    def set_cache(self, cache, key):
+        """
+        Set the on-disk cache of the last known backends
+        :param cache: EndpointCache object
+        :param key: tuple of (endpoint_type, domain, service_name) of the service
+        """
+        self.cache = cache
+        self.cache_key = key
 
-            try:
-                self.scheduler = WRRScheduler(endpoints)
-                self.endpoints = sorted(endpoints, key=endpoint_sort_func)
-            except Exception as e:
-                traceback.print_stack()
-
-            self.__w_lock_release()
-            self.logger.info('Service endpoints initialized to: %s' % endpoints)
-        elif self.__changed(endpoints):
-            self.__w_lock_acquire()
+    def preload(self):
+        """
+        Initialize the backends from the on-disk cache, until they are replaced by the service discovery
+        :return: True if the cached backends are loaded
+        """
+        if self.cache is None or self.snapshot is not None:
+            return False
+        endpoints = self.cache.load(self.cache_key)
+        if not endpoints:
+            return False
+        self.preloaded = self.__update(endpoints)
+        return self.preloaded
 
+    def __update(self, endpoints):
+        # writers are serialized by the per-instance lock, readers just pick up
+        # the reference of the latest snapshot without locking
+        with self.lock:
+            initialized = self.snapshot is not None
+            if initialized and not self.__changed(endpoints):
+                self.logger.debug('Service endpoints unchanged, skip it')
+                return False
+            now = time.time()
+            if self.slow_start is not None:
+                addresses = set(endpoint_address(ep) for ep in endpoints)
+                known = set(endpoint_address(ep) for ep in self.endpoints)
+                for address in list(self.added):
+                    if address not in addresses:
+                        del self.added[address]
+                # the backends of the first snapshot are not new, but new to this client
+                if initialized:
+                    for address in addresses:
+                        if address not in known and address not in self.added:
+                            self.added[address] = now
             try:
-                self.scheduler.set_data(endpoints)
-                self.endpoints = sorted(endpoints, key=endpoint_sort_func)
+                effective, ramping = self._ramp_endpoints(endpoints, now)
+                snapshot = EndpointSnapshot(effective)
             except Exception as e:
                 traceback.print_stack()
+                self.logger.error('Failed to build the snapshot of service endpoints: %s' % str(e))
+                return False
+            self._publish(snapshot)
+            self.endpoints = sorted(endpoints, key=endpoint_sort_func)
+            self.ready.set()
+            if ramping:
+                self._schedule_ramp()
 
-            self.__w_lock_release()
+        if initialized:
             self.logger.info('Service endpoints changed to: %s' % endpoints)
         else:
-            self.logger.debug('Service endpoints unchanged, skip it')
+            self.logger.info('Service endpoints initialized to: %s' % endpoints)
+        return True
 
-    def get_size(self):
-        self.__r_lock_acquire()
-        length = len(self.endpoints)
-        self.__r_lock_release()
-        return length
+    def set_endpoints(self, endpoints):
+        changed = self.__update(endpoints)
+        if self.cache is None or len(endpoints) == 0:
+            return
+        # the cached backends confirmed by the service discovery are saved again to renew their age
+        if changed or self.preloaded:
+            self.preloaded = False
+            self._save_cache(endpoints)
+        else:
+            self.renew_cache()
 
-    def sync(self):
-        pass
-
-    def get(self):
-        retry = 0
-        while True:
-            if self.scheduler is not None:
-                break
-            time.sleep(0.1)
-            retry += 1
-            if retry > 50: # 5s timeout
-                raise PredictException(500, 'Get service backend timeout')
-                break
-
-        self.__w_lock_acquire()
+    def renew_cache(self):
+        """
+        Called when the service discovery answers with the unchanged backends, the cache file is
+        saved again every 'renew_interval' seconds of the cache, so that it does not expire while
+        the backends of the service stay the same
+        """
+        if self.cache is None or len(self.endpoints) == 0 or \
+                time.time() - self.cache_saved < self.cache.renew_interval:
+            return
+        self._save_cache(self.endpoints)
+
+    def _save_cache(self, endpoints):
+        self.cache_saved = time.time()
         try:
-            ep = self.scheduler.get_next()
-            if ep is not None:
-                ep = ep[0]
-        # catch every unexpected exceptions in case of dead lock
+            self.cache.save(self.cache_key, endpoints)
         except Exception as e:
-            ep = None
-            traceback.print_stack()
-            self.logger.error('Unexpected exception occured while getting item from WRR: %s' % str(e))
-        self.__w_lock_release()
+            self.logger.warning('Failed to save the service endpoints to cache: %s' % str(e))
+
+    def get_size(self):
+        return len(self.endpoints)
+
+    def wait_ready(self, timeout=None):
+        """
+        Block until the backends of the service are known
+        :param timeout: timeout in seconds, wait forever if not set
+        :return: True if the endpoint is ready before the timeout
+        """
+        return self.ready.wait(timeout)
 
-        if ep is None:
+    def fetch(self):
+        """
+        Fetch the backends of the service from the service discovery
+        :return: list of ({'ip': ip, 'port': port}, weight) tuples, or None if the fetch failed
+        """
+        return None
+
+    def sync(self):
+        endpoints = self.fetch()
+        if endpoints is not None:
+            self.set_endpoints(endpoints)
+
+    def get(self, exclude=None, route_key=None):
+        """
+        Select the backend for a request
+        :param exclude: optional set of backend addresses to avoid, such as the backends which
+                        failed in the previous attempts of the request
+        :param route_key: optional key of the request, the requests with the same key are routed
+                          to the same backend by the consistent hash ring, unless it is overloaded
+        :return: backend address in format of 'ip:port'
+        """
+        if self.snapshot is None and not self.ready.wait(5):
+            raise PredictException(500, 'Get service backend timeout')
+
+        if self.outlier_detector is not None:
+            ejected = self.outlier_detector.get_ejected()
+            if ejected:
+                exclude = ejected.union(exclude) if exclude else ejected
+        if self.health_checker is not None:
+            unhealthy = self.health_checker.get_unhealthy()
+            if unhealthy:
+                exclude = unhealthy.union(exclude) if exclude else unhealthy
+        if route_key is not None:
+            hash_ring = self.hash_ring if self.hash_ring is not None else self._get_hash_ring()
+            address = hash_ring.pick(route_key, exclude)
+            if address is not None:
+                return address
+        address = None
+        locality = self.locality
+        if locality is not None:
+            fraction = self._local_fraction(locality, exclude)
+            if fraction >= 1.0 or random.random() < fraction:
+                address = self.balancer.pick(locality.remote_set.union(exclude) if exclude else locality.remote_set)
+            elif fraction > 0:
+                address = self.balancer.pick(locality.local_set.union(exclude) if exclude else locality.local_set)
+        if address is None:
+            address = self.balancer.pick(exclude)
+        if address is None and exclude:
+            # every backend is excluded, fall back to all of them rather than failing
+            address = self.balancer.pick()
+        if address is None:
             raise PredictException(500, 'No backend found for the target service')
+        return address
+
+    def _local_fraction(self, locality, exclude):
+        """
+        Get the fraction of the requests kept in the local zone, 0 if the healthy backends in the zone
+        drop below the min healthy percent, then the requests are spread over all the backends
+        """
+        local_weight = locality.local_weight
+        remote_weight = locality.remote_weight
+        if exclude:
+            local_weight -= sum(locality.local.get(address, 0) for address in exclude)
+            remote_weight -= sum(locality.remote.get(address, 0) for address in exclude)
+        if local_weight <= 0 or local_weight * 100 < self.zone_min_healthy_percent * locality.local_weight:
+            return 0.0
+        return float(local_weight) * locality.zones / (local_weight + remote_weight)
+
+    def report_start(self, address):
+        """
+        Report that a request is sent to the backend returned by get()
+        :param address: backend address
+        """
+        self.balancer.on_start(address)
+        if self.hash_ring is not None:
+            self.hash_ring.on_start(address)
 
-        return ep['ip'] + ':' + str(ep['port'])
+    def report_finish(self, address, latency, success):
+        """
+        Report that a request to the backend returned by get() finished
+        :param address: backend address
+        :param latency: request latency in seconds
+        :param success: False if the request failed with a connection error or a 5xx response
+        """
+        self.balancer.on_finish(address, latency, success)
+        if self.hash_ring is not None:
+            self.hash_ring.on_finish(address, latency, success)
+        if self.outlier_detector is not None:
+            self.outlier_detector.record(address, success)
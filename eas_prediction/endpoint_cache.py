@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import re
+import tempfile
+import time
+
+
+class EndpointCache(object):
+    """
+    On-disk cache of the last known backends of the services, so that a restarted client
+    is able to send requests before the first successful service discovery, or while the
+    discovery server is unavailable. Every service is kept in its own json file, which is
+    replaced atomically, and the cached backends older than 'max_age' are ignored.
+    """
+
+    def __init__(self, cache_dir, max_age=86400, renew_interval=None):
+        """
+        :param cache_dir: directory of the cache files, created if not exists
+        :param max_age: max age in seconds of the cached backends which can be used
+        :param renew_interval: interval in seconds of saving the unchanged backends again, a tenth of
+                               the max age if not set
+        """
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.renew_interval = max_age / 10.0 if renew_interval is None else renew_interval
+
+    def path(self, key):
+        """
+        Get the cache file of a service
+        :param key: tuple of (endpoint_type, domain, service_name)
+        """
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', '_'.join(key))
+        return os.path.join(self.cache_dir, name + '.json')
+
+    def load(self, key, now=None):
+        """
+        Load the cached backends of a service
+        :param key: tuple of (endpoint_type, domain, service_name)
+        :param now: current time in seconds
+        :return: list of (host, weight) tuples, or None if not cached or expired
+        """
+        if now is None:
+            now = time.time()
+        try:
+            with open(self.path(key)) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        try:
+            if now - data['updated'] > self.max_age:
+                return None
+            return [(host, weight) for host, weight in data['endpoints']]
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def save(self, key, endpoints, now=None):
+        """
+        Save the backends of a service, the cache file is written to a temporary file
+        and renamed so that readers never see a partially written file
+        :param key: tuple of (endpoint_type, domain, service_name)
+        :param endpoints: list of (host, weight) tuples
+        :param now: current time in seconds
+        """
+        if now is None:
+            now = time.time()
+        data = json.dumps({
+            'updated': now,
+            'endpoints': [[host, weight] for host, weight in endpoints],
+        })
+        path = self.path(key)
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.' + os.path.basename(path))
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
@@ -30,6 +30,7 @@ class GatewayEndpoint(Endpoint):
             domain = domain[:len(domain)-1]
         self.domain = domain
         self.logger = logger
+        self.ready.set()
 
     def set_endpoints(self, endpoints):
         self.logger.debug('sync nothing for gateway endpoint')
@@ -37,5 +38,5 @@ class GatewayEndpoint(Endpoint):
     def get_size(self):
         return 1
 
-    def get(self):
+    def get(self, exclude=None, route_key=None):
         return self.domain
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import bisect
+import hashlib
+import math
+import struct
+from threading import Lock
+
+
+def hash_key(key):
+    """
+    Hash a routing key or a virtual node to a point of the ring
+    :param key: str, bytes or int
+    :return: 64 bit integer
+    """
+    if not isinstance(key, bytes):
+        key = str(key).encode('utf-8')
+    return struct.unpack('>Q', hashlib.md5(key).digest()[:8])[0]
+
+
+class ConsistentHashRing(object):
+    """
+    Consistent hash ring with bounded loads, used by Endpoint to route the requests with the
+    same key to the same backend. Every backend owns virtual nodes in proportion to its weight,
+    a key is routed to the first backend clockwise from its hash whose outstanding requests
+    are below 'load_factor' times its fair share, so a hot key spills over to the next backend
+    instead of overloading one. Only the virtual nodes of the changed backends are recomputed
+    when the backends change, and the keys of the unchanged backends stay where they are.
+    """
+
+    def __init__(self, vnodes=160, load_factor=1.25):
+        """
+        :param vnodes: average count of the virtual nodes of a backend
+        :param load_factor: max outstanding requests of a backend relative to its fair share, at least 1
+        """
+        self.vnodes = vnodes
+        self.load_factor = max(load_factor, 1.0)
+        self.lock = Lock()
+        self.nodes = {}
+        self.ring = ((), (), {}, 0)
+        self.outstanding = {}
+        self.total_outstanding = 0
+
+    def _node_points(self, address, count):
+        points = self.nodes.get(address, ())
+        if len(points) > count:
+            points = points[:count]
+        elif len(points) < count:
+            points = points + tuple(hash_key('%s#%d' % (address, i)) for i in range(len(points), count))
+        return points
+
+    def update(self, snapshot):
+        """
+        Called with the new snapshot whenever the backends of the endpoint change
+        :param snapshot: EndpointSnapshot object
+        """
+        weights = dict(snapshot.weights)
+        total = sum(weights.values())
+        nodes = {}
+        for address, weight in weights.items():
+            count = max(int(round(float(self.vnodes) * weight * len(weights) / total)), 1)
+            nodes[address] = self._node_points(address, count)
+        ring = sorted((point, address) for address, points in nodes.items() for point in points)
+        self.nodes = nodes
+        self.ring = (tuple(point for point, address in ring), tuple(address for point, address in ring),
+                     weights, total)
+
+    def pick(self, key, exclude=None):
+        """
+        Select the backend for a request key
+        :param key: routing key of the request
+        :param exclude: optional set of backend addresses which should not be selected
+        :return: backend address in format of 'ip:port', or None if no backend is available
+        """
+        points, owners, weights, total = self.ring
+        length = len(points)
+        if length == 0:
+            return None
+        # the fair share of a backend counts the request being routed
+        load = self.load_factor * (self.total_outstanding + 1) / total
+        index = bisect.bisect_left(points, hash_key(key))
+        visited = set()
+        for i in range(length):
+            address = owners[(index + i) % length]
+            if address in visited:
+                continue
+            visited.add(address)
+            if exclude and address in exclude:
+                continue
+            if self.outstanding.get(address, 0) < math.ceil(load * weights[address]):
+                return address
+            if len(visited) == len(weights):
+                break
+        return None
+
+    def on_start(self, address):
+        with self.lock:
+            self.outstanding[address] = self.outstanding.get(address, 0) + 1
+            self.total_outstanding += 1
+
+    def on_finish(self, address, latency, success):
+        with self.lock:
+            count = self.outstanding.get(address, 0)
+            if count == 0:
+                return
+            if count > 1:
+                self.outstanding[address] = count - 1
+            else:
+                del self.outstanding[address]
+            self.total_outstanding -= 1
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+
+class HealthChecker(object):
+    """
+    Active health checker of an Endpoint, every backend is probed by an http GET request
+    on the health check path in the background, a backend is marked unhealthy after a few
+    consecutive failed probes and healthy again after a few consecutive successful ones,
+    and the unhealthy backends are excluded from the backend selection, so the requests
+    do not pay for finding out the backends which are listed but not serving.
+    """
+
+    def __init__(self, path='/', interval=5.0, timeout=1.0, unhealthy_threshold=2, healthy_threshold=2,
+                 concurrency=8):
+        """
+        :param path: path of the health check request
+        :param interval: interval in seconds between the rounds of probes
+        :param timeout: timeout in seconds of a probe
+        :param unhealthy_threshold: count of consecutive failed probes to mark a backend unhealthy
+        :param healthy_threshold: count of consecutive successful probes to mark a backend healthy again
+        :param concurrency: max count of the probes sent at the same time
+        """
+        self.path = path if path.startswith('/') else '/' + path
+        self.interval = interval
+        self.timeout = timeout
+        self.unhealthy_threshold = unhealthy_threshold
+        self.healthy_threshold = healthy_threshold
+        self.concurrency = concurrency
+        self.lock = Lock()
+        # count of consecutive probes, positive for the successful ones and negative for the failed ones
+        self.counts = {}
+        self.unhealthy = frozenset()
+        self.stopped = None
+        self.executor = None
+
+    def update(self, snapshot):
+        """
+        Called with the new snapshot whenever the backends of the endpoint change
+        :param snapshot: EndpointSnapshot object
+        """
+        addresses = set(address for address, weight in snapshot.weights)
+        with self.lock:
+            for address in list(self.counts):
+                if address not in addresses:
+                    del self.counts[address]
+            self.unhealthy = frozenset(address for address in self.unhealthy if address in addresses)
+
+    def get_unhealthy(self):
+        """
+        Get the backends marked unhealthy currently
+        :return: frozenset of the unhealthy backend addresses
+        """
+        return self.unhealthy
+
+    def record(self, address, healthy):
+        """
+        Record the result of a probe to the backend
+        :param address: backend address
+        :param healthy: True if the probe succeeded
+        """
+        with self.lock:
+            count = self.counts.get(address, 0)
+            if healthy:
+                count = count + 1 if count > 0 else 1
+                if address in self.unhealthy and count >= self.healthy_threshold:
+                    self.unhealthy = self.unhealthy.difference([address])
+            else:
+                count = count - 1 if count < 0 else -1
+                if address not in self.unhealthy and -count >= self.unhealthy_threshold:
+                    self.unhealthy = self.unhealthy.union([address])
+            self.counts[address] = count
+
+    def probe(self, http, address):
+        """
+        Send a health check request to the backend
+        :param http: urllib3 PoolManager used to send the request
+        :param address: backend address
+        :return: True if the backend answered without a 5xx status
+        """
+        try:
+            resp = http.request('GET', 'http://%s%s' % (address, self.path), timeout=self.timeout, retries=False)
+            return resp.status // 100 != 5
+        except Exception:
+            return False
+
+    def check(self, endpoint, http):
+        """
+        Probe all the backends of the endpoint once
+        :param endpoint: Endpoint object
+        :param http: urllib3 PoolManager used to send the requests
+        """
+        snapshot = endpoint.snapshot
+        executor = self.executor
+        if snapshot is None or executor is None:
+            return
+        addresses = [address for address, weight in snapshot.weights]
+        results = executor.map(lambda address: self.probe(http, address), addresses)
+        for address, healthy in zip(addresses, results):
+            self.record(address, healthy)
+
+    def run(self, endpoint, http, stopped):
+        while not stopped.is_set():
+            try:
+                self.check(endpoint, http)
+            except RuntimeError:
+                # the executor is shut down by stop()
+                break
+            stopped.wait(self.interval)
+
+    def start(self, endpoint, http):
+        """
+        Start probing the backends of the endpoint in the background
+        :param endpoint: Endpoint object
+        :param http: urllib3 PoolManager used to send the requests, normally the connection pool of the client
+        """
+        self.stop()
+        self.stopped = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        t = threading.Thread(target=self.run, args=(endpoint, http, self.stopped))
+        t.daemon = True
+        t.start()
+
+    def stop(self):
+        """
+        Stop probing the backends
+        """
+        if self.stopped is not None:
+            self.stopped.set()
+            self.stopped = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
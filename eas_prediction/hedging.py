@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import heapq
+import itertools
+import threading
+import time
+from threading import Lock
+
+
+class HedgingPolicy(object):
+    """
+    Policy of the hedged requests, a second copy of a request is sent to another backend
+    if the first one has not answered within the hedging delay, which is either a fixed
+    value or a percentile of the recently observed latencies, and the count of hedged
+    requests is limited by a budget relative to the count of all the requests.
+    """
+
+    def __init__(self, delay=None, percentile=95, budget_percent=5, min_samples=100, window_size=1000):
+        """
+        :param delay: fixed hedging delay in milliseconds, the percentile of the observed latencies is used if not set
+        :param percentile: percentile of the observed latencies used as the hedging delay
+        :param budget_percent: max percent of the requests which can be hedged
+        :param min_samples: min count of observed latencies before hedging by percentile
+        :param window_size: count of the latest latencies the percentile is computed from
+        """
+        self.delay = delay
+        self.percentile = percentile
+        self.budget_percent = budget_percent
+        self.min_samples = min_samples
+        self.lock = Lock()
+        self.latencies = collections.deque(maxlen=window_size)
+        self.samples_since_update = 0
+        self.percentile_delay = None
+        # every request earns budget_percent / 100 hedges, the unused budget is capped
+        # so that only a small burst of hedges can be issued after a quiet period
+        self.tokens = 0.0
+        self.max_tokens = max(10.0 * budget_percent / 100.0, 1.0)
+        self.requests = 0
+        self.hedges_issued = 0
+        self.hedges_won = 0
+
+    def get_delay(self):
+        """
+        Get the current hedging delay
+        :return: delay in seconds, or None if the request should not be hedged
+        """
+        if self.delay is not None:
+            return self.delay / 1000.0
+        return self.percentile_delay
+
+    def record(self, latency):
+        """
+        Record the latency of a request sent to the first backend
+        :param latency: request latency in seconds
+        """
+        with self.lock:
+            self.latencies.append(latency)
+            self.samples_since_update += 1
+            if len(self.latencies) >= self.min_samples and \
+                    (self.percentile_delay is None or self.samples_since_update >= self.min_samples):
+                ordered = sorted(self.latencies)
+                index = min(int(len(ordered) * self.percentile / 100.0), len(ordered) - 1)
+                self.percentile_delay = ordered[index]
+                self.samples_since_update = 0
+
+    def on_request(self):
+        """
+        Called for every request which may be hedged, earns the budget for hedging
+        """
+        with self.lock:
+            self.requests += 1
+            self.tokens = min(self.tokens + self.budget_percent / 100.0, self.max_tokens)
+
+    def acquire(self):
+        """
+        Try to take the budget for a hedged request
+        :return: True if the request can be hedged
+        """
+        with self.lock:
+            if self.tokens < 1.0:
+                return False
+            self.tokens -= 1.0
+            self.hedges_issued += 1
+            return True
+
+    def on_hedge_won(self):
+        """
+        Called when the response of the hedged request is used
+        """
+        with self.lock:
+            self.hedges_won += 1
+
+    def get_stats(self):
+        """
+        Get the hedging statistics
+        :return: dict of the count of requests, hedged requests, hedged requests which won, and the current delay
+        """
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'hedges_issued': self.hedges_issued,
+                'hedges_won': self.hedges_won,
+                'delay': self.get_delay(),
+            }
+
+
+class HedgeScheduler(object):
+    """
+    Background thread running the functions scheduled after a delay, the hedged requests are
+    sent from it, so that the requests answered within the hedging delay cost a heap entry
+    rather than a timer thread or a hop to another thread.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.heap = []
+        self.counter = itertools.count()
+        self.stopped = False
+        self.thread = None
+
+    def schedule(self, delay, func):
+        """
+        Run the function in the background after the delay
+        :param delay: delay in seconds
+        :param func: function without arguments
+        :return: the scheduled call, which can be passed to cancel()
+        """
+        call = [time.time() + delay, next(self.counter), func]
+        with self.condition:
+            if self.stopped:
+                return call
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='eas-hedging')
+                self.thread.daemon = True
+                self.thread.start()
+            heapq.heappush(self.heap, call)
+            if self.heap[0] is call:
+                self.condition.notify()
+        return call
+
+    def cancel(self, call):
+        """
+        Cancel a scheduled call if it has not run yet, it is dropped from the heap once it is due
+        :param call: the call returned by schedule()
+        """
+        call[2] = None
+
+    def stop(self):
+        """
+        Stop the background thread, the pending calls are dropped
+        """
+        with self.condition:
+            self.stopped = True
+            self.heap = []
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while True:
+                    if self.stopped:
+                        return
+                    if len(self.heap) == 0:
+                        self.condition.wait()
+                        continue
+                    call = self.heap[0]
+                    remaining = call[0] - time.time()
+                    if call[2] is not None and remaining > 0:
+                        self.condition.wait(remaining)
+                        continue
+                    heapq.heappop(self.heap)
+                    func = call[2]
+                    if func is not None:
+                        break
+            func()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+from threading import Lock
+
+
+class BackendStat(object):
+    def __init__(self, now):
+        self.consecutive_failures = 0
+        self.window_start = now
+        self.window_requests = 0
+        self.window_failures = 0
+        self.ejection_count = 0
+        self.ejected_until = 0
+        self.readmitted_at = 0
+
+
+class OutlierDetector(object):
+    """
+    Per backend circuit breaker of an Endpoint, a backend is ejected temporarily when it
+    fails too many times in a row, or its error rate within a time window is too high,
+    the ejection time grows exponentially with the times the backend has been ejected,
+    and no more than a share of the backends can be ejected at the same time.
+    """
+
+    def __init__(self, consecutive_failures=5, error_rate=0.5, error_rate_min_requests=20,
+                 error_rate_window=10.0, base_ejection_time=10.0, max_ejection_time=300.0,
+                 max_ejection_percent=50):
+        """
+        :param consecutive_failures: count of consecutive failures to eject a backend
+        :param error_rate: error rate in a window to eject a backend
+        :param error_rate_min_requests: min requests in a window to check the error rate
+        :param error_rate_window: window in seconds to compute the error rate
+        :param base_ejection_time: ejection time in seconds for the first ejection, doubled for every
+                                   further ejection, and halved back for every healthy period of that time
+        :param max_ejection_time: max ejection time in seconds
+        :param max_ejection_percent: max percent of the backends which can be ejected at the same time
+        """
+        self.consecutive_failures = consecutive_failures
+        self.error_rate = error_rate
+        self.error_rate_min_requests = error_rate_min_requests
+        self.error_rate_window = error_rate_window
+        self.base_ejection_time = base_ejection_time
+        self.max_ejection_time = max_ejection_time
+        self.max_ejection_percent = max_ejection_percent
+        self.lock = Lock()
+        self.stats = {}
+        self.backend_count = 0
+        self.ejected = frozenset()
+        self.next_readmission = 0
+
+    def update(self, snapshot):
+        """
+        Called with the new snapshot whenever the backends of the endpoint change
+        :param snapshot: EndpointSnapshot object
+        """
+        addresses = set(address for address, weight in snapshot.weights)
+        with self.lock:
+            for address in list(self.stats):
+                if address not in addresses:
+                    del self.stats[address]
+            self.backend_count = len(addresses)
+            self.ejected = frozenset(address for address in self.ejected if address in addresses)
+
+    def get_ejected(self, now=None):
+        """
+        Get the backends ejected currently
+        :param now: current time in seconds
+        :return: frozenset of the ejected backend addresses
+        """
+        if self.next_readmission == 0:
+            return self.ejected
+        if now is None:
+            now = time.time()
+        if now >= self.next_readmission:
+            with self.lock:
+                self._readmit(now)
+        return self.ejected
+
+    def _readmit(self, now):
+        ejected = []
+        next_readmission = 0
+        for address in self.ejected:
+            stat = self.stats.get(address)
+            if stat is None or stat.ejected_until <= now:
+                if stat is not None:
+                    stat.readmitted_at = now
+                continue
+            ejected.append(address)
+            if next_readmission == 0 or stat.ejected_until < next_readmission:
+                next_readmission = stat.ejected_until
+        self.ejected = frozenset(ejected)
+        self.next_readmission = next_readmission
+
+    def _eject(self, address, stat, now):
+        if (len(self.ejected) + 1) * 100 > self.max_ejection_percent * self.backend_count:
+            return
+        stat.ejection_count += 1
+        ejection_time = min(self.base_ejection_time * (2 ** (stat.ejection_count - 1)), self.max_ejection_time)
+        stat.ejected_until = now + ejection_time
+        stat.consecutive_failures = 0
+        stat.window_start = now
+        stat.window_requests = 0
+        stat.window_failures = 0
+        self.ejected = self.ejected.union([address])
+        if self.next_readmission == 0 or stat.ejected_until < self.next_readmission:
+            self.next_readmission = stat.ejected_until
+
+    def record(self, address, success, now=None):
+        """
+        Record the result of a request to the backend
+        :param address: backend address
+        :param success: False if the request failed with a connection error or a 5xx response
+        :param now: current time in seconds
+        """
+        if now is None:
+            now = time.time()
+        with self.lock:
+            stat = self.stats.get(address)
+            if stat is None:
+                stat = BackendStat(now)
+                self.stats[address] = stat
+            if address in self.ejected:
+                return
+
+            if now - stat.window_start >= self.error_rate_window:
+                stat.window_start = now
+                stat.window_requests = 0
+                stat.window_failures = 0
+            stat.window_requests += 1
+
+            if success:
+                stat.consecutive_failures = 0
+                if stat.ejection_count > 0 and now - stat.readmitted_at >= self.base_ejection_time:
+                    stat.ejection_count -= 1
+                    stat.readmitted_at = now
+                return
+
+            stat.consecutive_failures += 1
+            stat.window_failures += 1
+            if stat.consecutive_failures >= self.consecutive_failures:
+                self._eject(address, stat, now)
+            elif stat.window_requests >= self.error_rate_min_requests and \
+                    stat.window_failures >= self.error_rate * stat.window_requests:
+                self._eject(address, stat, now)
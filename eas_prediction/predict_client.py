@@ -3,222 +3,337 @@
 
 import threading
 import time
-import sys
-import logging
-import datetime
-import hashlib
-import hmac
-import base64
-from urllib3 import PoolManager
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait
 from urllib3.exceptions import MaxRetryError
 from urllib3.exceptions import ProtocolError
 from urllib3.exceptions import HTTPError
 from .exception import PredictException
-from .vipserver_endpoint import VipServerEndpoint
-from .cacheserver_endpoint import CacheServerEndpoint
+from .hedging import HedgingPolicy
+from .hedging import HedgeScheduler
+from .connection_pool import ConnectionTracker
+from .connection_pool import ManagedPoolManager
 from .gateway_endpoint import GatewayEndpoint
+from .base_client import BaseClient
+from .base_client import ENDPOINT_TYPE_DIRECT
+from .base_client import ENDPOINT_TYPE_VIPSERVER
+from .base_client import ENDPOINT_TYPE_DEFAULT
 
-ENDPOINT_TYPE_DIRECT = 'DIRECT'
-ENDPOINT_TYPE_VIPSERVER = 'VIPSERVER'
-ENDPOINT_TYPE_DEFAULT = 'DEFAULT'
 
-
-class PredictClient:
+class PredictClient(BaseClient):
     """
     Client for accessing prediction service by creating a fixed size connection pool
     to perform the request through established persistent connections.
     """
 
     def __init__(self, endpoint='', service_name='', custom_url=''):
-        self.retry_count = 5
-        self.max_connection_count = 100
-        self.token = ''
-        self.endpoint = None
-        self.timeout = 5000
+        super(PredictClient, self).__init__(endpoint, service_name, custom_url)
+        self.connection_max_lifetime = None
+        self.connection_idle_timeout = None
+        self.connection_block = False
         self.connection_pool = None
-        self.endpoint_type = ''
-        self.endpoint_name = endpoint
-        self.custom_url = custom_url
-        self.service_name = service_name
-        self.content_type = ''
-        self.headers = {}
-        self.stop = False
-        self.logger = logging.getLogger(endpoint + '/' + service_name)
-        self.logger.addHandler(logging.StreamHandler(stream=sys.stdout))
-        self.logger.setLevel(logging.ERROR)
-
-    def __sync_handler(self):
-        while True:
-            if self.stop:
-                break
-            try:
-                self.endpoint.sync()
-            except PredictException as e:
-                self.logger.error(str(e))
-            time.sleep(3)
+        self.worker_count = 0
+        self.executor = None
+        self.hedging = None
+        self.hedging_executor = None
+        self.hedging_scheduler = None
+        self.hedging_max_workers = 1024
+        self.health_checker = None
+        self.executor_lock = threading.Lock()
 
     def destroy(self):
-        self.stop = True
+        super(PredictClient, self).destroy()
+        if self.health_checker is not None:
+            self.health_checker.stop()
+        with self.executor_lock:
+            executors = [self.executor, self.hedging_executor]
+            self.executor = None
+            self.hedging_executor = None
+        if self.hedging_scheduler is not None:
+            self.hedging_scheduler.stop()
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=True)
 
-    def init(self):
+    def init(self, wait_ready=False, ready_timeout=5, warm_connections=0, warmup_request=None):
         """
         Initialize the client after the functions used to set the client properties are called
+        :param wait_ready: block until the first successful sync of the service endpoints
+        :param ready_timeout: max time in seconds to wait for the service endpoints
+        :param warm_connections: count of the connections opened to every backend, or to the gateway, before
+                                 init() returns, so that the first requests do not pay for connecting
+        :param warmup_request: optional request sent through the warm connections of every backend before
+                               init() returns, the responses are ignored
         """
         if self.connection_pool is None:
-            self.connection_pool = PoolManager(maxsize=self.max_connection_count)
-
-        if self.endpoint_type == '' or self.endpoint_type == ENDPOINT_TYPE_DEFAULT:
-            self.endpoint = GatewayEndpoint(self.endpoint_name, self.service_name, self.logger, self.custom_url)
-        elif self.endpoint_type == ENDPOINT_TYPE_VIPSERVER:
-            self.endpoint = VipServerEndpoint(self.endpoint_name, self.logger)
-        elif self.endpoint_type == ENDPOINT_TYPE_DIRECT:
-            self.endpoint = CacheServerEndpoint(self.endpoint_name, self.service_name, self.logger)
-        else:
-            raise PredictException(500, 'Unsupported endpoint type: %s' % self.endpoint_type)
+            self.connection_pool = ManagedPoolManager(max_lifetime=self.connection_max_lifetime,
+                                                      idle_timeout=self.connection_idle_timeout,
+                                                      maxsize=self.max_connection_count,
+                                                      block=self.connection_block)
+        self._init_endpoint(wait_ready, ready_timeout)
 
-        t = threading.Thread(target=PredictClient.__sync_handler, args=(self,))
-        t.daemon = True
-        t.start()
-        self.logger.debug('Endpoint sync thread started')
+        if warm_connections > 0 or warmup_request is not None:
+            if self.endpoint.wait_ready(ready_timeout):
+                self._warm_up(warm_connections, warmup_request)
+            else:
+                self.logger.error('Service endpoints not ready, skip warming up: %s' % self.endpoint_name)
 
-    def set_endpoint(self, endpoint):
-        """
-        Set the endpoint of the service for the client
-        :param endpoint_name: name of the endpoint, such as http://pai-eas-vpc.cn-shanghai.aliyuncs.com
-        """
-        self.endpoint_name = endpoint
+    def _setup_endpoint(self, endpoint):
+        if not isinstance(endpoint, GatewayEndpoint) and self.custom_url == '':
+            endpoint.set_connection_pool(self.connection_pool)
+        if self.health_checker is not None and not isinstance(endpoint, GatewayEndpoint):
+            endpoint.set_health_checker(self.health_checker)
+            self.health_checker.start(endpoint, self.connection_pool)
 
-    def set_service_name(self, service_name):
+    def set_health_checker(self, health_checker):
         """
-        Set the service name for the client
-        :param service_name: name of the service to access
+        Probe the backends of DIRECT and VIPSERVER endpoints in the background through the connection pool
+        of the client, the backends failing the probes are not selected until they pass the probes again
+        :param health_checker: HealthChecker object
         """
-        self.service_name = service_name
+        self.health_checker = health_checker
 
-    def set_endpoint_type(self, endpoint_type):
+    def set_hedging(self, delay=None, percentile=95, budget_percent=5, max_workers=1024):
         """
-        Set the endpoint type, support GATEWAY, DIRECT, VIPSERVER, default is GATEWAY
-        :param endpoint_type: type of the endpoint
+        Enable hedged requests for DIRECT and VIPSERVER endpoints, if a request has not been answered
+        within the delay, a second copy is sent to another backend and the first response is used,
+        only enable it when the requests are idempotent
+        :param delay: fixed hedging delay in milliseconds, the percentile of the observed latencies is used if not set
+        :param percentile: percentile of the observed latencies used as the hedging delay
+        :param budget_percent: max percent of the requests which can be hedged
+        :param max_workers: max count of the threads sending the copies of the requests, the first request is
+                            sent by the calling thread, the threads are created on demand
         """
-        self.endpoint_type = endpoint_type
+        self.hedging = HedgingPolicy(delay, percentile, budget_percent)
+        self.hedging_scheduler = HedgeScheduler()
+        self.hedging_max_workers = max_workers
 
-    def set_token(self, token):
+    def get_hedging_stats(self):
         """
-        Set the authentication token of the service for the client
-        :param token: service token, automatically generated when deploying the service
+        Get the statistics of the hedged requests
+        :return: dict of the count of requests, hedged requests, hedged requests which won, and the current delay
         """
-        self.token = token
+        if self.hedging is None:
+            return {}
+        return self.hedging.get_stats()
 
-    def set_content_type(self, content_type):
+    def set_connection_pool_options(self, max_lifetime=None, idle_timeout=None, block=False):
         """
-        Set the content_type for the client
-        :param content_type: content_type
+        Set how the kept-alive connections of the connection pool are managed, the pool keeps
+        at most 'max_connection_count' connections for every host
+        :param max_lifetime: max time in seconds a connection is used, so that the connections to the gateway
+                             are established again and spread to the new gateway instances after it scales out
+        :param idle_timeout: max time in seconds a connection stays idle in the pool before it is closed
+        :param block: wait for a free connection when all the connections of a host are in use, instead of
+                      opening an extra connection which is closed after the request
         """
-        self.content_type = content_type
+        self.connection_max_lifetime = max_lifetime
+        self.connection_idle_timeout = idle_timeout
+        self.connection_block = block
 
-    def set_log_level(self, log_level):
+    def get_connection_stats(self):
         """
-        Set log level for logging module
-        :param log_level: target log level
+        Get the statistics of the connection pool
+        :return: dict of 'host:port' to the count of the connections created, the requests reusing a connection,
+                 the connections evicted for the max lifetime or the idle timeout, and the requests waiting for
+                 a free connection
         """
-        self.logger.setLevel(log_level)
+        if self.connection_pool is None:
+            return {}
+        return self.connection_pool.get_stats()
 
-    def set_retry_count(self, count):
+    def set_worker_count(self, count):
         """
-        Set the max count of retrying when an error occurred during a request
-        :param count: max retry count
+        Set the thread count of the client thread pool used by predict_async() and predict_many(),
+        default is the max connection count
+        :param count: worker thread count
         """
-        self.retry_count = count
+        self.worker_count = count
 
-    def set_max_connection_count(self, count):
+    def _send(self, address, url, headers, body, tracker=None):
         """
-        Set the max connection count which is the upper limit of connections in the connection pool
-        :param count: max connection count
+        Send the request to the backend selected by the endpoint, and report the
+        start and finish of the request back to the endpoint
+        :param tracker: optional ConnectionTracker through which the request can be aborted
         """
-        self.max_connection_count = count
+        self.endpoint.report_start(address)
+        start = time.time()
+        success = False
+        try:
+            if tracker is None:
+                resp = self._request(url, headers, body)
+            else:
+                with tracker:
+                    resp = self._request(url, headers, body)
+            success = resp.status // 100 != 5
+            return resp
+        finally:
+            # a request aborted since the other copy of it has been answered is not a failure of the backend
+            if tracker is not None and tracker.aborted:
+                success = True
+            self.endpoint.report_finish(address, time.time() - start, success)
 
-    def set_timeout(self, timeout):
-        """
-        Set the request timeout for the client
-        :param timeout: timeout of a single request
-        :return:
-        """
-        self.timeout = timeout
+    def _request(self, url, headers, body):
+        return self.connection_pool.request('POST', url,
+                                            headers=headers,
+                                            body=body,
+                                            timeout=self.timeout / 1000.0,
+                                            retries=0)
 
-    def add_extra_headers(self, headers: dict):
+    def _open_connections(self, address, count):
+        try:
+            self.connection_pool.prewarm(self._predict_url(address), count)
+        except Exception as e:
+            self.logger.error('Failed to open connection to %s: %s' % (address, str(e)))
+
+    def _warm_up(self, warm_connections, warmup_request=None):
         """
-        Set the request headers for the client
-        :param headers: headers of a single request
-        :return:
+        Open the connections to the backends in advance, and send the warm-up request through them
         """
-        if not isinstance(headers, dict):
-            raise TypeError("headers must be a dict")
+        if isinstance(self.endpoint, GatewayEndpoint):
+            addresses = [self.endpoint.get()]
+        else:
+            addresses = [address for address, weight in self.endpoint.snapshot.weights]
+        if len(addresses) == 0:
+            return
+        count = min(warm_connections, self.max_connection_count)
+        with ThreadPoolExecutor(max_workers=min(len(addresses), 16)) as executor:
+            list(executor.map(lambda address: self._open_connections(address, count), addresses))
+        if warmup_request is None:
+            return
+
+        req_body = self._request_body(warmup_request)
+        headers = self._request_headers(req_body)()
+
+        def warm(address):
+            try:
+                self._send(address, self._predict_url(address), headers, req_body)
+            except Exception as e:
+                self.logger.error('Warm-up request to %s failed: %s' % (address, str(e)))
 
-        self.headers.update(headers)
+        # the requests are sent concurrently, so that they take different connections from the pool
+        requests = [address for address in addresses for i in range(max(count, 1))]
+        with ThreadPoolExecutor(max_workers=min(len(requests), self.max_connection_count)) as executor:
+            list(executor.map(warm, requests))
+        self.logger.debug('Warmed up %d connections to %d backends' % (count, len(addresses)))
 
-    def generate_singaure(self, request_data):
-        utcnow = datetime.datetime.now()
-        content_type = self.content_type
-        if len(content_type) == 0:
-            content_type = self.headers.get('Content-Type', 'application/octet-stream')
+    def _get_hedging_executor(self):
+        if self.hedging_executor is None:
+            with self.executor_lock:
+                if self.stop:
+                    raise PredictException(500, 'The client has been destroyed')
+                if self.hedging_executor is None:
+                    self.hedging_executor = ThreadPoolExecutor(max_workers=self.hedging_max_workers)
+        return self.hedging_executor
 
-        current_time = utcnow.strftime('%a, %d %b %Y %H:%M:%S GMT')
-        if self.custom_url != '':
-            return {
-                'Date': current_time,
-                'Content-Type': content_type,
-                'Content-Length': '%d' % len(request_data),
-                'Authorization': self.token
-            }
+    def _send_hedged(self, address, headers, body, failed, route_key=None):
+        """
+        Send the request to the backend, and send a copy to another backend if it has not been
+        answered within the hedging delay, the first successful response is returned
+        :param failed: backends which failed the previous attempts of the request, they are not used for the copy
+        :param route_key: route key of the request, the copy goes to the next backend of the key
+        :return: tuple of the response and the address of the backend which answered it
+        """
+        hedging = self.hedging
+        hedging.on_request()
+        delay = hedging.get_delay()
+        if delay is None:
+            start = time.time()
+            resp = self._send(address, self._predict_url(address), headers, body)
+            hedging.record(time.time() - start)
+            return resp, address
 
-        canonicalized_resource = '/api/predict/%s' % self.service_name
-        content_md5 = hashlib.md5(request_data).hexdigest()
-        verb = 'POST'
+        # the request is sent by the calling thread, the copy is sent from the executor once the
+        # scheduler finds the request still unanswered after the delay
+        primary = ConnectionTracker()
+        lock = threading.Lock()
+        state = {'finished': False, 'backup': None}
 
-        auth = '%s\n%s\n%s\n%s\n%s' % (verb, content_md5, content_type, current_time, canonicalized_resource)
+        def send_backup(backup_address, tracker):
+            resp = self._send(backup_address, self._predict_url(backup_address), headers, body, tracker)
+            if resp.status // 100 != 5:
+                primary.abort()
+            return resp
 
-        hmac1 = hmac.new(bytearray(self.token, 'utf-8'), bytearray(auth.strip(), 'utf-8'), hashlib.sha1)
-        signature = base64.b64encode(hmac1.digest()).decode()
-        authorization = 'EAS %s' % (signature.strip())
+        def hedge():
+            with lock:
+                if state['finished']:
+                    return
+            try:
+                backup_address = self.endpoint.get(failed | set([address]), route_key)
+                if backup_address == address:
+                    return
+                executor = self._get_hedging_executor()
+                with lock:
+                    if state['finished'] or not hedging.acquire():
+                        return
+                    tracker = ConnectionTracker()
+                    future = executor.submit(send_backup, backup_address, tracker)
+                    state['backup'] = (future, backup_address, tracker)
+            except Exception as e:
+                self.logger.debug('Failed to send the hedged request: %s' % str(e))
 
-        return {
-            'Content-MD5': content_md5,
-            'Date': current_time,
-            'Content-Type': content_type,
-            'Content-Length': '%d' % len(request_data),
-            'Authorization': authorization
-        }
+        call = self.hedging_scheduler.schedule(delay, hedge)
+        start = time.time()
+        resp = None
+        error = None
+        try:
+            resp = self._send(address, self._predict_url(address), headers, body, primary)
+        except Exception as e:
+            error = e
+        hedging.record(time.time() - start)
+        self.hedging_scheduler.cancel(call)
+        with lock:
+            state['finished'] = True
+            backup = state['backup']
 
-    def predict(self, req):
+        if backup is None:
+            if error is not None:
+                raise error
+            return resp, address
+        future, backup_address, tracker = backup
+        if error is None and resp.status // 100 != 5:
+            # the first successful response wins, the copy still in flight is aborted
+            tracker.abort()
+            return resp, address
+        try:
+            backup_resp = future.result()
+        except Exception as e:
+            if resp is not None:
+                return resp, address
+            raise error if error is not None else e
+        if backup_resp.status // 100 != 5:
+            hedging.on_hedge_won()
+            return backup_resp, backup_address
+        if resp is not None:
+            return resp, address
+        return backup_resp, backup_address
+
+    def predict(self, req, route_key=None):
         """
         Perform the prediction request to the server by sending an http request of which the request body
         may be in different format (string, protobuf or other user defined format), make it an abstract
         class implementing a basic function 'to_string()' to serialized the request to string for sending
         :param req: abstract class of the request
+        :param route_key: optional key such as the user id, the requests with the same key are routed to the
+                          same backend by consistent hashing for DIRECT and VIPSERVER endpoints
         :return: service response correlated with the input request
         """
-        headers = self.headers
+        req_body = self._request_body(req)
+        request_headers = self._request_headers(req_body)
+        failed = set()
         for i in range(0, self.retry_count):
             try:
-                domain = self.endpoint.get()
-                if self.custom_url != '':
-                    url = self.custom_url
-                else:
-                    url = u'%s/api/predict/%s' % (domain, self.service_name)
+                domain = self.endpoint.get(failed, route_key)
+                url = self._predict_url(domain)
                 self.logger.debug('Request to url: %s' % url)
-                req_str = req.to_string()
-                if sys.version_info[0] == 3 and isinstance(req_str, str):
-                    req_body = bytearray(req_str, 'utf-8')
+                if self.hedging is not None and self.custom_url == '' and self.endpoint.get_size() > 1:
+                    resp, domain = self._send_hedged(domain, request_headers(), req_body, failed, route_key)
                 else:
-                    req_body = bytearray(req_str)
-                if len(self.token) > 0:
-                    headers.update(self.generate_singaure(req_body))
-                resp = self.connection_pool.request('POST', url,
-                                                    headers=headers,
-                                                    body=req_body,
-                                                    timeout=self.timeout / 1000.0,
-                                                    retries=0)
-                if resp.status / 100 == 5:
+                    resp = self._send(domain, url, request_headers(), req_body)
+                if resp.status // 100 == 5:
+                    failed.add(domain)
                     if i != self.retry_count - 1:
                         continue
                     raise PredictException(resp.status, resp.data)
@@ -229,6 +344,79 @@ class PredictClient:
                 return req.parse_response(resp.data)
             except (MaxRetryError, ProtocolError, HTTPError) as e:
                 self.logger.debug('Request failed, err: %s, retrying', str(e))
+                failed.add(domain)
                 if i != self.retry_count - 1:
                     continue
                 raise PredictException(500, 'url: %s, error: %s' % (url, str(e)))
+
+    def _get_executor(self):
+        if self.executor is None:
+            with self.executor_lock:
+                if self.stop:
+                    raise PredictException(500, 'The client has been destroyed')
+                if self.executor is None:
+                    workers = self.worker_count if self.worker_count > 0 else self.max_connection_count
+                    self.executor = ThreadPoolExecutor(max_workers=workers)
+        return self.executor
+
+    def _submit(self, func, *args):
+        try:
+            return self._get_executor().submit(func, *args)
+        except RuntimeError:
+            # destroy() shut the executor down after it was taken
+            raise PredictException(500, 'The client has been destroyed')
+
+    def predict_async(self, req, callback=None):
+        """
+        Perform the prediction request on the client thread pool without blocking the caller
+        :param req: abstract class of the request
+        :param callback: optional function called with the future once it is done, it runs directly
+                         in the worker thread which performed the request
+        :return: concurrent.futures.Future whose result is the service response
+        """
+        future = self._submit(self.predict, req)
+        if callback is not None:
+            future.add_done_callback(callback)
+        return future
+
+    def _predict_or_exception(self, req):
+        try:
+            return self.predict(req)
+        except Exception as e:
+            return e
+
+    def predict_many_iter(self, requests, concurrency=None):
+        """
+        Perform a batch of prediction requests concurrently on the client thread pool, and yield
+        the results as soon as each of them finishes, a failed request does not affect the others
+        :param requests: iterable of request objects, consumed lazily
+        :param concurrency: max number of requests in flight, no more than max_connection_count
+        :return: generator of (index, response or exception) tuples in order of completion
+        """
+        if concurrency is None or concurrency > self.max_connection_count:
+            concurrency = self.max_connection_count
+        concurrency = max(concurrency, 1)
+        pending = {}
+        for idx, req in enumerate(requests):
+            if len(pending) >= concurrency:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+            pending[self._submit(self._predict_or_exception, req)] = idx
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+
+    def predict_many(self, requests, concurrency=None):
+        """
+        Perform a batch of prediction requests concurrently on the client thread pool
+        :param requests: iterable of request objects
+        :param concurrency: max number of requests in flight, no more than max_connection_count
+        :return: list of responses in the same order of the requests, the item is the raised
+                 exception instead of the response if the related request failed
+        """
+        results = {}
+        for idx, result in self.predict_many_iter(requests, concurrency):
+            results[idx] = result
+        return [results[idx] for idx in range(len(results))]
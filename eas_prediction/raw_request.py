@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from .request import Request
+from .request import Response
+
+
+class RawBytesRequest(Request):
+    """
+    Request contains pre-serialized data, which is sent as it is without copying,
+    the data can be bytes, bytearray, memoryview or any object supporting the buffer
+    protocol, such as a contiguous numpy array
+    """
+    def __init__(self, request_data=None):
+        self.request_data = b'' if request_data is None else request_data
+
+    def __str__(self):
+        return str(self.request_data)
+
+    def to_string(self):
+        """
+        Get the request data to be sent
+        :return: the request data in buffer protocol format
+        """
+        return self.request_data
+
+    def parse_response(self, response_data):
+        """
+        Wrap the given response data to the related RawBytesResponse object
+        :param response_data: the service response data in bytes format
+        :return: the RawBytesResponse object related the request
+        """
+        return RawBytesResponse(response_data)
+
+
+class RawBytesResponse(Response):
+    """
+    Response contains the raw response data in bytes format
+    """
+    def __init__(self, response_data=None):
+        self.response_data = b'' if response_data is None else response_data
+
+    def __str__(self):
+        return str(self.response_data)
+
+    def to_string(self):
+        return self.response_data
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import base64
+import datetime
+import hashlib
+import hmac
+import time
+
+DATE_FORMAT = '%a, %d %b %Y %H:%M:%S GMT'
+
+
+class RequestSigner(object):
+    """
+    Generate the authentication headers for the requests of a service, the hmac state
+    initialized by the token, the static parts of the string to sign and the 'Date'
+    header of the current second are prepared once and shared by all the requests.
+    """
+
+    def __init__(self, token, service_name, content_type, custom_url=''):
+        self.token = token
+        self.content_type = content_type
+        self.custom_url = custom_url
+        self.hmac = hmac.new(token.encode('utf-8'), digestmod=hashlib.sha1)
+        self.content_type_part = '\n%s\n' % content_type
+        self.resource_part = ('\n/api/predict/%s' % service_name).rstrip()
+        self.date_cache = (None, None)
+
+    def current_date(self):
+        """
+        Get the value of the 'Date' header, formatted only once per second
+        :return: the formatted current time
+        """
+        second = int(time.time())
+        cached_second, date = self.date_cache
+        if cached_second != second:
+            date = datetime.datetime.fromtimestamp(second).strftime(DATE_FORMAT)
+            self.date_cache = (second, date)
+        return date
+
+    def sign(self, request_data, content_md5=None, current_time=None):
+        """
+        Generate the authentication headers of a request
+        :param request_data: the request body
+        :param content_md5: md5 hex digest of the request body, computed from request_data if not given
+        :param current_time: value of the 'Date' header, the current time is used if not given
+        :return: dict of the authentication headers
+        """
+        if current_time is None:
+            current_time = self.current_date()
+        if self.custom_url != '':
+            return {
+                'Date': current_time,
+                'Content-Type': self.content_type,
+                'Content-Length': '%d' % len(request_data),
+                'Authorization': self.token
+            }
+
+        if content_md5 is None:
+            content_md5 = hashlib.md5(request_data).hexdigest()
+        auth = 'POST\n' + content_md5 + self.content_type_part + current_time + self.resource_part
+        mac = self.hmac.copy()
+        mac.update(auth.encode('utf-8'))
+        signature = base64.b64encode(mac.digest()).decode()
+
+        return {
+            'Content-MD5': content_md5,
+            'Date': current_time,
+            'Content-Type': self.content_type,
+            'Content-Length': '%d' % len(request_data),
+            'Authorization': 'EAS ' + signature
+        }
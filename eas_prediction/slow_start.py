@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+SLOW_START_LINEAR = 'linear'
+SLOW_START_EXPONENTIAL = 'exponential'
+
+
+class SlowStart(object):
+    """
+    Slow start policy of an Endpoint, a backend added after the endpoint is initialized
+    receives a small share of its weight at first, which ramps up to the full weight in
+    the slow start window, so a cold backend is not flooded before it warms up. The ramp
+    is applied to the weights of the snapshot, so it works with any balancer, and it moves
+    in a fixed count of steps to keep the weighted round robin schedule small.
+    """
+
+    def __init__(self, window=60.0, curve=SLOW_START_LINEAR, min_weight_percent=10, steps=10):
+        """
+        :param window: time in seconds for a new backend to reach its full weight
+        :param curve: SLOW_START_LINEAR or SLOW_START_EXPONENTIAL, the exponential ramp grows by the same
+                      ratio in every step, so the backend stays lightly loaded for most of the window
+        :param min_weight_percent: percent of the full weight a new backend starts with
+        :param steps: count of the steps of the ramp
+        """
+        if curve not in (SLOW_START_LINEAR, SLOW_START_EXPONENTIAL):
+            raise ValueError('Unsupported slow start curve: %s' % curve)
+        self.window = window
+        self.curve = curve
+        self.min_weight_percent = min_weight_percent
+        self.steps = steps
+
+    def get_step(self, elapsed):
+        """
+        Get the step of the ramp of a backend
+        :param elapsed: time in seconds since the backend is added
+        :return: integer from 1 to 'steps', the effective weight is weight * step / steps
+        """
+        if elapsed >= self.window:
+            return self.steps
+        progress = max(elapsed, 0.0) / self.window
+        start = self.min_weight_percent / 100.0
+        if self.curve == SLOW_START_EXPONENTIAL:
+            fraction = start ** (1 - progress)
+        else:
+            fraction = start + (1 - start) * progress
+        return min(max(int(fraction * self.steps + 1e-9), 1), self.steps)
+
+    def get_step_interval(self):
+        """
+        Get the interval in seconds of recomputing the effective weights during the ramp
+        """
+        return float(self.window) / self.steps
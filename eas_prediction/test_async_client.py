@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from .async_client import AsyncPredictClient
+from .string_request import StringRequest
+from .exception import PredictException
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    failures = 0
+
+    def setup(self):
+        super(EchoHandler, self).setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.path.endswith('/flaky') and EchoHandler.failures > 0:
+            EchoHandler.failures -= 1
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path.endswith('/auth'):
+            body = self.headers.get('Authorization', '').encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class AsyncPredictClientTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), EchoHandler)
+        self.server.lock = threading.Lock()
+        self.server.connections = 0
+        self.server.daemon_threads = True
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.endpoint = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _client(self, service_name='echo'):
+        client = AsyncPredictClient(self.endpoint, service_name)
+        client.set_max_connection_count(8)
+        client.init()
+        return client
+
+    def test_predict(self):
+        async def run():
+            async with self._client() as client:
+                return await client.predict(StringRequest('hello'))
+
+        resp = asyncio.run(run())
+        self.assertEqual(resp.response_data, b'hello')
+
+    def test_predict_concurrent_reuse_connections(self):
+        async def run():
+            async with self._client() as client:
+                requests = [StringRequest('req-%d' % i) for i in range(200)]
+                return await asyncio.gather(*[client.predict(req) for req in requests])
+
+        responses = asyncio.run(run())
+        self.assertEqual([r.response_data for r in responses],
+                         [('req-%d' % i).encode('utf-8') for i in range(200)])
+        self.assertLessEqual(self.server.connections, 8)
+
+    def test_predict_retry_on_5xx(self):
+        EchoHandler.failures = 2
+
+        async def run():
+            async with self._client('flaky') as client:
+                return await client.predict(StringRequest('ok'))
+
+        resp = asyncio.run(run())
+        self.assertEqual(resp.response_data, b'ok')
+
+    def test_predict_signature(self):
+        async def run():
+            async with self._client('auth') as client:
+                client.set_token('token')
+                return await client.predict(StringRequest('data'))
+
+        resp = asyncio.run(run())
+        self.assertTrue(resp.response_data.startswith(b'EAS '))
+
+    def test_predict_connection_refused(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+        async def run():
+            async with self._client() as client:
+                client.set_retry_count(2)
+                return await client.predict(StringRequest('data'))
+
+        with self.assertRaises(PredictException):
+            asyncio.run(run())
+
+    def test_malformed_response(self):
+        responses = [b'HTTP/1.1 abc OK\r\nContent-Length: 0\r\n\r\n',
+                     b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\nzz\r\n',
+                     b'HTTP/1.1 200 OK\r\nContent-Length: ten\r\n\r\n']
+        attempts = []
+
+        async def handle(reader, writer):
+            while (await reader.readline()) not in (b'\r\n', b''):
+                pass
+            attempts.append(1)
+            writer.write(responses[(len(attempts) - 1) % len(responses)])
+            await writer.drain()
+            writer.close()
+
+        async def run():
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            client = AsyncPredictClient('http://127.0.0.1:%d' % port, 'echo')
+            client.set_retry_count(3)
+            client.init()
+            try:
+                await client.predict(StringRequest(''))
+            finally:
+                await client.close()
+                server.close()
+
+        with self.assertRaises(PredictException) as context:
+            asyncio.run(run())
+        self.assertEqual(context.exception.code, 500)
+        self.assertEqual(len(attempts), 3)
+
+    def test_sibling_of_predict_client(self):
+        from .predict_client import PredictClient
+        client = self._client()
+        self.assertFalse(isinstance(client, PredictClient))
+        for name in ['predict_async', 'predict_many', 'predict_many_iter', 'set_hedging', 'connection_pool']:
+            self.assertFalse(hasattr(client, name), name)
+        client.destroy()
+
+    def test_wait_ready_without_blocking_loop(self):
+        import logging
+        from .endpoint import Endpoint
+
+        async def run():
+            async with self._client() as client:
+                # backends of the endpoint are set by the event loop, which must keep running
+                # while predict() waits for the endpoint to be ready
+                client.endpoint = Endpoint(logging.getLogger(__name__))
+                port = self.server.server_address[1]
+                asyncio.get_running_loop().call_later(
+                    0.1, client.endpoint.set_endpoints, [({'ip': '127.0.0.1', 'port': port}, 1)])
+                start = time.time()
+                resp = await client.predict(StringRequest('ready'))
+                return resp, time.time() - start
+
+        resp, elapsed = asyncio.run(run())
+        self.assertEqual(resp.response_data, b'ready')
+        self.assertLess(elapsed, 2)
+
+    def test_wait_ready_timeout(self):
+        import logging
+        from .endpoint import Endpoint
+
+        async def run():
+            client = AsyncPredictClient(self.endpoint, 'echo')
+            client.init(ready_timeout=0.2)
+            client.endpoint = Endpoint(logging.getLogger(__name__))
+            start = time.time()
+            try:
+                await client.predict(StringRequest('data'))
+            finally:
+                await client.close()
+            return time.time() - start
+
+        start = time.time()
+        with self.assertRaises(PredictException):
+            asyncio.run(run())
+        self.assertLess(time.time() - start, 2)
+
+    def test_warm_up(self):
+        async def run():
+            async with self._client() as client:
+                await client.warm_up(3, StringRequest('warm'))
+                connections = self.server.connections
+                await asyncio.gather(*[client.predict(StringRequest('req')) for i in range(3)])
+                return connections
+
+        self.assertEqual(asyncio.run(run()), 3)
+        self.assertEqual(self.server.connections, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import logging
+import unittest
+
+from .balancer import P2CBalancer
+from .balancer import PeakEWMABalancer
+from .balancer import RoundRobinBalancer
+from .endpoint import Endpoint
+from .endpoint import EndpointSnapshot
+
+logger = logging.getLogger(__name__)
+
+
+def make_snapshot(weights):
+    return EndpointSnapshot([({'ip': '10.0.0.%d' % i, 'port': 8080}, w) for i, w in enumerate(weights)])
+
+
+class BalancerTestCase(unittest.TestCase):
+
+    def test_round_robin_exclude(self):
+        balancer = RoundRobinBalancer()
+        balancer.update(make_snapshot([1, 1, 1]))
+        picks = set(balancer.pick(exclude={'10.0.0.1:8080'}) for i in range(30))
+        self.assertEqual(picks, {'10.0.0.0:8080', '10.0.0.2:8080'})
+        self.assertEqual(balancer.pick(exclude={'10.0.0.%d:8080' % i for i in range(3)}), None)
+
+    def test_p2c_weighted_when_idle(self):
+        balancer = P2CBalancer()
+        balancer.random.seed(1)
+        balancer.update(make_snapshot([3, 1]))
+        counter = collections.Counter(balancer.pick() for i in range(4000))
+        self.assertTrue(2000 < counter['10.0.0.0:8080'] < 3800)
+
+    def test_p2c_avoids_loaded_backend(self):
+        balancer = P2CBalancer()
+        balancer.random.seed(1)
+        balancer.update(make_snapshot([1, 1, 1, 1]))
+        for i in range(10):
+            balancer.on_start('10.0.0.0:8080')
+        counter = collections.Counter(balancer.pick() for i in range(1000))
+        # the two candidates are distinct, so the loaded backend always loses
+        self.assertLess(counter['10.0.0.0:8080'], 150)
+
+        for i in range(10):
+            balancer.on_finish('10.0.0.0:8080', 0.01, True)
+        self.assertEqual(balancer.outstanding, {})
+
+    def test_p2c_exclude(self):
+        balancer = P2CBalancer()
+        balancer.update(make_snapshot([1, 1, 100]))
+        picks = set(balancer.pick(exclude={'10.0.0.2:8080'}) for i in range(100))
+        self.assertEqual(picks, {'10.0.0.0:8080', '10.0.0.1:8080'})
+        self.assertEqual(balancer.pick(exclude={'10.0.0.%d:8080' % i for i in range(3)}), None)
+
+    def test_p2c_exclude_uses_candidates_of_one_snapshot(self):
+        balancer = P2CBalancer()
+        balancer.update(make_snapshot([1, 1, 1, 1]))
+        # a concurrent update may have swapped the candidates but not yet the snapshot
+        balancer.snapshot = make_snapshot([1])
+        exclude = {'10.0.0.%d:8080' % i for i in range(3)}
+        self.assertEqual(set(balancer.pick(exclude) for i in range(50)), {'10.0.0.3:8080'})
+
+    def _observe(self, balancer, address, latency, success=True):
+        balancer.on_start(address)
+        balancer.on_finish(address, latency, success)
+
+    def test_peak_ewma_avoids_slow_backend(self):
+        balancer = PeakEWMABalancer(decay_time=10.0)
+        balancer.update(make_snapshot([1, 1, 1]))
+        self._observe(balancer, '10.0.0.0:8080', 0.01)
+        self._observe(balancer, '10.0.0.1:8080', 0.01)
+        self._observe(balancer, '10.0.0.2:8080', 0.5)
+        counter = collections.Counter(balancer.pick() for i in range(300))
+        self.assertEqual(counter['10.0.0.2:8080'], 0)
+
+        # the peak is taken immediately, and decays with further fast responses
+        self._observe(balancer, '10.0.0.0:8080', 1.0)
+        self.assertAlmostEqual(balancer.cost('10.0.0.0:8080'), 1.0, delta=0.01)
+
+    def test_peak_ewma_outstanding_and_failures(self):
+        balancer = PeakEWMABalancer(failure_penalty=2.0)
+        balancer.update(make_snapshot([1, 1]))
+        self._observe(balancer, '10.0.0.0:8080', 0.1)
+        self._observe(balancer, '10.0.0.1:8080', 0.1)
+        balancer.on_start('10.0.0.0:8080')
+        balancer.on_start('10.0.0.0:8080')
+        self.assertAlmostEqual(balancer.cost('10.0.0.0:8080') / balancer.cost('10.0.0.1:8080'), 3.0, delta=0.01)
+        self.assertEqual(balancer.pick(), '10.0.0.1:8080')
+
+        self._observe(balancer, '10.0.0.1:8080', 0.001, success=False)
+        self.assertGreater(balancer.cost('10.0.0.1:8080'), 1.9)
+
+    def test_peak_ewma_idle_decay_to_mean(self):
+        balancer = PeakEWMABalancer(decay_time=1.0)
+        balancer.update(make_snapshot([1, 1]))
+        self._observe(balancer, '10.0.0.0:8080', 1.0)
+        for i in range(20):
+            self._observe(balancer, '10.0.0.1:8080', 0.01)
+        # pretend the slow backend has been idle for a long time
+        balancer.stats['10.0.0.0:8080'][1] -= 100
+        self.assertAlmostEqual(balancer.cost('10.0.0.0:8080'), balancer.mean[0], delta=1e-6)
+
+        balancer.update(make_snapshot([1]))
+        self.assertEqual(list(balancer.stats), ['10.0.0.0:8080'])
+
+    def test_endpoint_balancer(self):
+        endpoint = Endpoint(logger)
+        endpoint.set_endpoints([({'ip': '10.0.0.1', 'port': 80}, 1), ({'ip': '10.0.0.2', 'port': 80}, 1)])
+        balancer = P2CBalancer()
+        endpoint.set_balancer(balancer)
+        endpoint.report_start('10.0.0.1:80')
+        self.assertEqual(set(endpoint.get() for i in range(20)), {'10.0.0.2:80'})
+        endpoint.report_finish('10.0.0.1:80', 0.01, True)
+        self.assertEqual(balancer.outstanding, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
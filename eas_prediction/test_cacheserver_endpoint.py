@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from .cacheserver_endpoint import CacheServerEndpoint
+
+logger = logging.getLogger(__name__)
+
+
+class StubCacheServerHandler(BaseHTTPRequestHandler):
+    """
+    Stub of the service discovery api of the cache server, supporting conditional requests if 'etag' is set
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        items = [{'ip': '10.0.0.%d' % i, 'port': 80, 'weight': 100} for i in range(server.backends)]
+        etag = '"%d"' % server.backends if server.etag else None
+        if etag is not None and self.headers.get('If-None-Match') == etag:
+            server.not_modified += 1
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = json.dumps({'endpoints': {'items': items}}).encode('utf-8')
+        if server.malformed:
+            body = body[:len(body) // 2]
+        self.send_response(200)
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CacheServerEndpointTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubCacheServerHandler)
+        self.server.daemon_threads = True
+        self.server.backends = 2
+        self.server.etag = True
+        self.server.not_modified = 0
+        self.server.malformed = False
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.endpoint = CacheServerEndpoint('127.0.0.1:%d' % self.server.server_address[1], 'echo', logger)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_conditional_request(self):
+        self.assertEqual(len(self.endpoint.fetch()), 2)
+        self.assertEqual(self.endpoint.etag, '"2"')
+        self.assertEqual(len(self.endpoint.fetch()), 2)
+        self.assertEqual(self.server.not_modified, 1)
+
+        self.server.backends = 3
+        self.assertEqual(len(self.endpoint.fetch()), 3)
+        self.assertEqual(self.endpoint.etag, '"3"')
+
+    def test_malformed_response(self):
+        self.assertEqual(len(self.endpoint.fetch()), 2)
+        self.server.backends = 3
+        self.server.malformed = True
+        self.assertIsNone(self.endpoint.fetch())
+        # the etag of the malformed response is not kept, so its fixed version is fetched again
+        self.assertEqual(self.endpoint.etag, '"2"')
+        self.server.malformed = False
+        self.assertEqual(len(self.endpoint.fetch()), 3)
+        self.assertEqual(self.endpoint.etag, '"3"')
+        self.assertEqual(self.server.not_modified, 0)
+
+    def test_unchanged_body(self):
+        self.server.etag = False
+        endpoints = self.endpoint.fetch()
+        self.assertEqual(len(endpoints), 2)
+        self.assertIs(self.endpoint.fetch(), endpoints)
+        self.assertEqual(self.server.not_modified, 0)
+
+        self.server.backends = 1
+        self.endpoint.sync()
+        self.assertEqual(self.endpoint.get(), '10.0.0.0:80')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from .connection_pool import ManagedPoolManager
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), EchoHandler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.delay = 0
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+class ManagedPoolManagerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = start_server()
+        self.host = '127.0.0.1:%d' % self.server.server_address[1]
+        self.url = 'http://%s/' % self.host
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_reuse(self):
+        http = ManagedPoolManager(maxsize=2)
+        for i in range(5):
+            self.assertEqual(http.request('GET', self.url).data, b'ok')
+        self.assertEqual(http.get_stats(), {self.host: {'created': 1, 'reused': 4, 'evicted': 0, 'waiting': 0}})
+        self.assertEqual(self.server.connections, 1)
+
+    def test_prewarm(self):
+        http = ManagedPoolManager(maxsize=4)
+        self.assertEqual(http.prewarm(self.url, 3), 3)
+        self.assertEqual(http.prewarm(self.url, 8), 1)
+        self.assertEqual(http.get_stats()[self.host], {'created': 4, 'reused': 0, 'evicted': 0, 'waiting': 0})
+        for i in range(4):
+            http.request('GET', self.url)
+        self.assertEqual(http.get_stats()[self.host]['reused'], 4)
+        self.assertEqual(self.server.connections, 4)
+
+    def test_prewarm_counts_connections_in_use(self):
+        http = ManagedPoolManager(maxsize=3)
+        self.server.delay = 0.2
+        thread = threading.Thread(target=http.request, args=('GET', self.url))
+        thread.start()
+        time.sleep(0.1)
+        # the connection of the request in flight is counted in, no connection is opened beyond the pool
+        self.assertEqual(http.prewarm(self.url, 8), 2)
+        self.assertEqual(http.prewarm(self.url, 8), 0)
+        thread.join()
+        self.assertEqual(http.get_stats()[self.host]['created'], 3)
+        self.assertEqual(http.connection_from_url(self.url).pool.qsize(), 3)
+        self.assertEqual(self.server.connections, 3)
+
+    def test_max_pools(self):
+        servers = [start_server() for i in range(4)]
+        try:
+            hosts = ['127.0.0.1:%d' % server.server_address[1] for server in servers]
+            http = ManagedPoolManager(maxsize=2, max_pools=3)
+            pools = [http.connection_from_url('http://%s/' % host) for host in hosts[:3]]
+            http.request('GET', 'http://%s/' % hosts[0])
+            http.request('GET', 'http://%s/' % hosts[3])
+            # the least recently used pool is closed
+            self.assertEqual(len(http.managed_pools), 3)
+            self.assertTrue(pools[1].pool is None)
+            self.assertTrue(pools[0].pool is not None)
+            self.assertTrue(pools[2].pool is not None)
+        finally:
+            for server in servers:
+                server.shutdown()
+                server.server_close()
+
+    def test_many_hosts(self):
+        servers = [start_server() for i in range(15)]
+        try:
+            hosts = ['127.0.0.1:%d' % server.server_address[1] for server in servers]
+            http = ManagedPoolManager(maxsize=2)
+            for i in range(3):
+                for host in hosts:
+                    self.assertEqual(http.request('GET', 'http://%s/' % host).data, b'ok')
+            stats = http.get_stats()
+            for host, server in zip(hosts, servers):
+                self.assertEqual(stats[host], {'created': 1, 'reused': 2, 'evicted': 0, 'waiting': 0})
+                self.assertEqual(server.connections, 1)
+
+            # the pools of the hosts which are gone are closed, the others keep their connections
+            pool = http.connection_from_url('http://%s/' % hosts[0])
+            http.retain(set(hosts[1:]))
+            self.assertEqual(len(http.managed_pools), 14)
+            self.assertTrue(pool.pool is None)
+            http.request('GET', 'http://%s/' % hosts[1])
+            self.assertEqual(http.get_stats()[hosts[1]]['reused'], 3)
+            http.clear()
+            self.assertEqual(len(http.managed_pools), 0)
+        finally:
+            for server in servers:
+                server.shutdown()
+                server.server_close()
+
+    def test_max_lifetime(self):
+        http = ManagedPoolManager(max_lifetime=0.05, maxsize=2)
+        http.request('GET', self.url)
+        http.request('GET', self.url)
+        time.sleep(0.06)
+        http.request('GET', self.url)
+        self.assertEqual(http.get_stats()[self.host], {'created': 2, 'reused': 1, 'evicted': 1, 'waiting': 0})
+        self.assertEqual(self.server.connections, 2)
+
+    def test_idle_timeout(self):
+        http = ManagedPoolManager(idle_timeout=0.05, maxsize=2)
+        http.request('GET', self.url)
+        http.request('GET', self.url)
+        self.assertEqual(http.get_stats()[self.host]['evicted'], 0)
+        time.sleep(0.06)
+        http.request('GET', self.url)
+        self.assertEqual(http.get_stats()[self.host], {'created': 2, 'reused': 1, 'evicted': 1, 'waiting': 0})
+
+    def test_blocking_pool(self):
+        http = ManagedPoolManager(maxsize=1, block=True)
+        self.server.delay = 0.1
+        waiting = []
+
+        def run():
+            http.request('GET', self.url)
+
+        threads = [threading.Thread(target=run) for i in range(3)]
+        for t in threads:
+            t.start()
+        time.sleep(0.05)
+        waiting.append(http.get_stats()[self.host]['waiting'])
+        for t in threads:
+            t.join()
+        self.assertEqual(waiting, [2])
+        self.assertEqual(http.get_stats()[self.host], {'created': 1, 'reused': 2, 'evicted': 0, 'waiting': 0})
+        self.assertEqual(self.server.connections, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
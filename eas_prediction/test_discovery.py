@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import unittest
+
+from .discovery import DiscoveryRegistry
+from .endpoint import Endpoint
+
+logger = logging.getLogger(__name__)
+
+KEY = ('DIRECT', '127.0.0.1:8080', 'echo')
+
+
+class FakeEndpoint(Endpoint):
+    def __init__(self, backends):
+        super(FakeEndpoint, self).__init__(logger)
+        self.backends = backends
+        self.fetched = threading.Event()
+        self.fetches = 0
+        self.updates = 0
+        self.renewals = 0
+
+    def fetch(self):
+        self.fetches += 1
+        self.fetched.set()
+        return self.backends
+
+    def set_endpoints(self, endpoints):
+        self.updates += 1
+        super(FakeEndpoint, self).set_endpoints(endpoints)
+
+    def renew_cache(self):
+        self.renewals += 1
+        super(FakeEndpoint, self).renew_cache()
+
+
+class DiscoveryRegistryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = DiscoveryRegistry(interval=0.01)
+        self.backends = [({'ip': '10.0.0.1', 'port': 80}, 1)]
+
+    def test_shared_refresher(self):
+        first = FakeEndpoint(self.backends)
+        second = FakeEndpoint(self.backends)
+        self.registry.subscribe(KEY, first)
+        self.assertTrue(first.wait_ready(5))
+        self.registry.subscribe(KEY, second)
+        self.assertTrue(second.wait_ready(0))
+        self.assertEqual(self.registry.get_subscriber_count(KEY), 2)
+
+        first.fetched.clear()
+        self.assertTrue(first.fetched.wait(5))
+        self.assertEqual(second.fetches, 0)
+        # unchanged backends are not pushed to the subscribers again
+        self.assertEqual(first.updates, 1)
+        self.assertEqual(second.updates, 1)
+        # but the subscribers are told that they are confirmed, to renew their cache
+        first.fetched.clear()
+        self.assertTrue(first.fetched.wait(5))
+        self.assertGreater(second.renewals, 0)
+
+        self.registry.unsubscribe(KEY, first)
+        self.assertTrue(second.fetched.wait(5))
+        self.registry.unsubscribe(KEY, second)
+        self.assertEqual(self.registry.get_subscriber_count(KEY), 0)
+
+    def test_subscriber_error(self):
+        class BrokenEndpoint(FakeEndpoint):
+            broken = False
+
+            def set_endpoints(self, endpoints):
+                if self.broken:
+                    raise ValueError('broken subscriber')
+                super(BrokenEndpoint, self).set_endpoints(endpoints)
+
+            def renew_cache(self):
+                if self.broken:
+                    raise ValueError('broken subscriber')
+                super(BrokenEndpoint, self).renew_cache()
+
+        first = FakeEndpoint(self.backends)
+        broken = BrokenEndpoint(self.backends)
+        second = FakeEndpoint(self.backends)
+        self.registry.subscribe(KEY, first)
+        self.assertTrue(first.wait_ready(5))
+        self.registry.subscribe(KEY, broken)
+        self.registry.subscribe(KEY, second)
+        broken.broken = True
+
+        # the refresher keeps running and updating the subscribers after the broken one
+        first.backends = self.backends + [({'ip': '10.0.0.2', 'port': 80}, 1)]
+        for _ in range(500):
+            if second.get_size() == 2 and second.renewals > 0:
+                break
+            first.fetched.clear()
+            first.fetched.wait(1)
+        self.assertEqual(second.get_size(), 2)
+        self.assertGreater(second.renewals, 0)
+
+        for endpoint in (first, broken, second):
+            self.registry.unsubscribe(KEY, endpoint)
+
+    def test_fetch_error(self):
+        first = FakeEndpoint(None)
+        fetch = first.fetch
+
+        def broken_fetch():
+            fetch()
+            if first.fetches == 1:
+                raise ValueError('broken fetch')
+            return self.backends
+        first.fetch = broken_fetch
+        self.registry.subscribe(KEY, first)
+        self.assertTrue(first.wait_ready(5))
+        self.assertGreater(first.fetches, 1)
+        self.registry.unsubscribe(KEY, first)
+
+    def test_notify_on_change(self):
+        first = FakeEndpoint(self.backends)
+        second = FakeEndpoint(self.backends)
+        self.registry.subscribe(KEY, first)
+        self.registry.subscribe(KEY, second)
+        self.assertTrue(second.wait_ready(5))
+
+        first.backends = self.backends + [({'ip': '10.0.0.2', 'port': 80}, 1)]
+        for _ in range(500):
+            if second.get_size() == 2:
+                break
+            first.fetched.clear()
+            first.fetched.wait(5)
+        self.assertEqual(second.get_size(), 2)
+        self.registry.unsubscribe(KEY, first)
+        self.registry.unsubscribe(KEY, second)
+
+    def test_stop_without_subscribers(self):
+        endpoint = FakeEndpoint(None)
+        self.registry.subscribe(KEY, endpoint)
+        self.assertTrue(endpoint.fetched.wait(5))
+        thread = self.registry.entries[KEY].thread
+        self.registry.unsubscribe(KEY, endpoint)
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(endpoint.wait_ready(0))
+        self.assertTrue(KEY not in self.registry.entries)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import logging
+import random
+import threading
+import time
+import unittest
+
+from .endpoint import Endpoint
+from .endpoint import EndpointSnapshot
+from .exception import PredictException
+
+logger = logging.getLogger(__name__)
+
+
+def make_endpoints(weights):
+    return [({'ip': '10.0.0.%d' % i, 'port': 8080}, w) for i, w in enumerate(weights)]
+
+
+class EndpointTestCase(unittest.TestCase):
+
+    def test_weighted_distribution(self):
+        endpoint = Endpoint(logger)
+        endpoint.set_endpoints(make_endpoints([3, 1, 2]))
+        counter = collections.Counter(endpoint.get() for i in range(600))
+        self.assertEqual(counter['10.0.0.0:8080'], 300)
+        self.assertEqual(counter['10.0.0.1:8080'], 100)
+        self.assertEqual(counter['10.0.0.2:8080'], 200)
+
+    def test_snapshot_replaced_on_change(self):
+        endpoint = Endpoint(logger)
+        endpoint.set_endpoints(make_endpoints([1, 1]))
+        snapshot = endpoint.snapshot
+        endpoint.set_endpoints(list(reversed(make_endpoints([1, 1]))))
+        self.assertTrue(endpoint.snapshot is snapshot)
+        endpoint.set_endpoints(make_endpoints([1]))
+        self.assertFalse(endpoint.snapshot is snapshot)
+        self.assertEqual(set(endpoint.get() for i in range(10)), {'10.0.0.0:8080'})
+        self.assertEqual(endpoint.get_size(), 1)
+
+    def test_no_backend(self):
+        endpoint = Endpoint(logger)
+        endpoint.set_endpoints(make_endpoints([0, 0]))
+        with self.assertRaises(PredictException):
+            endpoint.get()
+
+    def test_instances_do_not_share_state(self):
+        first = Endpoint(logger)
+        second = Endpoint(logger)
+        first.set_endpoints(make_endpoints([1]))
+        self.assertTrue(second.snapshot is None)
+
+    def test_get_waits_for_endpoints(self):
+        endpoint = Endpoint(logger)
+        timer = threading.Timer(0.05, endpoint.set_endpoints, args=(make_endpoints([1]),))
+        timer.start()
+        self.assertEqual(endpoint.get(), '10.0.0.0:8080')
+        self.assertTrue(endpoint.wait_ready(0))
+
+    def test_concurrent_get(self):
+        endpoint = Endpoint(logger)
+        endpoint.set_endpoints(make_endpoints([5, 3]))
+        counter = collections.Counter()
+        lock = threading.Lock()
+
+        def run():
+            local = collections.Counter(endpoint.get() for i in range(800))
+            with lock:
+                counter.update(local)
+
+        threads = [threading.Thread(target=run) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(counter['10.0.0.0:8080'], 4000)
+        self.assertEqual(counter['10.0.0.1:8080'], 2400)
+
+    def test_large_schedule_bounded(self):
+        from .endpoint import MAX_SCHEDULE_SIZE
+        rnd = random.Random(7)
+        weights = [rnd.randint(1, 100) for i in range(500)]
+        endpoints = [({'ip': '10.0.%d.%d' % (i // 256, i % 256), 'port': 8080}, w) for i, w in enumerate(weights)]
+        start = time.time()
+        snapshot = EndpointSnapshot(endpoints)
+        self.assertLess(time.time() - start, 0.5)
+        self.assertLessEqual(len(snapshot.schedule), MAX_SCHEDULE_SIZE + len(endpoints))
+        counter = collections.Counter(snapshot.schedule)
+        self.assertEqual(len(counter), len(endpoints))
+        scale = float(MAX_SCHEDULE_SIZE) / sum(weights)
+        for ep, weight in endpoints:
+            self.assertLess(abs(counter['%s:8080' % ep['ip']] - weight * scale), 1)
+
+    def test_zone_aware(self):
+        endpoints = make_endpoints([1, 1, 1, 1])
+        for i, ep in enumerate(endpoints):
+            ep[0]['zone'] = 'zone-a' if i < 2 else 'zone-b'
+        endpoint = Endpoint(logger)
+        endpoint.set_zone('zone-a', min_healthy_percent=50)
+        endpoint.set_endpoints(endpoints)
+        self.assertEqual(set(endpoint.get() for i in range(10)), {'10.0.0.0:8080', '10.0.0.1:8080'})
+        # half of the zone is still healthy, but it has only a third of the capacity left,
+        # so a third of the requests spill over to the other zone
+        counter = collections.Counter(endpoint.get({'10.0.0.0:8080'}) for i in range(3000))
+        self.assertEqual(set(counter), {'10.0.0.1:8080', '10.0.0.2:8080', '10.0.0.3:8080'})
+        self.assertTrue(1800 < counter['10.0.0.1:8080'] < 2200, counter)
+
+        endpoint.set_zone('zone-a', min_healthy_percent=60)
+        self.assertEqual(set(endpoint.get({'10.0.0.0:8080'}) for i in range(10)),
+                         {'10.0.0.1:8080', '10.0.0.2:8080', '10.0.0.3:8080'})
+
+        endpoint.set_zone('zone-c')
+        self.assertEqual(len(set(endpoint.get() for i in range(10))), 4)
+
+    def test_zone_aware_uneven_split(self):
+        endpoints = make_endpoints([1] * 20)
+        for i, ep in enumerate(endpoints):
+            ep[0]['zone'] = 'zone-a' if i == 0 else 'zone-b'
+        endpoint = Endpoint(logger)
+        endpoint.set_zone('zone-a')
+        endpoint.set_endpoints(endpoints)
+        # the local zone has a tenth of the fair share of a zone, so it takes a tenth of the requests
+        counter = collections.Counter(endpoint.get() for i in range(10000))
+        self.assertEqual(len(counter), 20)
+        self.assertTrue(800 < counter['10.0.0.0:8080'] < 1200, counter['10.0.0.0:8080'])
+
+        # a local zone with its fair share takes all the requests
+        endpoints = make_endpoints([1] * 20)
+        for i, ep in enumerate(endpoints):
+            ep[0]['zone'] = 'zone-a' if i < 10 else 'zone-b'
+        endpoint.set_endpoints(endpoints)
+        self.assertEqual(set(endpoint.get() for i in range(100)), set('10.0.0.%d:8080' % i for i in range(10)))
+
+    def test_zone_metadata_change(self):
+        from .endpoint import endpoint_host
+        self.assertEqual(endpoint_host({'ip': '10.0.0.0', 'port': 80, 'metadata': {'zone': 'zone-a'}}),
+                         {'ip': '10.0.0.0', 'port': 80, 'zone': 'zone-a'})
+        self.assertEqual(endpoint_host({'ip': '10.0.0.0', 'port': 80, 'valid': True}),
+                         {'ip': '10.0.0.0', 'port': 80})
+
+        endpoint = Endpoint(logger)
+        endpoint.set_zone('zone-a')
+        endpoint.set_endpoints(make_endpoints([1, 1]))
+        self.assertEqual(len(set(endpoint.get() for i in range(10))), 2)
+        endpoints = make_endpoints([1, 1])
+        endpoints[1][0]['zone'] = 'zone-a'
+        endpoint.set_endpoints(endpoints)
+        self.assertEqual(set(endpoint.get() for i in range(10)), {'10.0.0.1:8080'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from .endpoint import Endpoint
+from .endpoint_cache import EndpointCache
+
+logger = logging.getLogger(__name__)
+
+KEY = ('DIRECT', 'http://127.0.0.1:8080', 'echo/v1')
+BACKENDS = [({'ip': '10.0.0.%d' % i, 'port': 80}, 100) for i in range(3)]
+
+
+class EndpointCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_save_load(self):
+        cache = EndpointCache(os.path.join(self.cache_dir, 'endpoints'), max_age=60)
+        self.assertEqual(cache.load(KEY), None)
+        cache.save(KEY, BACKENDS, now=100)
+        self.assertEqual(cache.load(KEY, now=150), BACKENDS)
+        self.assertEqual(cache.load(KEY, now=161), None)
+        self.assertEqual(os.listdir(cache.cache_dir), [os.path.basename(cache.path(KEY))])
+
+    def test_corrupted_file(self):
+        cache = EndpointCache(self.cache_dir)
+        with open(cache.path(KEY), 'w') as f:
+            f.write('{"updated": ')
+        self.assertEqual(cache.load(KEY), None)
+
+    def test_endpoint_preload(self):
+        cache = EndpointCache(self.cache_dir, max_age=60)
+        endpoint = Endpoint(logger)
+        endpoint.set_cache(cache, KEY)
+        self.assertFalse(endpoint.preload())
+        endpoint.set_endpoints(BACKENDS)
+        self.assertEqual(cache.load(KEY), BACKENDS)
+
+        endpoint = Endpoint(logger)
+        endpoint.set_cache(cache, KEY)
+        self.assertTrue(endpoint.preload())
+        self.assertTrue(endpoint.wait_ready(0))
+        self.assertEqual(endpoint.get_size(), 3)
+
+        # backends confirmed by the service discovery renew the age of the cache
+        cache.save(KEY, BACKENDS, now=0)
+        endpoint.set_endpoints(BACKENDS)
+        self.assertEqual(cache.load(KEY), BACKENDS)
+        endpoint.set_endpoints([])
+        self.assertEqual(cache.load(KEY), BACKENDS)
+
+    def test_unchanged_backends_renew_cache(self):
+        cache = EndpointCache(self.cache_dir, max_age=60, renew_interval=0)
+        endpoint = Endpoint(logger)
+        endpoint.set_cache(cache, KEY)
+        endpoint.set_endpoints(BACKENDS)
+        cache.save(KEY, BACKENDS, now=0)
+        endpoint.set_endpoints(BACKENDS)
+        self.assertEqual(cache.load(KEY), BACKENDS)
+
+        cache.save(KEY, BACKENDS, now=0)
+        endpoint.renew_cache()
+        self.assertEqual(cache.load(KEY), BACKENDS)
+
+        # the renewal is rate limited
+        cache.renew_interval = 60
+        cache.save(KEY, BACKENDS, now=0)
+        endpoint.renew_cache()
+        self.assertEqual(cache.load(KEY), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
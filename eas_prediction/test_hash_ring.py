@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import logging
+import unittest
+
+from .endpoint import Endpoint
+from .endpoint import EndpointSnapshot
+from .hash_ring import ConsistentHashRing
+
+logger = logging.getLogger(__name__)
+
+
+def make_endpoints(weights):
+    return [({'ip': '10.0.0.%d' % i, 'port': 8080}, w) for i, w in enumerate(weights)]
+
+
+class ConsistentHashRingTestCase(unittest.TestCase):
+
+    def _ring(self, weights, **kwargs):
+        ring = ConsistentHashRing(**kwargs)
+        ring.update(EndpointSnapshot(make_endpoints(weights)))
+        return ring
+
+    def test_same_key_same_backend(self):
+        ring = self._ring([1, 1, 1])
+        for key in ['user-%d' % i for i in range(100)]:
+            self.assertEqual(len(set(ring.pick(key) for i in range(5))), 1)
+        self.assertEqual(ring.pick(12345), ring.pick('12345'))
+
+    def test_weighted_distribution(self):
+        ring = self._ring([1, 3])
+        counter = collections.Counter(ring.pick('user-%d' % i) for i in range(10000))
+        share = counter['10.0.0.1:8080'] / 10000.0
+        self.assertTrue(0.65 < share < 0.85, share)
+
+    def test_minimal_movement(self):
+        ring = self._ring([1, 1, 1, 1])
+        keys = ['user-%d' % i for i in range(10000)]
+        before = dict((key, ring.pick(key)) for key in keys)
+        nodes = dict(ring.nodes)
+        ring.update(EndpointSnapshot(make_endpoints([1, 1, 1, 1, 1])))
+        for address in nodes:
+            self.assertEqual(ring.nodes[address], nodes[address])
+        moved = [key for key in keys if ring.pick(key) != before[key]]
+        self.assertTrue(len(moved) < 0.3 * len(keys), len(moved))
+        for key in moved:
+            self.assertEqual(ring.pick(key), '10.0.0.4:8080')
+
+    def test_bounded_load(self):
+        ring = self._ring([1, 1, 1, 1], load_factor=1.25)
+        owner = ring.pick('hot')
+        picks = []
+        for i in range(20):
+            address = ring.pick('hot')
+            ring.on_start(address)
+            picks.append(address)
+        counter = collections.Counter(picks)
+        self.assertEqual(counter.most_common(1)[0][0], owner)
+        self.assertTrue(max(counter.values()) <= 7, counter)
+        for address in picks:
+            ring.on_finish(address, 0.01, True)
+        self.assertEqual(ring.total_outstanding, 0)
+        self.assertEqual(ring.pick('hot'), owner)
+
+    def test_exclude(self):
+        ring = self._ring([1, 1])
+        owner = ring.pick('key')
+        self.assertNotEqual(ring.pick('key', {owner}), owner)
+        self.assertEqual(ring.pick('key', {'10.0.0.0:8080', '10.0.0.1:8080'}), None)
+
+    def test_endpoint_route_key(self):
+        endpoint = Endpoint(logger)
+        endpoint.set_endpoints(make_endpoints([1, 1, 1]))
+        address = endpoint.get(route_key='user-1')
+        self.assertEqual(set(endpoint.get(route_key='user-1') for i in range(10)), {address})
+        self.assertNotEqual(endpoint.get({address}, route_key='user-1'), address)
+        self.assertEqual(len(set(endpoint.get() for i in range(3))), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
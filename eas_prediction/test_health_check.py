@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from urllib3 import PoolManager
+
+from .endpoint import Endpoint
+from .health_check import HealthChecker
+
+logger = logging.getLogger(__name__)
+
+
+class HealthHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.probes.append(self.path)
+        self.send_response(200 if self.server.healthy else 503)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HealthCheckerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), HealthHandler)
+        self.server.daemon_threads = True
+        self.server.healthy = True
+        self.server.probes = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.address = '127.0.0.1:%d' % self.server.server_address[1]
+        self.endpoint = Endpoint(logger)
+        self.endpoint.set_endpoints([({'ip': '127.0.0.1', 'port': self.server.server_address[1]}, 1),
+                                     ({'ip': '127.0.0.1', 'port': 1}, 1)])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_hysteresis(self):
+        checker = HealthChecker(unhealthy_threshold=2, healthy_threshold=3)
+        checker.record('a', False)
+        checker.record('a', True)
+        checker.record('a', False)
+        self.assertEqual(checker.get_unhealthy(), frozenset())
+        checker.record('a', False)
+        self.assertEqual(checker.get_unhealthy(), frozenset(['a']))
+        checker.record('a', True)
+        checker.record('a', True)
+        self.assertEqual(checker.get_unhealthy(), frozenset(['a']))
+        checker.record('a', True)
+        self.assertEqual(checker.get_unhealthy(), frozenset())
+
+    def test_check(self):
+        checker = HealthChecker(path='healthz', unhealthy_threshold=1, healthy_threshold=1, concurrency=2)
+        self.endpoint.set_health_checker(checker)
+        checker.start(self.endpoint, PoolManager())
+        deadline = time.time() + 5
+        while (len(checker.get_unhealthy()) == 0 or len(self.server.probes) == 0) and time.time() < deadline:
+            time.sleep(0.01)
+        checker.stop()
+        self.assertEqual(checker.get_unhealthy(), frozenset(['127.0.0.1:1']))
+        self.assertEqual(self.server.probes[0], '/healthz')
+        self.assertEqual(set(self.endpoint.get() for i in range(10)), {self.address})
+
+        self.server.healthy = False
+        checker.start(self.endpoint, PoolManager())
+        deadline = time.time() + 5
+        while len(checker.get_unhealthy()) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        checker.stop()
+        # every backend is unhealthy, fall back to all of them
+        self.assertEqual(len(set(self.endpoint.get() for i in range(10))), 2)
+
+        self.endpoint.set_endpoints([({'ip': '127.0.0.1', 'port': 1}, 1)])
+        self.assertEqual(checker.get_unhealthy(), frozenset(['127.0.0.1:1']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import unittest
+
+from .endpoint import Endpoint
+from .endpoint import EndpointSnapshot
+from .outlier_detection import OutlierDetector
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = [({'ip': '10.0.0.%d' % i, 'port': 80}, 1) for i in range(4)]
+
+
+class OutlierDetectorTestCase(unittest.TestCase):
+
+    def _detector(self, **kwargs):
+        detector = OutlierDetector(**kwargs)
+        detector.update(EndpointSnapshot(BACKENDS))
+        return detector
+
+    def test_consecutive_failures(self):
+        detector = self._detector(consecutive_failures=3)
+        for i in range(2):
+            detector.record('10.0.0.0:80', False, now=100)
+        detector.record('10.0.0.0:80', True, now=100)
+        for i in range(2):
+            detector.record('10.0.0.0:80', False, now=100)
+        self.assertEqual(detector.get_ejected(now=100), frozenset())
+        detector.record('10.0.0.0:80', False, now=100)
+        self.assertEqual(detector.get_ejected(now=100), frozenset(['10.0.0.0:80']))
+
+    def test_error_rate(self):
+        detector = self._detector(consecutive_failures=100, error_rate=0.5, error_rate_min_requests=10,
+                                  error_rate_window=5)
+        for i in range(10):
+            detector.record('10.0.0.1:80', i % 2 == 0, now=100)
+        self.assertEqual(detector.get_ejected(now=100), frozenset(['10.0.0.1:80']))
+
+        # the failures out of the window are not counted
+        detector.record('10.0.0.2:80', False, now=100)
+        for i in range(9):
+            detector.record('10.0.0.2:80', i % 2 == 0, now=106)
+        self.assertEqual(detector.get_ejected(now=106), frozenset(['10.0.0.1:80']))
+
+    def test_exponential_readmission(self):
+        detector = self._detector(consecutive_failures=1, base_ejection_time=10, max_ejection_time=25)
+        detector.record('10.0.0.0:80', False, now=100)
+        self.assertTrue('10.0.0.0:80' in detector.get_ejected(now=109))
+        self.assertFalse('10.0.0.0:80' in detector.get_ejected(now=110))
+
+        detector.record('10.0.0.0:80', False, now=111)
+        self.assertTrue('10.0.0.0:80' in detector.get_ejected(now=130))
+        self.assertFalse('10.0.0.0:80' in detector.get_ejected(now=131))
+
+        detector.record('10.0.0.0:80', False, now=131)
+        self.assertTrue('10.0.0.0:80' in detector.get_ejected(now=155))
+        self.assertFalse('10.0.0.0:80' in detector.get_ejected(now=156))
+
+        # every healthy period of the base ejection time halves the next ejection time back
+        detector.record('10.0.0.0:80', True, now=170)
+        detector.record('10.0.0.0:80', True, now=180)
+        detector.record('10.0.0.0:80', False, now=181)
+        self.assertTrue('10.0.0.0:80' in detector.get_ejected(now=200))
+        self.assertFalse('10.0.0.0:80' in detector.get_ejected(now=201))
+
+    def test_max_ejection_percent(self):
+        detector = self._detector(consecutive_failures=1, max_ejection_percent=50)
+        for i in range(4):
+            detector.record('10.0.0.%d:80' % i, False, now=100)
+        self.assertEqual(len(detector.get_ejected(now=100)), 2)
+
+    def test_endpoint_skips_ejected(self):
+        endpoint = Endpoint(logger)
+        endpoint.set_endpoints(BACKENDS)
+        endpoint.set_outlier_detector(OutlierDetector(consecutive_failures=2, max_ejection_percent=100))
+        for i in range(2):
+            endpoint.report_finish('10.0.0.3:80', 0.01, False)
+        self.assertFalse('10.0.0.3:80' in set(endpoint.get() for i in range(20)))
+        self.assertFalse('10.0.0.2:80' in set(endpoint.get(exclude={'10.0.0.2:80'}) for i in range(20)))
+
+        for address in ['10.0.0.0:80', '10.0.0.1:80', '10.0.0.2:80']:
+            endpoint.report_finish(address, 0.01, False)
+            endpoint.report_finish(address, 0.01, False)
+        # every backend is ejected, the endpoint still returns one of them
+        self.assertTrue(endpoint.get() in ['10.0.0.%d:80' % i for i in range(4)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,13 +6,22 @@ import unittest
 from .predict_client import PredictClient
 from .predict_client import ENDPOINT_TYPE_VIPSERVER
 from .predict_client import ENDPOINT_TYPE_DIRECT
+from .discovery import DiscoveryRegistry
 from .string_request import StringRequest
+from .raw_request import RawBytesRequest
 from .tf_request import TFRequest
 from .torch_request import TorchRequest
 from .exception import PredictException
 
 import os
+import json
+import shutil
+import tempfile
 import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
 logging.basicConfig(level = logging.ERROR,format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
@@ -114,5 +123,435 @@ class PredictClientTestCase(unittest.TestCase):
         endpoint.get()
 
 
+class RequestSignerTestCase(unittest.TestCase):
+
+    def test_signature(self):
+        import base64
+        import hashlib
+        import hmac
+        from .signer import RequestSigner
+
+        body = b'{"a": 1}'
+        date = 'Mon, 01 Jan 2024 00:00:00 GMT'
+        auth = 'POST\n%s\napplication/json\n%s\n/api/predict/echo' % (hashlib.md5(body).hexdigest(), date)
+        expected = base64.b64encode(hmac.new(b'token', auth.encode('utf-8'), hashlib.sha1).digest()).decode()
+
+        signer = RequestSigner('token', 'echo', 'application/json')
+        headers = signer.sign(body, current_time=date)
+        self.assertEqual(headers['Authorization'], 'EAS ' + expected)
+        self.assertEqual(headers['Content-Length'], '%d' % len(body))
+        self.assertEqual(signer.sign(body, current_time=date), headers)
+
+        headers = RequestSigner('token', 'echo', 'application/json', 'http://custom').sign(body)
+        self.assertEqual(headers['Authorization'], 'token')
+
+    def test_client_signer_follows_settings(self):
+        client = PredictClient('http://127.0.0.1', 'echo')
+        client.set_token('token1')
+        first = client.generate_singaure(b'data', current_time='now')
+        self.assertEqual(client.generate_singaure(b'data', current_time='now'), first)
+        client.set_token('token2')
+        self.assertNotEqual(client.generate_singaure(b'data', current_time='now'), first)
+
+
+class LocalHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        # service discovery api, returns the server itself as the only backend
+        host, port = self.server.server_address
+        self.server.discovery_requests = getattr(self.server, 'discovery_requests', 0) + 1
+        body = json.dumps({'endpoints': {'items': [{'ip': host, 'port': port, 'weight': 100}]}}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.posts = getattr(self.server, 'posts', 0) + 1
+        time.sleep(getattr(self.server, 'delay', 0))
+        if body == b'fail':
+            self.send_response(400)
+            body = b'bad request'
+        elif body.startswith(b'header:'):
+            self.send_response(200)
+            body = self.headers.get(body[7:].decode('utf-8').strip(), '').encode('utf-8')
+        elif body == b'unavailable':
+            self.send_response(503)
+            body = b'service unavailable'
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalPredictClientTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), LocalHandler)
+        self.server.daemon_threads = True
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.client = PredictClient('http://127.0.0.1:%d' % self.server.server_address[1], 'echo')
+        self.client.set_max_connection_count(4)
+        self.client.init()
+
+    def tearDown(self):
+        self.client.destroy()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_predict_serialize_once_on_retry(self):
+        class CountingRequest(StringRequest):
+            calls = 0
+
+            def to_string(self):
+                CountingRequest.calls += 1
+                return super(CountingRequest, self).to_string()
+
+        self.client.set_token('token')
+        self.client.set_retry_count(3)
+        ex = None
+        try:
+            self.client.predict(CountingRequest('unavailable'))
+        except PredictException as e:
+            ex = e
+        self.assertEqual(ex.code, 503)
+        self.assertEqual(CountingRequest.calls, 1)
+
+    def test_predict_raw_bytes(self):
+        import numpy as np
+        data = np.arange(16, dtype=np.float32)
+        self.client.set_token('token')
+        resp = self.client.predict(RawBytesRequest(data))
+        self.assertEqual(resp.response_data, data.tobytes())
+
+        payload = bytearray(b'raw payload')
+        self.assertTrue(self.client._request_body(RawBytesRequest(payload)) is payload)
+        body = self.client._request_body(RawBytesRequest(memoryview(data)))
+        self.assertEqual(len(body), data.nbytes)
+        resp = self.client.predict(RawBytesRequest(memoryview(payload)[4:]))
+        self.assertEqual(resp.response_data, b'payload')
+
+    def test_predict_headers(self):
+        self.client.set_token('token')
+        self.client.add_extra_headers({'X-Test': 'extra'})
+        self.client.set_content_type('application/json')
+        self.assertEqual(self.client.predict(StringRequest('header:X-Test')).response_data, b'extra')
+        self.assertEqual(self.client.predict(StringRequest('header:Content-Type')).response_data,
+                         b'application/json')
+        self.assertEqual(self.client.headers, {'X-Test': 'extra'})
+
+        requests = [StringRequest('header:Content-Length' + ' ' * (i % 5)) for i in range(40)]
+        results = self.client.predict_many(requests, concurrency=8)
+        for i, resp in enumerate(results):
+            self.assertEqual(resp.response_data, b'%d' % (21 + i % 5))
+
+    def test_predict_reports_to_balancer(self):
+        from .balancer import Balancer
+
+        class RecordingBalancer(Balancer):
+            def __init__(self):
+                super(RecordingBalancer, self).__init__()
+                self.events = []
+
+            def on_start(self, address):
+                self.events.append(('start', address))
+
+            def on_finish(self, address, latency, success):
+                self.events.append(('finish', address, success))
+
+        balancer = RecordingBalancer()
+        self.client.set_balancer(balancer)
+        self.client.set_retry_count(2)
+        self.client.init()
+        self.client.predict(StringRequest('ok'))
+        try:
+            self.client.predict(StringRequest('unavailable'))
+        except PredictException:
+            pass
+        domain = self.client.endpoint.get()
+        self.assertEqual(balancer.events, [('start', domain), ('finish', domain, True)] +
+                         [('start', domain), ('finish', domain, False)] * 2)
+
+    def test_direct_wait_ready(self):
+        client = PredictClient('127.0.0.1:%d' % self.server.server_address[1], 'echo')
+        client.set_endpoint_type(ENDPOINT_TYPE_DIRECT)
+        client.init(wait_ready=True, ready_timeout=5)
+        self.assertEqual(client.predict(StringRequest('direct')).response_data, b'direct')
+        client.destroy()
+
+        client = PredictClient('127.0.0.1:1', 'echo')
+        client.set_endpoint_type(ENDPOINT_TYPE_DIRECT)
+        with self.assertRaises(PredictException):
+            client.init(wait_ready=True, ready_timeout=0.2)
+        client.destroy()
+
+    def test_direct_shared_discovery(self):
+        clients = []
+        for i in range(3):
+            client = PredictClient('127.0.0.1:%d' % self.server.server_address[1], 'echo')
+            client.set_endpoint_type(ENDPOINT_TYPE_DIRECT)
+            client.init(wait_ready=True, ready_timeout=5)
+            clients.append(client)
+        self.assertEqual(self.server.discovery_requests, 1)
+        self.assertEqual(DiscoveryRegistry.instance().get_subscriber_count(clients[0].discovery_key), 3)
+        for client in clients:
+            self.assertEqual(client.predict(StringRequest('shared')).response_data, b'shared')
+            self.assertEqual(client.predict(StringRequest('keyed'), route_key='user-1').response_data, b'keyed')
+            client.destroy()
+        self.assertEqual(DiscoveryRegistry.instance().get_subscriber_count(clients[0].discovery_key), 0)
+
+    def test_warm_connections(self):
+        client = PredictClient('127.0.0.1:%d' % self.server.server_address[1], 'echo')
+        client.set_endpoint_type(ENDPOINT_TYPE_DIRECT)
+        client.init(warm_connections=3, warmup_request=StringRequest('warm'))
+        address = client.endpoint.get()
+        pool = client.connection_pool.connection_from_url(client._predict_url(address))
+        self.assertEqual(pool.num_connections, 3)
+        self.assertEqual(pool.pool.qsize(), client.max_connection_count)
+        self.assertEqual(self.server.posts, 3)
+        for i in range(5):
+            self.assertEqual(client.predict(StringRequest('after')).response_data, b'after')
+        self.assertEqual(pool.num_connections, 3)
+        stats = client.get_connection_stats()[address]
+        self.assertEqual(stats['created'], 3)
+        self.assertEqual(stats['reused'], 8)
+        client.destroy()
+
+        client = PredictClient('http://127.0.0.1:%d' % self.server.server_address[1], 'echo')
+        client.init(warm_connections=2)
+        pool = client.connection_pool.connection_from_url(client._predict_url(client.endpoint.get()))
+        self.assertEqual(pool.num_connections, 2)
+        client.destroy()
+
+    def test_warm_connections_many_backends(self):
+        from .endpoint import Endpoint
+        servers = []
+        for i in range(12):
+            server = ThreadingHTTPServer(('127.0.0.1', 0), LocalHandler)
+            server.daemon_threads = True
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+            servers.append(server)
+        client = PredictClient('http://127.0.0.1:%d' % self.server.server_address[1], 'echo')
+        try:
+            client.init()
+            client.endpoint = Endpoint(logger)
+            client.endpoint.set_endpoints([({'ip': '127.0.0.1', 'port': server.server_address[1]}, 1)
+                                           for server in servers])
+            client._warm_up(2)
+            for i in range(24):
+                self.assertEqual(client.predict(StringRequest('after')).response_data, b'after')
+            stats = client.get_connection_stats()
+            for server in servers:
+                address = '127.0.0.1:%d' % server.server_address[1]
+                self.assertEqual(stats[address]['created'], 2)
+                self.assertEqual(stats[address]['reused'], 2)
+        finally:
+            client.destroy()
+            for server in servers:
+                server.shutdown()
+                server.server_close()
+
+    def test_direct_endpoint_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            client = PredictClient('127.0.0.1:%d' % self.server.server_address[1], 'echo')
+            client.set_endpoint_type(ENDPOINT_TYPE_DIRECT)
+            client.set_endpoint_cache(cache_dir)
+            client.init(wait_ready=True, ready_timeout=5)
+            endpoints = client.endpoint.endpoints
+            client.destroy()
+
+            # the discovery server is unavailable, the cached backends are used
+            client = PredictClient('127.0.0.1:1', 'echo')
+            client.set_endpoint_type(ENDPOINT_TYPE_DIRECT)
+            client.set_endpoint_cache(cache_dir)
+            client.endpoint_cache.save(('DIRECT', '127.0.0.1:1', 'echo'), endpoints)
+            client.init(wait_ready=True, ready_timeout=0)
+            self.assertEqual(client.predict(StringRequest('cached')).response_data, b'cached')
+            client.destroy()
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_predict_many(self):
+        requests = [StringRequest('req-%d' % i) for i in range(50)]
+        requests[7] = StringRequest('fail')
+        results = self.client.predict_many(requests, concurrency=16)
+        self.assertEqual(len(results), 50)
+        self.assertTrue(isinstance(results[7], PredictException))
+        for i, resp in enumerate(results):
+            if i != 7:
+                self.assertEqual(resp.response_data, ('req-%d' % i).encode('utf-8'))
+
+    def test_predict_many_iter(self):
+        requests = (StringRequest('req-%d' % i) for i in range(20))
+        results = dict(self.client.predict_many_iter(requests, concurrency=3))
+        self.assertEqual(sorted(results.keys()), list(range(20)))
+        self.assertEqual(results[5].response_data, b'req-5')
+
+    def test_predict_async(self):
+        done = threading.Event()
+
+        def callback(future):
+            done.set()
+
+        future = self.client.predict_async(StringRequest('async'), callback=callback)
+        self.assertEqual(future.result(timeout=5).response_data, b'async')
+        self.assertTrue(done.wait(5))
+
+        future = self.client.predict_async(StringRequest('fail'))
+        self.assertTrue(isinstance(future.exception(timeout=5), PredictException))
+
+    def test_predict_async_after_destroy(self):
+        self.client.set_worker_count(2)
+        futures = [self.client.predict_async(StringRequest('req-%d' % i)) for i in range(8)]
+        self.client.destroy()
+        self.assertTrue(all(future.done() for future in futures))
+        with self.assertRaises(PredictException):
+            self.client.predict_async(StringRequest('late'))
+
+    def test_predict_async_executor_shut_down(self):
+        # destroy() may shut the executor down after predict_async() has taken it
+        executor = self.client._get_executor()
+        get_executor = self.client._get_executor
+
+        def racing_get_executor():
+            get_executor()
+            executor.shutdown(wait=True)
+            return executor
+        self.client._get_executor = racing_get_executor
+        with self.assertRaises(PredictException) as ctx:
+            self.client.predict_async(StringRequest('late'))
+        self.assertEqual(ctx.exception.code, 500)
+        with self.assertRaises(PredictException):
+            list(self.client.predict_many_iter([StringRequest('late')]))
+
+
+class HedgedPredictClientTestCase(unittest.TestCase):
+
+    def setUp(self):
+        from .endpoint import Endpoint
+        self.servers = []
+        for delay in (0.3, 0):
+            server = ThreadingHTTPServer(('127.0.0.1', 0), LocalHandler)
+            server.daemon_threads = True
+            server.delay = delay
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+            self.servers.append(server)
+        self.slow = '127.0.0.1:%d' % self.servers[0].server_address[1]
+        self.fast = '127.0.0.1:%d' % self.servers[1].server_address[1]
+
+        self.client = PredictClient('http://127.0.0.1', 'echo')
+        self.client.init()
+        self.client.endpoint = Endpoint(logger)
+        self.client.endpoint.set_endpoints([({'ip': '127.0.0.1', 'port': server.server_address[1]}, 1)
+                                            for server in self.servers])
+
+    def tearDown(self):
+        self.client.destroy()
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def test_hedged_request_wins(self):
+        self.client.set_hedging(delay=20, budget_percent=100)
+        for i in range(6):
+            start = time.time()
+            resp = self.client.predict(StringRequest('hedge-%d' % i))
+            self.assertEqual(resp.response_data, ('hedge-%d' % i).encode('utf-8'))
+            self.assertLess(time.time() - start, 0.25)
+        stats = self.client.get_hedging_stats()
+        self.assertEqual(stats['requests'], 6)
+        self.assertGreater(stats['hedges_issued'], 0)
+        self.assertEqual(stats['hedges_won'], stats['hedges_issued'])
+
+    def test_hedged_primary_sent_by_calling_thread(self):
+        self.client.set_hedging(delay=200, budget_percent=100)
+        body = b'hedge'
+        headers = self.client._request_headers(body)()
+        for i in range(5):
+            resp, address = self.client._send_hedged(self.fast, headers, body, set())
+            self.assertEqual(resp.data, body)
+            self.assertEqual(address, self.fast)
+        self.assertIsNone(self.client.hedging_executor)
+        self.assertEqual(self.client.get_hedging_stats()['hedges_issued'], 0)
+
+    def test_hedged_loser_aborted(self):
+        self.client.set_hedging(delay=20, budget_percent=100)
+        body = b'hedge'
+        headers = self.client._request_headers(body)()
+        start = time.time()
+        resp, address = self.client._send_hedged(self.slow, headers, body, set())
+        self.assertEqual(resp.data, body)
+        self.assertEqual(address, self.fast)
+        # the calling thread returns once the copy wins instead of waiting for the slow backend
+        self.assertLess(time.time() - start, 0.25)
+
+    def test_hedged_copy_skips_failed_backends(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), LocalHandler)
+        server.daemon_threads = True
+        server.delay = 0
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.servers.append(server)
+        spare = '127.0.0.1:%d' % server.server_address[1]
+        self.client.endpoint.set_endpoints([({'ip': '127.0.0.1', 'port': server.server_address[1]}, 1)
+                                            for server in self.servers])
+        self.client.set_hedging(delay=20, budget_percent=100)
+        body = b'hedge'
+        headers = self.client._request_headers(body)()
+        for i in range(5):
+            resp, address = self.client._send_hedged(self.slow, headers, body, set([self.fast]))
+            self.assertEqual(resp.data, body)
+            self.assertEqual(address, spare)
+
+    def test_hedged_primaries_not_queued(self):
+        self.client.set_max_connection_count(1)
+        self.client.set_hedging(delay=1000, budget_percent=0)
+        body = b'hedge'
+        headers = self.client._request_headers(body)()
+        start = time.time()
+        threads = [threading.Thread(target=self.client._send_hedged, args=(self.slow, headers, body, set()))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLess(time.time() - start, 1.0)
+        self.assertLess(max(self.client.hedging.latencies), 0.6)
+
+    def test_hedging_budget(self):
+        from .hedging import HedgingPolicy
+        policy = HedgingPolicy(delay=10, budget_percent=5)
+        issued = 0
+        for i in range(1000):
+            policy.on_request()
+            if policy.acquire():
+                issued += 1
+        self.assertEqual(issued, 50)
+        self.assertEqual(policy.get_stats()['hedges_issued'], 50)
+
+    def test_hedging_percentile_delay(self):
+        from .hedging import HedgingPolicy
+        policy = HedgingPolicy(percentile=95, min_samples=100)
+        for i in range(99):
+            policy.record(i / 1000.0)
+        self.assertEqual(policy.get_delay(), None)
+        policy.record(0.099)
+        self.assertAlmostEqual(policy.get_delay(), 0.095)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import logging
+import time
+import unittest
+
+from .balancer import P2CBalancer
+from .endpoint import Endpoint
+from .endpoint import MAX_SCHEDULE_SIZE
+from .slow_start import SlowStart
+from .slow_start import SLOW_START_EXPONENTIAL
+
+logger = logging.getLogger(__name__)
+
+
+def make_endpoints(weights):
+    return [({'ip': '10.0.0.%d' % i, 'port': 8080}, w) for i, w in enumerate(weights)]
+
+
+class SlowStartTestCase(unittest.TestCase):
+
+    def test_linear_steps(self):
+        slow_start = SlowStart(window=100, min_weight_percent=10, steps=10)
+        self.assertEqual(slow_start.get_step(0), 1)
+        self.assertEqual(slow_start.get_step(50), 5)
+        self.assertEqual(slow_start.get_step(99), 9)
+        self.assertEqual(slow_start.get_step(100), 10)
+
+    def test_exponential_steps(self):
+        slow_start = SlowStart(window=100, curve=SLOW_START_EXPONENTIAL, min_weight_percent=10, steps=10)
+        self.assertEqual(slow_start.get_step(0), 1)
+        self.assertEqual(slow_start.get_step(50), 3)
+        self.assertEqual(slow_start.get_step(100), 10)
+        with self.assertRaises(ValueError):
+            SlowStart(curve='quadratic')
+
+    def test_endpoint_ramp(self):
+        endpoint = Endpoint(logger)
+        endpoint.set_slow_start(SlowStart(window=60))
+        endpoint.set_endpoints(make_endpoints([1, 1]))
+        self.assertEqual(endpoint.added, {})
+        self.assertEqual(endpoint.snapshot.weights, (('10.0.0.0:8080', 1), ('10.0.0.1:8080', 1)))
+
+        endpoint.set_endpoints(make_endpoints([1, 1, 1]))
+        counter = collections.Counter(endpoint.get() for i in range(210))
+        self.assertEqual(counter['10.0.0.2:8080'], 10)
+        self.assertEqual(endpoint.endpoints, make_endpoints([1, 1, 1]))
+        self.assertTrue(endpoint.ramp_timer is not None)
+        endpoint.ramp_timer.cancel()
+
+        endpoint.added['10.0.0.2:8080'] -= 30
+        endpoint._ramp()
+        self.assertEqual(dict(endpoint.snapshot.weights)['10.0.0.2:8080'], 5)
+        endpoint.added['10.0.0.2:8080'] -= 30
+        endpoint._ramp()
+        self.assertEqual(endpoint.added, {})
+        self.assertEqual(endpoint.snapshot.weights, tuple(('10.0.0.%d:8080' % i, 1) for i in range(3)))
+        self.assertTrue(endpoint.ramp_timer is None)
+
+    def test_ramp_schedule_bounded(self):
+        weights = [20 + i % 31 for i in range(200)]
+        endpoint = Endpoint(logger)
+        endpoint.set_slow_start(SlowStart(window=60))
+        endpoint.set_endpoints(make_endpoints(weights[:-1]))
+        endpoint.set_endpoints(make_endpoints(weights))
+        endpoint.close()
+        self.assertTrue(endpoint.ramp_timer is None)
+        # the weights are not scaled up, since the new backend is able to express the steps by itself
+        self.assertEqual(len(endpoint.snapshot.schedule), sum(weights[:-1]) + 3)
+        self.assertEqual(dict(endpoint.snapshot.weights)['10.0.0.199:8080'], 3)
+
+        endpoint = Endpoint(logger)
+        endpoint.set_slow_start(SlowStart(window=60))
+        endpoint.set_endpoints(make_endpoints(weights[:-1]))
+        endpoint.set_endpoints(make_endpoints(weights[:-1] + [1]))
+        endpoint.close()
+        self.assertTrue(len(endpoint.snapshot.schedule) <= MAX_SCHEDULE_SIZE + len(weights))
+
+        # a service whose unscaled schedule is already beyond the bound
+        weights = [100 + i % 97 for i in range(200)]
+        endpoint = Endpoint(logger)
+        endpoint.set_slow_start(SlowStart(window=60))
+        endpoint.set_endpoints(make_endpoints(weights[:-1]))
+        endpoint.set_endpoints(make_endpoints(weights))
+        endpoint.close()
+        self.assertTrue(sum(weights) > MAX_SCHEDULE_SIZE)
+        self.assertTrue(len(endpoint.snapshot.schedule) <= MAX_SCHEDULE_SIZE + len(weights))
+        counter = collections.Counter(endpoint.snapshot.schedule)
+        self.assertTrue(0 < counter['10.0.0.199:8080'] < counter['10.0.0.198:8080'] / 5, counter)
+
+    def test_ramp_with_balancer(self):
+        endpoint = Endpoint(logger)
+        endpoint.set_balancer(P2CBalancer())
+        endpoint.set_slow_start(SlowStart(window=0.2, steps=4))
+        endpoint.set_endpoints(make_endpoints([2]))
+        endpoint.set_endpoints(make_endpoints([2, 2]))
+        self.assertEqual(endpoint.snapshot.weights, (('10.0.0.0:8080', 4), ('10.0.0.1:8080', 1)))
+        deadline = time.time() + 5
+        while endpoint.added and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(endpoint.snapshot.weights, (('10.0.0.0:8080', 2), ('10.0.0.1:8080', 2)))
+        self.assertEqual(endpoint.balancer.snapshot, endpoint.snapshot)
+
+
+if __name__ == '__main__':
+    unittest.main()
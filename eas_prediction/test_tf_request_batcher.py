@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+
+from .tf_request import TFRequest
+from .tf_request import TFResponse
+from .tf_request_batcher import TFRequestBatcher
+from .exception import PredictException
+
+
+class DoubleClient(object):
+    """
+    Fake client which returns the input tensor 'x' multiplied by 2 as output 'y'
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.batch_sizes = []
+
+    def predict(self, req):
+        x = req.request_data.inputs['x']
+        if x.float_val[0] < 0:
+            raise PredictException(400, 'negative input')
+        with self.lock:
+            self.batch_sizes.append(x.array_shape.dim[0])
+        resp = TFResponse(b'')
+        y = resp.response.outputs['y']
+        y.dtype = TFRequest.DT_FLOAT
+        y.array_shape.dim.extend(x.array_shape.dim)
+        y.float_val.extend([v * 2 for v in x.float_val])
+        version = resp.response.outputs['version']
+        version.dtype = TFRequest.DT_INT32
+        version.int_val.append(1)
+        return resp
+
+
+def make_request(value, rows=1):
+    req = TFRequest('serving_default')
+    req.add_feed('x', [rows, 2], TFRequest.DT_FLOAT, [value, value + 0.5] * rows)
+    req.add_fetch('y')
+    return req
+
+
+class TFRequestBatcherTestCase(unittest.TestCase):
+
+    def _run_concurrently(self, batcher, requests):
+        results = [None] * len(requests)
+        barrier = threading.Barrier(len(requests))
+
+        def run(idx):
+            barrier.wait()
+            try:
+                results[idx] = batcher.predict(requests[idx])
+            except Exception as e:
+                results[idx] = e
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(requests))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_batch_and_split(self):
+        client = DoubleClient()
+        batcher = TFRequestBatcher(client, max_batch_size=8, max_wait_us=200000)
+        requests = [make_request(float(i)) for i in range(16)]
+        results = self._run_concurrently(batcher, requests)
+
+        for i, resp in enumerate(results):
+            self.assertEqual(resp.get_tensor_shape('y'), [1, 2])
+            self.assertEqual(list(resp.get_values('y')), [i * 2.0, i * 2.0 + 1.0])
+            self.assertEqual(list(resp.get_values('version')), [1])
+        self.assertTrue(all(size <= 8 for size in client.batch_sizes))
+        stats = batcher.get_stats()
+        self.assertEqual(stats['request_count'], 16)
+        self.assertTrue(stats['average_batch_size'] > 1)
+        self.assertEqual(stats['max_batch_size'], 8)
+
+    def test_multi_row_requests(self):
+        batcher = TFRequestBatcher(DoubleClient(), max_batch_size=8, max_wait_us=200000)
+        results = self._run_concurrently(batcher, [make_request(1.0, 3), make_request(2.0, 2)])
+        self.assertEqual(results[0].get_tensor_shape('y'), [3, 2])
+        self.assertEqual(list(results[0].get_values('y')), [2.0, 3.0] * 3)
+        self.assertEqual(list(results[1].get_values('y')), [4.0, 5.0] * 2)
+
+    def test_single_request_not_delayed_beyond_window(self):
+        client = DoubleClient()
+        batcher = TFRequestBatcher(client, max_batch_size=32, max_wait_us=1000)
+        resp = batcher.predict(make_request(3.0))
+        self.assertEqual(list(resp.get_values('y')), [6.0, 7.0])
+        self.assertEqual(client.batch_sizes, [1])
+
+    def test_error_propagated_to_batch(self):
+        batcher = TFRequestBatcher(DoubleClient(), max_batch_size=2, max_wait_us=200000)
+        results = self._run_concurrently(batcher, [make_request(-1.0), make_request(-2.0)])
+        self.assertTrue(all(isinstance(r, PredictException) for r in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import socket
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from .exception import PredictException
+from .vipserver_endpoint import VipServerEndpoint
+
+logger = logging.getLogger(__name__)
+
+
+class StubVipServerHandler(BaseHTTPRequestHandler):
+    """
+    Stub of the vipserver server list and the domain query api
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        if self.path == '/vipserver/serverlist':
+            server.serverlist_requests += 1
+            status = 200 if server.servers is not None else 503
+            body = '\n'.join(server.servers or []).encode('utf-8')
+        elif self.path.startswith('/vipserver/api/srvIPXT'):
+            server.query_requests += 1
+            status = 200 if server.healthy else 500
+            body = json.dumps({'hosts': [
+                {'ip': '10.0.0.1', 'port': 80, 'weight': 1, 'valid': True},
+                {'ip': '10.0.0.2', 'port': 80, 'weight': 1, 'valid': False},
+            ]}).encode('utf-8')
+        else:
+            status = 404
+            body = b''
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class VipServerEndpointTestCase(unittest.TestCase):
+
+    def _start_server(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubVipServerHandler)
+        server.daemon_threads = True
+        server.servers = None
+        server.healthy = True
+        server.serverlist_requests = 0
+        server.query_requests = 0
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.servers.append(server)
+        return server
+
+    def setUp(self):
+        self.servers = []
+        self.first = self._start_server()
+        self.second = self._start_server()
+        addresses = ['127.0.0.1:%d' % s.server_address[1] for s in self.servers]
+        self.first.servers = addresses
+        self.endpoint = VipServerEndpoint('echo.vipserver', logger,
+                                          'http://%s/vipserver/serverlist' % addresses[0], serverlist_ttl=60)
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def test_cached_serverlist(self):
+        for i in range(5):
+            self.endpoint.sync()
+        self.assertEqual(self.first.serverlist_requests, 1)
+        self.assertEqual(self.first.query_requests + self.second.query_requests, 5)
+        self.assertEqual(self.endpoint.endpoints, [({'ip': '10.0.0.1', 'port': 80}, 1)])
+
+        # the expired server list is still used when the server list url is unavailable
+        self.first.servers = None
+        self.assertEqual(len(self.endpoint.get_servers(now=self.endpoint.servers_expire)), 2)
+
+    def test_failover(self):
+        self.endpoint.sync()
+        stuck = self.endpoint.server
+        for i in range(3):
+            self.endpoint.sync()
+            self.assertEqual(self.endpoint.server, stuck)
+
+        failing = self.first if stuck.endswith(':%d' % self.first.server_address[1]) else self.second
+        failing.healthy = False
+        self.assertEqual(self.endpoint.fetch(), [({'ip': '10.0.0.1', 'port': 80}, 1)])
+        self.assertNotEqual(self.endpoint.server, stuck)
+
+        self.first.healthy = False
+        self.second.healthy = False
+        self.assertEqual(self.endpoint.fetch(), None)
+        self.assertEqual(self.endpoint.servers_expire, 0)
+
+    def test_serverlist_unavailable(self):
+        self.first.servers = None
+        with self.assertRaises(PredictException):
+            self.endpoint.sync()
+
+    def test_timeout(self):
+        # the server accepts the connections but never answers
+        hung = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        hung.bind(('127.0.0.1', 0))
+        hung.listen(8)
+        try:
+            address = '127.0.0.1:%d' % hung.getsockname()[1]
+            endpoint = VipServerEndpoint('echo.vipserver', logger, 'http://%s/vipserver/serverlist' % address,
+                                         timeout=0.2)
+            start = time.time()
+            with self.assertRaises(PredictException):
+                endpoint.get_servers()
+            self.assertEqual(endpoint.query(address), None)
+            self.assertLess(time.time() - start, 2)
+        finally:
+            hung.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import functools
+import math
+import random
+import unittest
+
+from .weighted_round_robin import WRRScheduler
+from .weighted_round_robin import smooth_wrr_table
+
+
+def random_dataset(rnd):
+    size = rnd.randint(1, 20)
+    return [('backend-%d' % i, rnd.choice([1, 2, 3, 10, 50, 100, rnd.randint(1, 100)])) for i in range(size)]
+
+
+class WRRSchedulerTestCase(unittest.TestCase):
+    """
+    Property tests of the smooth weighted round robin schedule over random weights
+    """
+
+    def setUp(self):
+        self.rnd = random.Random(20240101)
+
+    def test_cycle_distribution(self):
+        for _ in range(200):
+            data = random_dataset(self.rnd)
+            gcd = functools.reduce(math.gcd, [w for _, w in data])
+            cycle = sum(w for _, w in data) // gcd
+            scheduler = WRRScheduler(data)
+            for rounds in (1, 3):
+                picks = [scheduler.schedule() for i in range(cycle * rounds)]
+                counter = collections.Counter(item[0] for item in picks)
+                for name, weight in data:
+                    self.assertEqual(counter[name], weight // gcd * rounds)
+
+    def test_smooth_interleaving(self):
+        for _ in range(200):
+            data = random_dataset(self.rnd)
+            total = sum(w for _, w in data)
+            scheduler = WRRScheduler(data)
+            counter = collections.Counter()
+            for k in range(1, total + 1):
+                counter[scheduler.schedule()[0]] += 1
+                for name, weight in data:
+                    # every prefix of the schedule stays close to the weighted share
+                    self.assertLessEqual(abs(counter[name] - float(k) * weight / total), len(data) - 1 + 1e-9)
+
+    def test_skewed_weights_are_interleaved(self):
+        scheduler = WRRScheduler([('a', 100), ('b', 1), ('c', 1)])
+        picks = [item[0] for item in scheduler.get_next(102)]
+        self.assertEqual(picks.count('b'), 1)
+        self.assertEqual(picks.count('c'), 1)
+        scheduler = WRRScheduler([('a', 2), ('b', 1)])
+        self.assertEqual([item[0] for item in scheduler.get_next(6)], ['a', 'b', 'a', 'a', 'b', 'a'])
+
+    def test_get_next_matches_schedule(self):
+        for _ in range(100):
+            data = random_dataset(self.rnd)
+            first = WRRScheduler(data)
+            second = WRRScheduler(data)
+            for _ in range(5):
+                n = self.rnd.randint(2, 500)
+                self.assertEqual(first.get_next(n), [second.schedule() for i in range(n)])
+                self.assertEqual(first.get_next(), second.schedule())
+
+    def test_set_data_resets_order(self):
+        data = random_dataset(self.rnd)
+        scheduler = WRRScheduler(data)
+        expected = scheduler.get_next(10)
+        scheduler.get_next(7)
+        scheduler.set_data(data)
+        self.assertEqual(scheduler.get_next(10), expected)
+
+    def test_large_table(self):
+        # large tables are built by stride scheduling, with the same counts and a bounded deviation
+        data = [('backend-%d' % i, self.rnd.randint(1, 100)) for i in range(200)]
+        gcd = functools.reduce(math.gcd, [w for _, w in data])
+        total = sum(w for _, w in data) // gcd
+        table = smooth_wrr_table(data)
+        self.assertEqual(len(table), total)
+        counter = collections.Counter()
+        for k, item in enumerate(table):
+            counter[item[0]] += 1
+            if k % 97 == 0:
+                for name, weight in data:
+                    self.assertLessEqual(abs(counter[name] - float(k + 1) * weight / gcd / total), 2)
+        for name, weight in data:
+            self.assertEqual(counter[name], weight // gcd)
+
+    def test_max_size(self):
+        data = [('backend-%d' % i, self.rnd.randint(1, 1000)) for i in range(300)]
+        table = smooth_wrr_table(data, max_size=3000)
+        self.assertLessEqual(len(table), 3000 + len(data))
+        counter = collections.Counter(item[0] for item in table)
+        self.assertEqual(len(counter), len(data))
+        total = sum(w for _, w in data)
+        for name, weight in data:
+            self.assertLess(abs(counter[name] - 3000.0 * weight / total), 1)
+        self.assertEqual(smooth_wrr_table([('a', 3), ('b', 1)], max_size=100), smooth_wrr_table([('a', 3), ('b', 1)]))
+
+    def test_empty_and_zero_weights(self):
+        self.assertEqual(WRRScheduler([]).get_next(), None)
+        self.assertEqual(WRRScheduler([('a', 0)]).get_next(3), [None, None, None])
+        scheduler = WRRScheduler([('a', 0), ('b', 2)])
+        self.assertEqual(set(item[0] for item in scheduler.get_next(5)), {'b'})
+
+
+if __name__ == '__main__':
+    unittest.main()
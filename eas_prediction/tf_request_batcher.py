@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+
+from .tf_request import TFRequest
+from .tf_request import TFResponse
+
+VALUE_FIELDS = ('float_val', 'double_val', 'int_val', 'int64_val', 'bool_val', 'string_val')
+
+
+class TFBatch(object):
+    def __init__(self):
+        self.requests = []
+        self.row_counts = []
+        self.rows = 0
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.responses = None
+        self.error = None
+
+
+class TFRequestBatcher(object):
+    """
+    Batching layer in front of PredictClient.predict() for tensorflow services, concurrent
+    TFRequests with the same signature, fetches and input tensor types are collected within
+    a time window, concatenated along the first dimension and sent as one request, the
+    outputs of the batched response are then split back to the waiting callers.
+    """
+
+    def __init__(self, client, max_batch_size=32, max_wait_us=1000):
+        """
+        :param client: initialized PredictClient used to send the batched requests
+        :param max_batch_size: max total rows, i.e. sum of the first dimension, of one batch
+        :param max_wait_us: max time in microseconds a request waits for the batch to be filled
+        """
+        self.client = client
+        self.max_batch_size = max_batch_size
+        self.max_wait_us = max_wait_us
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.batch_count = 0
+        self.request_count = 0
+        self.max_achieved_batch_size = 0
+
+    def set_max_batch_size(self, max_batch_size):
+        """
+        Set the max total rows of one batch
+        :param max_batch_size: max batch size
+        """
+        self.max_batch_size = max_batch_size
+
+    def set_max_wait_us(self, max_wait_us):
+        """
+        Set the max time a request waits for the batch to be filled
+        :param max_wait_us: max wait time in microseconds
+        """
+        self.max_wait_us = max_wait_us
+
+    def get_stats(self):
+        """
+        Get the batching statistics
+        :return: dict of the count of sent batches and batched requests, and the achieved batch sizes
+        """
+        with self.lock:
+            batch_count = self.batch_count
+            request_count = self.request_count
+            max_batch_size = self.max_achieved_batch_size
+        return {
+            'batch_count': batch_count,
+            'request_count': request_count,
+            'average_batch_size': float(request_count) / batch_count if batch_count > 0 else 0.0,
+            'max_batch_size': max_batch_size,
+        }
+
+    @staticmethod
+    def _batch_key(request_data):
+        rows = None
+        inputs = []
+        for name in sorted(request_data.inputs):
+            tensor = request_data.inputs[name]
+            dims = list(tensor.array_shape.dim)
+            if len(dims) == 0 or (rows is not None and dims[0] != rows):
+                return None, 0
+            rows = dims[0]
+            inputs.append((name, tensor.dtype, tuple(dims[1:])))
+        if rows is None or rows <= 0:
+            return None, 0
+        return (request_data.signature_name, tuple(request_data.output_filter), tuple(inputs)), rows
+
+    def predict(self, req):
+        """
+        Perform the prediction request, the request may be sent together with other
+        concurrent requests in one batch
+        :param req: TFRequest object
+        :return: TFResponse object containing the outputs related to the input request
+        """
+        key, rows = self._batch_key(req.request_data)
+        if key is None or rows >= self.max_batch_size:
+            return self.client.predict(req)
+
+        leader = False
+        with self.lock:
+            batch = self.pending.get(key)
+            if batch is None or batch.rows + rows > self.max_batch_size:
+                if batch is not None:
+                    batch.full.set()
+                batch = TFBatch()
+                self.pending[key] = batch
+                leader = True
+            index = len(batch.requests)
+            batch.requests.append(req)
+            batch.row_counts.append(rows)
+            batch.rows += rows
+            if batch.rows >= self.max_batch_size:
+                del self.pending[key]
+                batch.full.set()
+
+        if not leader:
+            batch.done.wait()
+        else:
+            batch.full.wait(self.max_wait_us / 1000000.0)
+            with self.lock:
+                if self.pending.get(key) is batch:
+                    del self.pending[key]
+            try:
+                batch.responses = self._send(batch)
+            except Exception as e:
+                batch.error = e
+            batch.done.set()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.responses[index]
+
+    def _send(self, batch):
+        with self.lock:
+            self.batch_count += 1
+            self.request_count += len(batch.requests)
+            self.max_achieved_batch_size = max(self.max_achieved_batch_size, batch.rows)
+
+        if len(batch.requests) == 1:
+            return [self.client.predict(batch.requests[0])]
+
+        first = batch.requests[0].request_data
+        batch_req = TFRequest(first.signature_name)
+        merged = batch_req.request_data
+        merged.signature_name = first.signature_name
+        merged.output_filter.extend(first.output_filter)
+        for name in first.inputs:
+            tensor = merged.inputs[name]
+            for req in batch.requests:
+                tensor.MergeFrom(req.request_data.inputs[name])
+            dims = list(first.inputs[name].array_shape.dim)
+            del tensor.array_shape.dim[:]
+            tensor.array_shape.dim.extend([batch.rows] + dims[1:])
+
+        resp = self.client.predict(batch_req)
+        return self._split(resp.response, batch)
+
+    @staticmethod
+    def _split(response, batch):
+        responses = [TFResponse(b'') for _ in batch.requests]
+
+        for name, output in response.outputs.items():
+            dims = list(output.array_shape.dim)
+            if len(dims) == 0 or dims[0] != batch.rows:
+                # output not related to the batch dimension, every caller gets a copy
+                for resp in responses:
+                    resp.response.outputs[name].CopyFrom(output)
+                continue
+
+            row_size = 1
+            for dim in dims[1:]:
+                row_size *= dim
+            fields = [field for field in VALUE_FIELDS if len(getattr(output, field)) > 0]
+            offset = 0
+            for rows, resp in zip(batch.row_counts, responses):
+                sub = resp.response.outputs[name]
+                sub.dtype = output.dtype
+                sub.array_shape.dim.extend([rows] + dims[1:])
+                for field in fields:
+                    getattr(sub, field).extend(getattr(output, field)[offset * row_size:(offset + rows) * row_size])
+                offset += rows
+        return responses
@@ -2,42 +2,79 @@
 # -*- coding: utf-8 -*-
 
 from .endpoint import Endpoint
+from .endpoint import endpoint_host
 from .exception import PredictException
 import urllib3
 import random
 import json
+import time
 import re
 
+VIPSERVER_SERVERLIST_URL = 'http://jmenv.tbsite.net:8080/vipserver/serverlist'
+
 
 class VipServerEndpoint(Endpoint):
-    def __init__(self, domain, logger):
+    """
+    Endpoint discovering the backends from vipserver, the list of the vipserver servers
+    is cached for 'serverlist_ttl' seconds, and the server answering the last query is
+    used until it fails, then the other cached servers are tried in turn.
+    """
+
+    def __init__(self, domain, logger, serverlist_url=VIPSERVER_SERVERLIST_URL, serverlist_ttl=300, timeout=3.0):
         super(VipServerEndpoint, self).__init__(logger)
         self.domain = domain
+        self.serverlist_url = serverlist_url
+        self.serverlist_ttl = serverlist_ttl
+        # a server which does not answer must not stall the discovery thread shared by the clients
+        self.timeout = timeout
+        self.servers = []
+        self.servers_expire = 0
+        self.server = None
         self.http = urllib3.PoolManager()
         self.logger = logger
 
-    def get_server(self):
-        vipserver_endpoint = 'http://jmenv.tbsite.net:8080/vipserver/serverlist'
+    def get_servers(self, now=None):
+        """
+        Get the vipserver servers, the list is fetched from the server list url when the cached
+        one expires, and the expired list is still used if the server list url is unavailable
+        :return: list of the server addresses in format of 'ip' or 'ip:port'
+        """
+        if now is None:
+            now = time.time()
+        if len(self.servers) > 0 and now < self.servers_expire:
+            return self.servers
         try:
-            resp = self.http.request('GET', vipserver_endpoint)
+            resp = self.http.request('GET', self.serverlist_url, timeout=self.timeout, retries=1)
             if resp.status != 200:
                 raise PredictException(resp.status, resp.data)
-            servers = str(resp.data)
-            server_list = re.split('([0-9]+\.[0-9]+\.[0-9]+\.[0-9]+)', servers)
-            server_list = [x for x in server_list if re.match('[0-9]+\.[0-9]+\.[0-9]+\.[0-9]+', x) is not None ]
+            servers = resp.data.decode('utf-8') if isinstance(resp.data, bytes) else str(resp.data)
+            server_list = re.findall(r'[0-9]+\.[0-9]+\.[0-9]+\.[0-9]+(?::[0-9]+)?', servers)
+            if len(server_list) == 0:
+                raise PredictException(500, 'No vipserver server found in: %s' % servers)
         except Exception as e:
+            if len(self.servers) > 0:
+                self.logger.error('Failed to refresh vipserver server list, use the cached one: %s' % str(e))
+                return self.servers
             raise PredictException(500, str(e))
-        return server_list[random.randint(0, len(server_list) - 1)]
+        self.servers = server_list
+        self.servers_expire = now + self.serverlist_ttl
+        if self.server not in server_list:
+            self.server = server_list[random.randint(0, len(server_list) - 1)]
+        return self.servers
 
-    def sync(self):
-        server = self.get_server()
+    def get_server(self):
+        self.get_servers()
+        return self.server
+
+    def query(self, server):
         url = 'http://%s/vipserver/api/srvIPXT?dom=%s&clusters=DEFAULT' % (server, self.domain)
         endpoints = []
         try:
-            resp = self.http.request('GET', url)
+            # the other servers are tried by fetch() if the query fails, so it is not retried here
+            resp = self.http.request('GET', url, timeout=self.timeout, retries=False)
             if resp.status != 200:
                 self.logger.error('sync service endpoints error: %s, %s' % (resp.status, resp.data))
-                return
+                return None
 
             if isinstance(resp.data, bytes):
                 result = json.loads(resp.data.decode('utf-8'))
@@ -46,13 +83,25 @@ class VipServerEndpoint(Endpoint):
             hosts = result['hosts']
             for host in hosts:
                 if host['valid']:
-                    endpoints.append(({
-                        'ip': host['ip'],
-                        'port': host['port'],
-                    }, host['weight']))
+                    endpoints.append((endpoint_host(host), host['weight']))
             self.logger.debug(endpoints)
-            self.set_endpoints(endpoints)
+            return endpoints
         except urllib3.exceptions.HTTPError as e:
             self.logger.error('sync service endpoints http error, [%s]: %s' % (url, str(e)))
         except Exception as e:
             self.logger.error('sync service endpoints unknown error, [%s]: %s' % (url, str(e)))
+        return None
+
+    def fetch(self):
+        servers = self.get_servers()
+        # stick to the server answering the last query, fail over to the others in turn
+        start = servers.index(self.server) if self.server in servers else 0
+        for i in range(len(servers)):
+            server = servers[(start + i) % len(servers)]
+            endpoints = self.query(server)
+            if endpoints is not None:
+                self.server = server
+                return endpoints
+        # none of the cached servers works, refresh the server list on the next sync
+        self.servers_expire = 0
+        return None
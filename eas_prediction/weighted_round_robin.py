@@ -4,60 +4,121 @@
 ########
 
 import sys
+import heapq
 import math
 import fractions
 import functools
 
 
+# max value of the table size times the item count, beyond which the table is built by
+# stride scheduling in O(size * log(count)) rather than the O(size * count) smooth loop
+MAX_SMOOTH_COST = 200000
+
+
+def smooth_wrr_table(s, max_size=None):
+    """
+    Build one full cycle of the smooth weighted round robin schedule (the interleaving
+    used by nginx), every item appears weight / gcd(weights) times in the cycle, and is
+    spread as evenly as possible instead of being picked in runs
+    :param s: list of (data, weight) tuples, items with non-positive weight are ignored
+    :param max_size: optional max size of the cycle, the weights are quantized to fit it if the
+                     cycle is larger, every item keeps at least one entry
+    :return: tuple of the scheduled (data, weight) tuples
+    """
+    items = [x for x in s if x[1] > 0]
+    if len(items) == 0:
+        return ()
+    weights = _reduce([weight for data, weight in items])
+    total = sum(weights)
+    if max_size is not None and total > max_size:
+        weights = _reduce([max(int(round(float(weight) * max_size / total)), 1) for weight in weights])
+        total = sum(weights)
+    if total * len(items) > MAX_SMOOTH_COST:
+        return _stride_table(items, weights, total)
+    current = [0] * len(items)
+    indexes = range(len(items))
+    table = []
+    for _ in range(total):
+        best = 0
+        for idx in indexes:
+            current[idx] += weights[idx]
+            if current[idx] > current[best]:
+                best = idx
+        current[best] -= total
+        table.append(items[best])
+    return tuple(table)
+
+
+def _reduce(weights):
+    if sys.version_info[0] < 3:
+        gcd_s = functools.reduce(fractions.gcd, weights)
+    else:
+        gcd_s = functools.reduce(math.gcd, weights)
+    return [weight // gcd_s for weight in weights]
+
+
+def _stride_table(items, weights, total):
+    # the k-th entry of an item is due at (k + 0.5) / weight of the cycle, and the entries
+    # are taken in the order they are due, which spreads every item evenly over the cycle
+    heap = [(0.5 / weight, idx) for idx, weight in enumerate(weights)]
+    heapq.heapify(heap)
+    counts = [0] * len(items)
+    table = []
+    for _ in range(total):
+        due, idx = heapq.heappop(heap)
+        table.append(items[idx])
+        counts[idx] += 1
+        if counts[idx] < weights[idx]:
+            heapq.heappush(heap, ((counts[idx] + 0.5) / weights[idx], idx))
+    return tuple(table)
+
+
 class WRRScheduler:
-    cw = 0
-    i = -1
-    data_set = []
-    max_s = None
-    gcd_s = None
-    len_s = None
+    """
+    Weighted round robin scheduler, the schedule of a full cycle is precomputed in
+    set_data(), so picking the next item takes constant time.
+    """
 
     def __init__(self, s=None):
+        self.i = -1
+        self.data_set = []
+        self.table = ()
         self._init_dataset(s)
 
     def _init_dataset(self, s):
         self.data_set = s
         if s is None or len(s) == 0:
+            self.table = ()
             return
-        self.max_s = max(s, key=lambda x: x[1])[1]
-        if sys.version_info[0] < 3:
-            self.gcd_s = functools.reduce(fractions.gcd, [weight for data, weight in s])
-        else:
-            self.gcd_s = functools.reduce(math.gcd, [weight for data, weight in s])
-        self.len_s = len(s)
+        self.table = smooth_wrr_table(s)
 
     def schedule(self):
-        if self.data_set is None or len(self.data_set) == 0:
+        if len(self.table) == 0:
             return None
-        while True:
-            self.i = (self.i + 1) % self.len_s
-            if self.i == 0:
-                self.cw = self.cw - self.gcd_s
-                if self.cw <= 0:
-                    self.cw = self.max_s
-                    if self.cw == 0:
-                        return None
-            if self.data_set[self.i][1] >= self.cw:
-                return self.data_set[self.i]
+        self.i = (self.i + 1) % len(self.table)
+        return self.table[self.i]
 
     def set_data(self, s):
         self.reset()
         self._init_dataset(s)
 
     def reset(self):
-        self.cw = 0
         self.i = -1
         self.data_set = []
-        self.max_s = None
-        self.gcd_s = None
-        self.len_s = None
+        self.table = ()
 
     def get_next(self, n=1):
         if n > 1:
-            return [self.schedule() for i in range(0, n)]
+            length = len(self.table)
+            if length == 0:
+                return [None] * n
+            start = (self.i + 1) % length
+            end = start + n
+            self.i = (end - 1) % length
+            if end <= length:
+                return list(self.table[start:end])
+            result = list(self.table[start:])
+            result.extend(self.table * ((end - length) // length))
+            result.extend(self.table[:(end - length) % length])
+            return result
         return self.schedule()